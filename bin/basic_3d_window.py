@@ -29,7 +29,7 @@ class Window(game_core.AbstractWindow):
                 'camera_to_clip_matrix',
                 1,
                 GL.GL_FALSE,
-                self.camera.projection_matrix.tolist(),
+                self.camera.projection_matrix.as_float32(),
             )
 
             inverse_camera_matrix = self.camera.matrix.inverse()
@@ -37,7 +37,7 @@ class Window(game_core.AbstractWindow):
                 'world_to_camera_matrix',
                 1,
                 GL.GL_FALSE,
-                inverse_camera_matrix.tolist()
+                inverse_camera_matrix.as_float32()
             )
 
     def integrate(self, t, delta_time):
@@ -118,7 +118,7 @@ class Window(game_core.AbstractWindow):
                         shader.uniforms['modelToWorldMatrix'],
                         1,
                         GL.GL_FALSE,
-                        model_mat.tolist()
+                        model_mat.as_float32()
                     )
             if 'dirToLight' in shader.uniforms:
                 with shader:
@@ -146,7 +146,7 @@ class Window(game_core.AbstractWindow):
 
     def _set_perspective_matrix(self):
         # TODO: move this to camera's reshape
-        projection_matrix = self.camera.projection_matrix.tolist()
+        projection_matrix = self.camera.projection_matrix.as_float32()
         for name, shader in self.shaders.iteritems():
             if 'cameraToClipMatrix' in shader.uniforms:
                 with shader:
@@ -214,7 +214,7 @@ class Window(game_core.AbstractWindow):
         self.camera.integrate(t, delta_time, self)
 
         # TODO: move this to camera's integrate
-        i_cam_mat = self.camera.matrix.inverse().tolist()
+        i_cam_mat = self.camera.matrix.inverse().as_float32()
         camera_world_position = list(self.camera._pos)
         for shader in self.shaders.itervalues():
             if 'worldToCameraMatrix' in shader.uniforms:
@@ -244,6 +244,8 @@ class Window(game_core.AbstractWindow):
 
 
 class LodTestItem(game_core.TreeNode):
+    __slots__ = ()
+
     def get_item_value(self):
         return self.get_value()[0]
 
@@ -306,12 +308,12 @@ class LodTestTree(game_core.Octree):
     def _get_default_node_data(self):
         return [None, None]
 
-    def _create_node_proxy(self, data, parent=None, index=0):
+    def _create_node_proxy(self, data, parent=None, index=0, code=None):
         """
         Returns:
             TreeNode
         """
-        return LodTestItem(data, tree=self, parent=parent, index=index)
+        return LodTestItem(data, tree=self, parent=parent, index=index, code=code)
 
     def create_texture_vao(self):
         # type: () -> int
@@ -410,29 +412,24 @@ class LodTestTree(game_core.Octree):
         # GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_NEAREST)
         # return
 
-        root = self.get_root()  # type: LodTestItem
-
         print('generating items...')
-        items = [root]  # type: List[LodTestItem]
         items_by_depth = [list() for i in range(self.max_depth + 1)]  # type: List[List[LodTestItem]]
-        items_by_depth[0].append(root)
         printed_depth = -1
-        while items:
-            item = items.pop(0)
-            if printed_depth != item.get_depth():
-                printed_depth = item.get_depth()
-                print('  working on level {} items: {}'.format(printed_depth, item.index_hierarchy()))
+        half_size = self.size / 2.0
+        for info in self.iter_nodes():
+            if printed_depth < info.depth:
+                printed_depth = info.depth
+                print('  working on level {} items'.format(printed_depth))
 
             # determine this item's bounds in the image's space. The image
             # should have the same dimensions as the tree but the tree's
             # origin is in the center whereas the image's is in the bottom
             # left corner (possibly top left?) so the item's center needs to
             # be translated.
-            half_size = self.size / 2.0
-            tree_to_image_translation = game_core.Point(half_size, 0.0, half_size)
-            item_bounds = item.get_bounds()
-            bounds_in_image_min = (item_bounds.min() + tree_to_image_translation)
-            bounds_in_image_max = (item_bounds.max() + tree_to_image_translation)
+            half_item_size = info.size / 2.0
+            origin_x, origin_y, origin_z = info.origin
+            bounds_in_image_min = game_core.Point(origin_x - half_item_size + half_size, origin_y - half_item_size, origin_z - half_item_size + half_size)
+            bounds_in_image_max = game_core.Point(origin_x + half_item_size + half_size, origin_y + half_item_size, origin_z + half_item_size + half_size)
 
             # using the item's bounds in image space computed above, compute
             # stats about the image's pixels within this space
@@ -474,19 +471,17 @@ class LodTestTree(game_core.Octree):
                 # TODO: add items underneath height map too but not super fine detail items
                 continue
 
-            # if we aren't at the tree's max depth then split the item and
-            # add the children to the list of items to process. Otherwise
-            # this is a leaf level item so give it a value and add it to the
-            # list of items to contribute to the mesh
-            items_by_depth[item.get_depth()].append(item)
-            if item.get_depth() < self.max_depth:
+            # if we aren't at the tree's max depth then split the item so
+            # that the iteration visits its children. Otherwise this is a
+            # leaf level item so give it a value and add it to the list of
+            # items to contribute to the mesh
+            item = self._create_node_proxy_from_code(info.handle, info.code)  # type: LodTestItem
+            items_by_depth[info.depth].append(item)
+            if info.depth < self.max_depth:
                 item.split()
-                items.extend(item.get_children())
             else:
                 item.set_item_value('foo')
-                position = item.get_origin()
-                position.y = image_max_height
-                item.set_position(position)
+                item.set_position(game_core.Point(origin_x, image_max_height, origin_z))
 
         # # FOR DEBUGGING
         # # create a single mesh for all items
@@ -632,21 +627,35 @@ class LodTestTree(game_core.Octree):
 
     def generate_mesh(self, camera_position):
         print('generating mesh...')
-        vertex_items = []  # type: List[LodTestItem]
-        loop_items = [self.get_root()]  # type: List[LodTestItem]
-        while loop_items:
-            item = loop_items.pop(0)
-            if item.is_branch():
-                loop_items.extend(item.get_children())
-                continue
+        leaves, neighbor_handles, neighbor_indexes = self.get_leaf_neighbors()
+        get_value = self._storage.get_value
+        null_handle = self._storage.NULL
 
-            if not item.is_vertex_item():
+        # only create vertexes for items that neighbor an empty space. There
+        # is no need to create vertexes for items that are surrounded by
+        # other items with data
+        # TODO: this doesn't handle branches
+        is_vertex_item = []  # type: List[bool]
+        for leaf_index, leaf in enumerate(leaves):
+            result = False
+            if leaf.value[0]:
+                for handle in neighbor_handles[leaf_index]:
+                    if handle == null_handle or get_value(handle)[0] is None:
+                        result = True
+                        break
+            is_vertex_item.append(result)
+
+        vertex_items = []  # type: List[int]
+        item_normals = {}  # type: Dict[int, game_core.Vector]
+        item_vertex_indexes = {}  # type: Dict[int, int]
+        for leaf_index, leaf in enumerate(leaves):
+            if not is_vertex_item[leaf_index]:
                 continue
 
             normal = game_core.Vector()
             normal_offset = -1.0
-            for i, neighbor in enumerate(item.get_neighbors()):
-                if neighbor is None or not neighbor.is_vertex_item():
+            for i, neighbor_index in enumerate(neighbor_indexes[leaf_index]):
+                if neighbor_index < 0 or not is_vertex_item[neighbor_index]:
                     neighbor_dimension = int(i / 2)
                     # TODO: this doesn't work for single item thick walls/floors. Need double sided faces or something
                     if normal[neighbor_dimension]:
@@ -656,25 +665,29 @@ class LodTestTree(game_core.Octree):
                 normal_offset *= -1.0
 
             if normal:
-                item.normal = normal.normal()  # TODO: store this somewhere better?
-                item.vertex_index = len(vertex_items)
-                vertex_items.append(item)
+                item_normals[leaf_index] = normal.normal()
+                item_vertex_indexes[leaf_index] = len(vertex_items)
+                vertex_items.append(leaf_index)
 
         positions_data = []  # type: List[float]
         normals_data = []  # type: List[float]
         coarse_position_vectors_data = []  # type: List[float]
         coarse_normal_vectors_data = []  # type: List[float]
         indexes_data = []  # type: List[int]
-        for item in vertex_items:
+        for leaf_index in vertex_items:
+            leaf = leaves[leaf_index]
+            item = self._create_node_proxy_from_code(leaf.handle, leaf.code)  # type: LodTestItem
+            item_normal = item_normals[leaf_index]
+
             # add a vertex position to the array
             position = item.get_position()
             positions_data.append(position.x)
             positions_data.append(position.y)
             positions_data.append(position.z)
 
-            normals_data.append(item.normal.x)
-            normals_data.append(item.normal.y)
-            normals_data.append(item.normal.z)
+            normals_data.append(item_normal.x)
+            normals_data.append(item_normal.y)
+            normals_data.append(item_normal.z)
 
             coarse_position_vector = position - item.parent.get_position()
             coarse_position_vectors_data.append(coarse_position_vector.x)
@@ -683,7 +696,7 @@ class LodTestTree(game_core.Octree):
 
             # TODO: figure out parent normals properly
             # coarse_normal_vector = item.normal - item.parent.normal
-            coarse_normal_vector = item.normal
+            coarse_normal_vector = item_normal
             coarse_normal_vectors_data.append(coarse_normal_vector.x)
             coarse_normal_vectors_data.append(coarse_normal_vector.y)
             coarse_normal_vectors_data.append(coarse_normal_vector.z)
@@ -692,34 +705,35 @@ class LodTestTree(game_core.Octree):
             # neighbors in the negative direction will be connected
             # when that neighbor connects to its neighbors in the
             # positive direction
-            positive_neighbors = item.get_neighbors()[1::2]  # type: List[LodTestItem]
-            for neighbor_dimension, neighbor in enumerate(positive_neighbors):
-                if not hasattr(neighbor, 'vertex_index'):
+            positive_neighbors = neighbor_indexes[leaf_index][1::2]
+            for neighbor_dimension, neighbor_index in enumerate(positive_neighbors):
+                if neighbor_index not in item_vertex_indexes:
                     continue
+                neighbor_normal = item_normals[neighbor_index]
                 for dimension_offset in (1, 2):
                     normal_dimension = neighbor_dimension + dimension_offset
                     if normal_dimension >= self.DIMENSIONS:
                         normal_dimension -= self.DIMENSIONS
 
-                    if not item.normal[normal_dimension] or not neighbor.normal[normal_dimension]:
+                    if not item_normal[normal_dimension] or not neighbor_normal[normal_dimension]:
                         continue
-                    if numpy.sign(item.normal[normal_dimension]) != numpy.sign(neighbor.normal[normal_dimension]):
+                    if numpy.sign(item_normal[normal_dimension]) != numpy.sign(neighbor_normal[normal_dimension]):
                         continue
 
                     other_neighbor_dimension = neighbor_dimension - dimension_offset
                     if other_neighbor_dimension < 0:
                         other_neighbor_dimension = self.DIMENSIONS - 1
-                    other_neighbor = neighbor.get_neighbors()[(other_neighbor_dimension * 2) + 1]
-                    if not hasattr(other_neighbor, 'vertex_index'):
+                    other_neighbor_index = neighbor_indexes[neighbor_index][(other_neighbor_dimension * 2) + 1]
+                    if other_neighbor_index not in item_vertex_indexes:
                         continue
 
-                    indexes_data.append(item.vertex_index)
+                    indexes_data.append(item_vertex_indexes[leaf_index])
                     if dimension_offset == 1:
-                        indexes_data.append(neighbor.vertex_index)
-                        indexes_data.append(other_neighbor.vertex_index)
+                        indexes_data.append(item_vertex_indexes[neighbor_index])
+                        indexes_data.append(item_vertex_indexes[other_neighbor_index])
                     else:
-                        indexes_data.append(other_neighbor.vertex_index)
-                        indexes_data.append(neighbor.vertex_index)
+                        indexes_data.append(item_vertex_indexes[other_neighbor_index])
+                        indexes_data.append(item_vertex_indexes[neighbor_index])
 
             # TODO: add faces for diagonal neighbor to corner neighbor
 
@@ -1,7 +1,6 @@
-
 """Times access to an octree
 
-Best Results:
+Best Results (before locational codes):
 
 Initializing...
 Access Point: [1000000.0, -120245.0, 930412.0]
@@ -10,38 +9,54 @@ Time for 1000 accesses: 0.294078111649
 
 """
 import time
-from game_core.octree import Octree, _OctreeBranch
+
+import numpy
+
+from game_core import Octree
 from game_core import Point
 
-# fill tree to 16 levels
+# fill tree to 23 levels along the path to the access point
 #
 print 'Initializing...'
 start_time = time.time()
 levels = 23  # worst case: 23 levels, world size=8388608m, 4 patches around with patch size=2097152m, smallest blocks=1/4m
-tree = Octree(2**(levels-2))
+tree = Octree(2**(levels-2), levels)
 access_point = Point(1000000, -120245, 930412)
 print 'Access Point: %s' % access_point
-branch = tree._root
-""":type: `_OctreeBranch`"""
-num_children = 2**tree._DIMENSIONS
-info = tree._get_info()
+node = tree.get_root()
 for level in xrange(levels):
-    branch._children = [tree._LEAF_CLS() for i in xrange(num_children)]
-    if level != (levels-1):
-        index = branch._child_index_closest_to_point(info, access_point)
-        branch._children[index] = tree._BRANCH_CLS()
-        branch.get_child_info(info, index, copy=False)
-        branch = branch._children[index]
+    node.split()
+    node = node.get_closest_child(access_point)
 print 'Initialized: time=%s' % (time.time() - start_time)
 
 # time access
 #
-start_time = time.time()
 num = 1000
+start_time = time.time()
 for i in xrange(num):
     tree.get_node_from_point(access_point)
 t = time.time() - start_time
-print 'Time for %s accesses: %s' % (num, t)
+print 'Time for %s point accesses: %s' % (num, t)
+
+code = tree.point_to_code(access_point)
+start_time = time.time()
+for i in xrange(num):
+    tree.get_node_from_code(code)
+t = time.time() - start_time
+print 'Time for %s code accesses: %s' % (num, t)
+
+tree.build_code_index()
+start_time = time.time()
+for i in xrange(num):
+    tree.get_node_from_code(code)
+t = time.time() - start_time
+print 'Time for %s indexed code accesses: %s' % (num, t)
+
+points = numpy.array([list(access_point)] * num)
+start_time = time.time()
+tree.get_nodes_from_points(points)
+t = time.time() - start_time
+print 'Time for %s batched point accesses: %s' % (num, t)
 
 # import random
 # import time
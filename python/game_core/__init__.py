@@ -1,13 +1,18 @@
 FLOAT_SIZE = 4
 SHORT_SIZE = 2
 
-from .quaternion import Quaternion
+from .quaternion import Quaternion, QuaternionArray
 from .matrix import Matrix, MatrixStack
-from .point import Point
-from .vector import Vector
+from .abstract_vector import VectorPool
+from .point import Point, PointArray
+from .vector import Vector, VectorArray
 
-from .bounding_box import BoundingBox, BoundingBox2D
+from .bounding_box import BoundingBox, BoundingBox2D, BoundingBoxArray, BoundingBox2DArray
+from .aabb_tree import DynamicAABBTree
+from .collision import *
 
+from .tree_storage import *
+from . import tree_io
 from .abstract_tree import *
 
 from .mesh import Mesh
@@ -0,0 +1,514 @@
+""" Dynamic bounding volume hierarchy for moving objects.
+
+`AbstractTree` subclasses index static data (e.g. terrain) on a fixed grid.
+Objects that move every frame are better indexed by a `DynamicAABBTree`: a
+binary tree of axis aligned bounding boxes that is updated incrementally
+as objects are inserted, moved and removed.
+
+Each object is stored in a leaf with a "fat" bounding box that is larger
+than the object's actual bounding box.  Small movements inside of the fat
+box don't change the tree at all and larger movements re-insert the leaf.
+The tree is kept balanced with rotations so that queries visit
+``O(log(N))`` nodes.
+"""
+__all__ = ['DynamicAABBTree']
+
+from typing import Any, List, Optional, Sequence, Tuple
+
+from . import BoundingBox
+
+# index of a missing node
+_NULL = -1
+
+# how far ahead of a moving object's displacement its fat box is extended
+_DISPLACEMENT_MULTIPLIER = 2.0
+
+
+def _union(min_a, max_a, min_b, max_b):
+    return (
+        [a if a < b else b for a, b in zip(min_a, min_b)],
+        [a if a > b else b for a, b in zip(max_a, max_b)],
+    )
+
+
+def _cost(min_, max_):
+    """ The surface area (perimeter for 2D boxes) of a box which is
+    proportional to the probability of a random query hitting it
+    """
+    if len(min_) == 3:
+        dx = max_[0] - min_[0]
+        dy = max_[1] - min_[1]
+        dz = max_[2] - min_[2]
+        return 2.0 * (dx * dy + dy * dz + dz * dx)
+    return 2.0 * sum(b - a for a, b in zip(min_, max_))
+
+
+def _overlaps(min_a, max_a, min_b, max_b):
+    for i in xrange(len(min_a)):
+        if max_a[i] < min_b[i] or min_a[i] > max_b[i]:
+            return False
+    return True
+
+
+def _contains(outer_min, outer_max, inner_min, inner_max):
+    for i in xrange(len(outer_min)):
+        if inner_min[i] < outer_min[i] or inner_max[i] > outer_max[i]:
+            return False
+    return True
+
+
+class DynamicAABBTree(object):
+    """ A dynamic bounding volume hierarchy (see the module docs)
+
+    Objects are identified by the proxy id returned by `insert` which stays
+    the same until the object is removed.
+    """
+    def __init__(self, margin=0.1, dimensions=3):
+        """
+        Args:
+            margin (float): how much larger than an object's bounding box its
+                fat bounding box is in every direction
+            dimensions (int): 3 for `BoundingBox` objects or 2 for
+                `BoundingBox2D` objects
+        """
+        self.margin = margin
+        self.dimensions = dimensions
+        self._root = _NULL
+
+        # node data, indexed by node id.  Leaves have no children
+        self._mins = []  # type: List[Optional[List[float]]]
+        self._maxs = []  # type: List[Optional[List[float]]]
+        self._parents = []  # type: List[int]
+        self._child1 = []  # type: List[int]
+        self._child2 = []  # type: List[int]
+        self._heights = []  # type: List[int]
+        self._data = []  # type: List[Any]
+        self._free_nodes = []  # type: List[int]
+        self._num_proxies = 0
+
+    def __len__(self):
+        return self._num_proxies
+
+    def height(self):
+        # type: () -> int
+        """ Get the height of the tree (0 for a tree with a single object)
+        """
+        if self._root == _NULL:
+            return 0
+        return self._heights[self._root]
+
+    # ---------------------------------------------------------------- nodes
+    def _allocate_node(self):
+        # type: () -> int
+        if self._free_nodes:
+            node = self._free_nodes.pop()
+            self._parents[node] = _NULL
+            self._child1[node] = _NULL
+            self._child2[node] = _NULL
+            self._heights[node] = 0
+            return node
+        self._mins.append(None)
+        self._maxs.append(None)
+        self._parents.append(_NULL)
+        self._child1.append(_NULL)
+        self._child2.append(_NULL)
+        self._heights.append(0)
+        self._data.append(None)
+        return len(self._mins) - 1
+
+    def _free_node(self, node):
+        self._mins[node] = None
+        self._maxs[node] = None
+        self._data[node] = None
+        self._heights[node] = -1
+        self._free_nodes.append(node)
+
+    def _is_leaf(self, node):
+        return self._child1[node] == _NULL
+
+    def _get_bounds(self, bbox):
+        # type: (BoundingBox) -> Tuple[List[float], List[float]]
+        dimensions = self.dimensions
+        return bbox._min._data[:dimensions], bbox._max._data[:dimensions]
+
+    def _get_fat_bounds(self, bbox, displacement=None):
+        min_, max_ = self._get_bounds(bbox)
+        margin = self.margin
+        min_ = [value - margin for value in min_]
+        max_ = [value + margin for value in max_]
+        if displacement is not None:
+            for i in xrange(self.dimensions):
+                offset = displacement[i] * _DISPLACEMENT_MULTIPLIER
+                if offset < 0.0:
+                    min_[i] += offset
+                else:
+                    max_[i] += offset
+        return min_, max_
+
+    # -------------------------------------------------------------- proxies
+    def insert(self, bbox, data=None):
+        # type: (BoundingBox, Any) -> int
+        """ Add an object to the tree
+
+        Args:
+            bbox (AbstractBoundingBox): the object's bounding box
+            data (Any): data to associate with the object (see `get_data`)
+
+        Returns:
+            int: the proxy id of the object
+        """
+        proxy = self._allocate_node()
+        self._mins[proxy], self._maxs[proxy] = self._get_fat_bounds(bbox)
+        self._data[proxy] = data
+        self._insert_leaf(proxy)
+        self._num_proxies += 1
+        return proxy
+
+    def remove(self, proxy):
+        # type: (int) -> None
+        """ Remove an object from the tree
+        """
+        if not self._is_proxy(proxy):
+            raise KeyError('invalid proxy id: %s' % proxy)
+        self._remove_leaf(proxy)
+        self._free_node(proxy)
+        self._num_proxies -= 1
+
+    def move(self, proxy, bbox, displacement=None):
+        # type: (int, BoundingBox, Optional[Sequence[float]]) -> bool
+        """ Update the bounding box of an object
+
+        The tree is only changed if the new bounding box is not inside of
+        the object's fat bounding box.
+
+        Args:
+            proxy (int)
+            bbox (AbstractBoundingBox): the object's new bounding box
+            displacement (Optional[Sequence[float]]): how far the object is
+                expected to move before the next update (e.g. its velocity).
+                The fat bounding box is extended in this direction so that
+                the object is re-inserted less often.
+
+        Returns:
+            bool: True if the object was re-inserted
+        """
+        if not self._is_proxy(proxy):
+            raise KeyError('invalid proxy id: %s' % proxy)
+        min_, max_ = self._get_bounds(bbox)
+        if _contains(self._mins[proxy], self._maxs[proxy], min_, max_):
+            return False
+        self._remove_leaf(proxy)
+        self._mins[proxy], self._maxs[proxy] = self._get_fat_bounds(bbox, displacement)
+        self._insert_leaf(proxy)
+        return True
+
+    def _is_proxy(self, proxy):
+        return 0 <= proxy < len(self._heights) and self._heights[proxy] == 0 and self._mins[proxy] is not None
+
+    def get_data(self, proxy):
+        # type: (int) -> Any
+        return self._data[proxy]
+
+    def get_fat_bbox(self, proxy):
+        # type: (int) -> BoundingBox
+        """ Get the fat bounding box that an object is stored with
+        """
+        return BoundingBox(self._mins[proxy], self._maxs[proxy])
+
+    def iter_proxies(self):
+        """
+        Yields:
+            int: the proxy id of every object in the tree
+        """
+        for node in xrange(len(self._heights)):
+            if self._heights[node] == 0 and self._mins[node] is not None:
+                yield node
+
+    # -------------------------------------------------------------- queries
+    def query(self, bbox):
+        # type: (BoundingBox) -> List[int]
+        """ Get the objects whose fat bounding boxes intersect or touch a
+        bounding box
+
+        Returns:
+            List[int]: proxy ids
+        """
+        min_, max_ = self._get_bounds(bbox)
+        return self._query(min_, max_)
+
+    def _query(self, min_, max_):
+        result = []
+        if self._root == _NULL:
+            return result
+        mins = self._mins
+        maxs = self._maxs
+        child1 = self._child1
+        child2 = self._child2
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if not _overlaps(mins[node], maxs[node], min_, max_):
+                continue
+            if child1[node] == _NULL:
+                result.append(node)
+            else:
+                stack.append(child1[node])
+                stack.append(child2[node])
+        return result
+
+    def query_pairs(self):
+        # type: () -> List[Tuple[int, int]]
+        """ Get every pair of objects whose fat bounding boxes intersect or
+        touch each other.
+
+        Each object queries the tree once so this is ``O(N*log(N))``.
+
+        Returns:
+            List[Tuple[int, int]]: sorted ``(smaller proxy id, larger proxy
+                id)`` pairs
+        """
+        result = []
+        mins = self._mins
+        maxs = self._maxs
+        for proxy in self.iter_proxies():
+            for other in self._query(mins[proxy], maxs[proxy]):
+                if other > proxy:
+                    result.append((proxy, other))
+        result.sort()
+        return result
+
+    def raycast(self, origin, direction, max_distance=float('inf')):
+        # type: (Sequence[float], Sequence[float], float) -> List[Tuple[float, int]]
+        """ Get the objects whose fat bounding boxes are hit by a ray
+
+        Args:
+            origin (Sequence[float])
+            direction (Sequence[float]): distances are measured in multiples
+                of this vector's length
+            max_distance (float): ignore hits further than this
+
+        Returns:
+            List[Tuple[float, int]]: the distance along the ray at which each
+                box is entered (0 for boxes that contain `origin`) and the
+                proxy id, sorted by distance
+        """
+        result = []
+        if self._root == _NULL:
+            return result
+        dimensions = range(self.dimensions)
+        origin = [origin[i] for i in dimensions]
+        inverse_direction = [1.0 / direction[i] if direction[i] else None for i in dimensions]
+
+        mins = self._mins
+        maxs = self._maxs
+        child1 = self._child1
+        child2 = self._child2
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+
+            # slab test
+            node_min = mins[node]
+            node_max = maxs[node]
+            t_min = 0.0
+            t_max = max_distance
+            for i in dimensions:
+                inverse = inverse_direction[i]
+                if inverse is None:
+                    if origin[i] < node_min[i] or origin[i] > node_max[i]:
+                        break
+                    continue
+                t1 = (node_min[i] - origin[i]) * inverse
+                t2 = (node_max[i] - origin[i]) * inverse
+                if t1 > t2:
+                    t1, t2 = t2, t1
+                if t1 > t_min:
+                    t_min = t1
+                if t2 < t_max:
+                    t_max = t2
+                if t_min > t_max:
+                    break
+            else:
+                if child1[node] == _NULL:
+                    result.append((t_min, node))
+                else:
+                    stack.append(child1[node])
+                    stack.append(child2[node])
+        result.sort()
+        return result
+
+    # ------------------------------------------------------------ structure
+    def _insert_leaf(self, leaf):
+        if self._root == _NULL:
+            self._root = leaf
+            self._parents[leaf] = _NULL
+            return
+
+        mins = self._mins
+        maxs = self._maxs
+        child1 = self._child1
+        child2 = self._child2
+        leaf_min = mins[leaf]
+        leaf_max = maxs[leaf]
+
+        # find the best sibling using the surface area heuristic
+        node = self._root
+        while child1[node] != _NULL:
+            area = _cost(mins[node], maxs[node])
+            combined_area = _cost(*_union(mins[node], maxs[node], leaf_min, leaf_max))
+
+            # cost of creating a new parent for this node and the new leaf
+            cost = 2.0 * combined_area
+
+            # minimum cost of pushing the leaf further down the tree
+            inheritance_cost = 2.0 * (combined_area - area)
+
+            child_costs = []
+            for child in (child1[node], child2[node]):
+                child_cost = _cost(*_union(mins[child], maxs[child], leaf_min, leaf_max))
+                if child1[child] != _NULL:
+                    child_cost -= _cost(mins[child], maxs[child])
+                child_costs.append(child_cost + inheritance_cost)
+
+            if cost < child_costs[0] and cost < child_costs[1]:
+                break
+            node = child1[node] if child_costs[0] < child_costs[1] else child2[node]
+
+        # create a new parent for the sibling and the leaf
+        sibling = node
+        old_parent = self._parents[sibling]
+        new_parent = self._allocate_node()
+        self._parents[new_parent] = old_parent
+        mins[new_parent], maxs[new_parent] = _union(mins[sibling], maxs[sibling], leaf_min, leaf_max)
+        self._heights[new_parent] = self._heights[sibling] + 1
+        if old_parent != _NULL:
+            if child1[old_parent] == sibling:
+                child1[old_parent] = new_parent
+            else:
+                child2[old_parent] = new_parent
+        else:
+            self._root = new_parent
+        child1[new_parent] = sibling
+        child2[new_parent] = leaf
+        self._parents[sibling] = new_parent
+        self._parents[leaf] = new_parent
+
+        self._refit(self._parents[leaf])
+
+    def _remove_leaf(self, leaf):
+        if leaf == self._root:
+            self._root = _NULL
+            return
+
+        parent = self._parents[leaf]
+        grandparent = self._parents[parent]
+        if self._child1[parent] == leaf:
+            sibling = self._child2[parent]
+        else:
+            sibling = self._child1[parent]
+
+        if grandparent != _NULL:
+            # replace the parent with the sibling
+            if self._child1[grandparent] == parent:
+                self._child1[grandparent] = sibling
+            else:
+                self._child2[grandparent] = sibling
+            self._parents[sibling] = grandparent
+            self._free_node(parent)
+            self._refit(grandparent)
+        else:
+            self._root = sibling
+            self._parents[sibling] = _NULL
+            self._free_node(parent)
+        self._parents[leaf] = _NULL
+
+    def _refit(self, node):
+        """ Balance and update the bounding boxes and heights of a node and
+        its ancestors
+        """
+        mins = self._mins
+        maxs = self._maxs
+        heights = self._heights
+        while node != _NULL:
+            node = self._balance(node)
+            a = self._child1[node]
+            b = self._child2[node]
+            heights[node] = 1 + max(heights[a], heights[b])
+            mins[node], maxs[node] = _union(mins[a], maxs[a], mins[b], maxs[b])
+            node = self._parents[node]
+
+    def _balance(self, a):
+        # type: (int) -> int
+        """ Rotate the taller child of a node up if the node is unbalanced
+
+        Returns:
+            int: the node that is now at the position of `a`
+        """
+        heights = self._heights
+        if self._child1[a] == _NULL or heights[a] < 2:
+            return a
+
+        b = self._child1[a]
+        c = self._child2[a]
+        balance = heights[c] - heights[b]
+        if balance > 1:
+            return self._rotate_up(a, c, b, is_child1=False)
+        if balance < -1:
+            return self._rotate_up(a, b, c, is_child1=True)
+        return a
+
+    def _rotate_up(self, a, up, other, is_child1):
+        """ Make a child of a node (`up`) the parent of the node.
+
+        The taller child of `up` stays a child of `up` and the shorter one
+        replaces `up` as a child of `a`.
+
+        Args:
+            a (int): the unbalanced node
+            up (int): the taller child of `a`
+            other (int): the other child of `a`
+            is_child1 (bool): whether `up` is the first child of `a`
+
+        Returns:
+            int: `up`
+        """
+        mins = self._mins
+        maxs = self._maxs
+        heights = self._heights
+        parents = self._parents
+        child1 = self._child1
+        child2 = self._child2
+
+        f = child1[up]
+        g = child2[up]
+
+        # swap a and up
+        child1[up] = a
+        parents[up] = parents[a]
+        parents[a] = up
+        grandparent = parents[up]
+        if grandparent != _NULL:
+            if child1[grandparent] == a:
+                child1[grandparent] = up
+            else:
+                child2[grandparent] = up
+        else:
+            self._root = up
+
+        # keep the taller grandchild under up and move the other under a
+        if heights[f] > heights[g]:
+            keep, move = f, g
+        else:
+            keep, move = g, f
+        child2[up] = keep
+        if is_child1:
+            child1[a] = move
+        else:
+            child2[a] = move
+        parents[move] = a
+
+        mins[a], maxs[a] = _union(mins[other], maxs[other], mins[move], maxs[move])
+        mins[up], maxs[up] = _union(mins[a], maxs[a], mins[keep], maxs[keep])
+        heights[a] = 1 + max(heights[other], heights[move])
+        heights[up] = 1 + max(heights[a], heights[keep])
+        return up
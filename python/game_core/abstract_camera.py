@@ -90,6 +90,14 @@ class AbstractCamera(object):
         ry = self._get_roty_matrix()
         return rx * ry
 
+    def get_frustum_planes(self):
+        """ Get the planes of this camera's view frustum in world space
+
+        Returns:
+            List[Tuple[float, float, float, float]]: see `Matrix.get_frustum_planes`
+        """
+        return (self.matrix.inverse() * self.projection_matrix).get_frustum_planes()
+
     def update(self, time, delta_time):
         raise NotImplementedError
 
@@ -1,38 +1,99 @@
-__all__ = ['AbstractTree', 'TreeNode']
+__all__ = ['AbstractTree', 'TreeNode', 'TreeNodeInfo', 'RaycastHit', 'TreeChangeTracker']
 
-from typing import Any, List, Optional, Tuple
+import collections
+import itertools
+import math
+import operator
+import weakref
+
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple, Type, Union
+
+import numpy
 
 from . import decorators
+from . import tree_io
+from . import tree_storage
 from . import BoundingBox
 from . import Point
 from . import Vector
 
 
+# Lightweight description of a node yielded by `AbstractTree.iter_nodes`.
+# ``origin`` is a tuple with one float per dimension and ``handle`` is the
+# node's storage handle.
+TreeNodeInfo = collections.namedtuple('TreeNodeInfo', ['value', 'origin', 'size', 'depth', 'code', 'handle', 'is_leaf'])
+
+# Result of `AbstractTree.cast_ray`. ``point`` and ``normal`` are tuples with
+# one float per dimension.  ``normal`` is the normal of the face of the leaf
+# that the ray entered through (all zeros if the ray starts inside of it).
+RaycastHit = collections.namedtuple('RaycastHit', ['info', 'point', 'normal', 'distance'])
+
+
 class TreeNode(object):
     """ A temporary proxy to store runtime information about a node.
 
     Instances of this class should not be stored.
 
-    The only permanent data for a node is the actual data of the node itself.
-    For example, leaf nodes in a World tree will only store their block id and
-    branch nodes store a list of child data.
+    The only permanent data for a node is the actual data of the node itself
+    which lives in the tree's storage (see `tree_storage`).  For example, leaf
+    nodes in a World tree will only store their block id and branch nodes
+    store where to find their children.
+
+    Every node is identified by its locational code (see
+    `AbstractTree.point_to_code`) so a proxy can be created for any node
+    without creating proxies for all of its parents first.
+
+    Cached methods whose results depend on the structure of the tree are
+    cleared by the tree when that structure changes (see
+    `AbstractTree._invalidate_proxies`).  Subclasses adding such methods
+    should add their names to `_CHILDREN_CACHED_METHODS` or
+    `_NEIGHBOR_CACHED_METHODS` and call `AbstractTree._register_cached_proxy`
+    when computing them.
     """
     __metaclass__ = decorators.EnableCachedMethods
+    __slots__ = ('index', '_parent', 'tree', '_data', '_code', '__weakref__')
+
+    # cached methods that depend on this node's descendants
+    _CHILDREN_CACHED_METHODS = ('get_children',)
+
+    # cached methods that depend on the nodes around this node
+    _NEIGHBOR_CACHED_METHODS = ('get_neighbors', 'get_diagonal_neighbors')
 
-    def __init__(self, data, tree, parent, index):
-        # type: (_TreeNodeData, AbstractTree, Optional[TreeNode], int) -> None
+    def __init__(self, data, tree, parent, index, code=None):
+        # type: (Any, AbstractTree, Optional[TreeNode], int, Optional[int]) -> None
         """
         Args:
-            data (_TreeNodeData): All data for this node including this node's
-                value and list of children
+            data (Any): The handle of this node in the tree's storage
             tree (AbstractTree): The tree this node belongs to.
-            parent (Optional[TreeNode]):
+            parent (Optional[TreeNode]): The parent proxy if one is
+                available.  If not provided for a non-root node then the
+                parent will be looked up from `code` when it is needed.
             index (int): This node's index in its parent's list of children
+            code (Optional[int]): This node's locational code.  Derived from
+                `parent` and `index` if not provided.
         """
+        if code is None:
+            code = (parent._code << tree.DIMENSIONS) | index if parent is not None else 1
         self.index = index
-        self.parent = parent  # type: Optional[TreeNode]
+        self._parent = parent  # type: Optional[TreeNode]
         self.tree = tree
         self._data = data
+        self._code = code
+
+    @property
+    def parent(self):
+        # type: () -> Optional[TreeNode]
+        if self._parent is None and self._code != 1:
+            self._parent = self.tree.code_to_node(self._code >> self.tree.DIMENSIONS)
+        return self._parent
+
+    def get_code(self):
+        """ Get the locational code of this node
+
+        Returns:
+            int
+        """
+        return self._code
 
     @decorators.cached_method
     def index_hierarchy(self):
@@ -43,20 +104,46 @@ class TreeNode(object):
 
     def __str__(self):
         if self.is_leaf():
-            return '%s(type="leaf", depth=%s, index=%s, origin=%s, data=%s)' % (self.__class__.__name__, self.get_depth(), self.index, self.get_origin(), self._data)
+            return '%s(type="leaf", depth=%s, index=%s, origin=%s, data=%s)' % (self.__class__.__name__, self.get_depth(), self.index, self.get_origin(), self.get_value())
         else:
             return '%s(type="branch", depth=%s, index=%s, origin=%s)' % (self.__class__.__name__, self.get_depth(), self.index, self.get_origin())
 
     def get_value(self):
-        return self._data.value
+        return self.tree._storage.get_value(self._data)
 
     def set_value(self, value):
-        self._data.value = value
+        """ Set the value of this node
+
+        If the tree's `auto_compact` is enabled and this leaf now has the
+        same value as all of its siblings then the parent is merged (and so
+        on up the tree) which invalidates this proxy.
+        """
+        tree = self.tree
+        storage = tree._storage
+        storage.set_value(self._data, value)
+        tree._notify_change(self._code, False)
+        if tree.auto_compact and self._code != 1 and storage.is_leaf(self._data):
+            tree._compact_ancestors(self._code)
 
     def split(self):
-        # TODO: clear get_children cache
         # TODO: validate we haven't already split?
-        self._data.children = [_TreeNodeData(value=self.tree._get_default_node_data()) for i in range(self.tree.num_children)]
+        tree = self.tree
+        tree._storage.split(self._data)
+        if tree._code_index is not None:
+            tree._add_to_code_index(self._data, self._code)
+        tree._notify_change(self._code, True)
+
+    def merge(self):
+        """ Remove all of this node's descendants making it a leaf
+
+        The node keeps its current value.  Proxies for the descendants are
+        invalidated.
+        """
+        if self.is_leaf():
+            return
+        tree = self.tree
+        tree._merge_handle(self._data, self._code)
+        tree._notify_change(self._code, True)
 
     def is_leaf(self):
         """ Return whether or not this node is a leaf node (i.e. has no children)
@@ -64,7 +151,7 @@ class TreeNode(object):
         Returns:
             bool
         """
-        return self._data.children is None
+        return self.tree._storage.is_leaf(self._data)
 
     def is_branch(self):
         """ Return whether or not this node is a branch node (i.e. has children).
@@ -72,7 +159,7 @@ class TreeNode(object):
         Returns:
             bool
         """
-        return self._data.children is not None
+        return not self.tree._storage.is_leaf(self._data)
 
     @decorators.cached_method
     def get_children(self):
@@ -83,11 +170,11 @@ class TreeNode(object):
         Returns:
             Tuple[TreeNode]
         """
-        if self.is_leaf():
+        self.tree._register_cached_proxy(self)
+        children_data = self.tree._storage.get_children(self._data)
+        if children_data is None:
             return tuple()
 
-        # some subclasses may add extra data to branch nodes so be sure to only get data from the actual child nodes
-        children_data = self._data.children
         create_node_proxy = self.tree._create_node_proxy
         return tuple(
             create_node_proxy(child_data, parent=self, index=child_index)
@@ -122,11 +209,7 @@ class TreeNode(object):
         Returns:
             int
         """
-        try:
-            return self.parent.get_depth() + 1
-        except AttributeError:  # no parent so this must be the root node
-            assert self.parent is None
-            return 0
+        return (self._code.bit_length() - 1) // self.tree.DIMENSIONS
 
     @decorators.cached_method
     def get_size(self):
@@ -137,12 +220,7 @@ class TreeNode(object):
         Returns:
             float
         """
-        try:
-            parent_size = self.parent.get_size()
-        except AttributeError:  # no parent so this must be the root node
-            assert self.parent is None
-            return self.tree.size
-        return parent_size / 2.0
+        return self.tree.size / (1 << self.get_depth())
 
     @decorators.cached_method
     def get_origin(self):
@@ -153,19 +231,19 @@ class TreeNode(object):
         Returns:
             Point
         """
-        try:
-            result = Point( *self.parent.get_origin() )
-        except AttributeError:  # no parent so this must be the root node
-            assert self.parent is None
-            return Point()
+        if self._parent is None:
+            # no parent proxy so this is either the root node or a node
+            # that was looked up directly by its code
+            return self.tree.get_code_origin(self._code)
+        data = self._parent.get_origin()._data[:]
         half_size = self.get_size() / 2.0
         index = self.index
         for i, dimension_bit in enumerate(self.tree.dimension_bits):
             if index & dimension_bit:
-                result[i] += half_size
+                data[i] += half_size
             else:
-                result[i] -= half_size
-        return result
+                data[i] -= half_size
+        return Point._from_data(data)
 
     @decorators.cached_method
     def get_bounds(self):
@@ -183,71 +261,73 @@ class TreeNode(object):
         return BoundingBox(origin - half_size_vector, origin + half_size_vector)
 
     def get_neighbor(self, dimension, negative):
-        if not self.parent:
+        # type: (int, bool) -> Optional[TreeNode]
+        """ Get the same-or-larger node adjacent to this one along a dimension
+
+        Returns:
+            Optional[TreeNode]: None if this node is on the edge of the tree
+        """
+        direction = [0] * self.tree.DIMENSIONS
+        direction[dimension] = -1 if negative else 1
+        return self.get_neighbor_in_direction(direction)
+
+    def get_neighbor_in_direction(self, direction):
+        # type: (Sequence[int]) -> Optional[TreeNode]
+        """ Get the same-or-larger node adjacent to this one in any face,
+        edge or corner direction.
+
+        If the node at the same depth exists it is returned even if it is a
+        branch.  Otherwise the leaf that contains it is returned.
+
+        Args:
+            direction (Sequence[int]): -1, 0 or 1 for each dimension
+
+        Returns:
+            Optional[TreeNode]: None if the neighbor would be outside of the tree
+        """
+        tree = self.tree
+        code = tree.get_neighbor_code(self._code, direction)
+        if code is None:
             return None
-        neighbor_index = self.tree.neighbor_sibling_indexes[self.index][dimension]
-        if self.index & self.tree.dimension_bits[dimension]:
-            if negative:
-                return self.parent.get_children()[neighbor_index]
-            else:
-                # TODO: this doesn't account for sparse trees
-                parent_neighbor = self.parent.get_neighbor(dimension, negative)
-                if parent_neighbor is None:
-                    return None
-                if parent_neighbor.is_leaf():
-                    return parent_neighbor
-                return parent_neighbor.get_children()[neighbor_index]
-        elif not negative:
-            return self.parent.get_children()[neighbor_index]
-        else:
-            parent_neighbor = self.parent.get_neighbor(dimension, negative)
-            if parent_neighbor is None:
-                return None
-            if parent_neighbor.is_leaf():
-                return parent_neighbor
-            return parent_neighbor.get_children()[neighbor_index]
+        handle, found_code = tree._find_code(code)
+        return tree._create_node_proxy_from_code(handle, found_code)
 
     @decorators.cached_method
     def get_neighbors(self):
-        # type: () -> Optional[Tuple[TreeNode, ...]]
-        if not self.parent:
+        # type: () -> Optional[Tuple[Optional[TreeNode], ...]]
+        """ Get the neighbors in each of the tree's `face_directions`
+        (i.e. -x, +x, -y, +y, ...)
+
+        Returns:
+            Optional[Tuple[Optional[TreeNode], ...]]: None for the root node
+        """
+        if self._code == 1:
             return None
-        result = []
-        for dimension in range(self.tree.DIMENSIONS):
-            result.append(self.get_neighbor(dimension, negative=True))
-            result.append(self.get_neighbor(dimension, negative=False))
-        return tuple(result)
+        self.tree._register_cached_proxy(self)
+        return tuple(self.get_neighbor_in_direction(d) for d in self.tree.face_directions)
 
     @decorators.cached_method
     def get_diagonal_neighbors(self):
-        # type: () -> Optional[Tuple[TreeNode, ...]]
-        neighbors = self.get_neighbors()
-        if not neighbors:
-            return None
+        # type: () -> Optional[Tuple[Optional[TreeNode], ...]]
+        """ Get the neighbors in each of the tree's `neighbor_directions`
+        (i.e. the face neighbors followed by the edge and corner neighbors)
 
-        # TODO: this is not agnostic of number of dimensions
-        result = list(neighbors)
-        for i, neighbor in enumerate(neighbors):
-            neighbor_dimension = int(i / 2)
-            diagonal_dimension = neighbor_dimension - 1 if neighbor_dimension else self.tree.DIMENSIONS - 1
-            result.append(neighbor.get_neighbor(diagonal_dimension, negative=True))
-            result.append(neighbor.get_neighbor(diagonal_dimension, negative=False))
+        Returns:
+            Optional[Tuple[Optional[TreeNode], ...]]: None for the root node
+        """
+        if self._code == 1:
+            return None
+        self.tree._register_cached_proxy(self)
+        return tuple(self.get_neighbor_in_direction(d) for d in self.tree.neighbor_directions)
 
-            if neighbor_dimension < self.tree.DIMENSIONS - 1:
-                corner_dimension = diagonal_dimension - 1 if diagonal_dimension else self.tree.DIMENSIONS - 1
-                result[-2].get_neighbor(corner_dimension, negative=True)
-                result[-1].get_neighbor(corner_dimension, negative=False)
-        assert len(result) == 26
-        return tuple(result)
+    def __eq__(self, other):
+        return isinstance(other, TreeNode) and other.tree is self.tree and other._code == self._code
 
+    def __ne__(self, other):
+        return not self == other
 
-class _TreeNodeData(object):
-    """ Internal object to store just the data of a node in a tree
-    """
-    def __init__(self, value=None, children=None):
-        # type: (Optional[Any], Optional[List[Optional[_TreeNodeData]]]) -> None
-        self.value = value
-        self.children = children
+    def __hash__(self):
+        return hash(self._code)
 
 
 class AbstractTree(object):
@@ -261,15 +341,35 @@ class AbstractTree(object):
             child indexes are determined.
         num_children (int): The number of children the tree can have.
         neighbor_sibling_indexes (Tuple[Tuple[int, ...]]): Indexes for each child's adjacent siblings
+        face_directions (Tuple[Tuple[int, ...], ...]): The direction to each
+            face neighbor ordered -x, +x, -y, +y, ...
+        neighbor_directions (Tuple[Tuple[int, ...], ...]): The direction to
+            every face, edge and corner neighbor.  Starts with
+            `face_directions`.
         size (int): The spacial size of the tree
         max_depth (int): The maximum allowed depth of the tree
         min_size (float): The minimum allowed size of a node within the tree.
+        auto_compact (bool): Whether setting the value of a leaf merges its
+            parent when all of the parent's children are leaves with the
+            same value (see `compact`).
+        generation (int): Incremented every time a node's value is set or a
+            node is split or merged.  Can be compared against a stored value
+            to cheaply check whether anything changed.
     """
     # Abstract: must be reimplemented in base classes
     # This defines how many dimensions the tree has
     DIMENSIONS = None  # type: int
 
-    def __init__(self, size, max_depth):
+    # The class used to store node data. This can be overridden per tree
+    # instance with the `storage_cls` init argument.
+    STORAGE_CLS = tree_storage.ObjectTreeStorage  # type: Type[tree_storage.AbstractTreeStorage]
+
+    # The numpy dtype of node values. Only used by storages that pack
+    # values into arrays (e.g. `tree_storage.ArrayTreeStorage`).
+    VALUE_DTYPE = object
+
+    def __init__(self, size, max_depth, storage_cls=None, auto_compact=False):
+        # type: (float, int, Optional[Type[tree_storage.AbstractTreeStorage]], bool) -> None
         # TODO: remove size from base class. it is not always relevant
         self.dimension_bits = tuple(1 << i for i in range(self.DIMENSIONS))
         self.num_children = 2 ** self.DIMENSIONS
@@ -277,18 +377,109 @@ class AbstractTree(object):
             tuple(i ^ b for b in self.dimension_bits)
             for i in range(self.num_children)
         )
+        self.face_directions = tuple(
+            tuple(step if i == dimension else 0 for i in range(self.DIMENSIONS))
+            for dimension in range(self.DIMENSIONS)
+            for step in (-1, 1)
+        )
+        self.neighbor_directions = self.face_directions + tuple(
+            direction
+            for direction in itertools.product((-1, 0, 1), repeat=self.DIMENSIONS)
+            if direction not in self.face_directions and any(direction)
+        )
 
         self.size = float(size)
         self.max_depth = int(max_depth)
         self.min_size = self.size / 2.0 ** self.max_depth
-        self._data = _TreeNodeData(value=self._get_default_node_data())
+        self.auto_compact = auto_compact
+        self._storage_cls = storage_cls or self.STORAGE_CLS
+        self._storage = self._create_storage(self._storage_cls)
+        self._data = self._storage.create_root()
+        self._code_index = None  # type: Optional[Dict[int, Any]]
+        self._dimension_masks = {}  # type: Dict[int, Tuple[int, ...]]
+        self.generation = 0
+        self._change_listeners = []  # type: List[Callable[[int, bool], None]]
+        # proxies with cached results that depend on the tree's structure
+        # keyed by id since proxies compare equal by code
+        self._cached_proxies = weakref.WeakValueDictionary()  # type: weakref.WeakValueDictionary
 
     def _get_default_node_data(self):
         return None
 
-    def _create_node_proxy(self, data, parent=None, index=0):
-        # type: (_TreeNodeData, Optional[TreeNode], int) -> TreeNode
-        return TreeNode(data, tree=self, parent=parent, index=index)
+    def _create_storage(self, storage_cls):
+        # type: (Type[tree_storage.AbstractTreeStorage]) -> tree_storage.AbstractTreeStorage
+        return storage_cls(self.num_children, self._get_default_node_data, dtype=self.VALUE_DTYPE)
+
+    def _create_node_proxy(self, data, parent=None, index=0, code=None):
+        # type: (Any, Optional[TreeNode], int, Optional[int]) -> TreeNode
+        return TreeNode(data, tree=self, parent=parent, index=index, code=code)
+
+    def save(self, path):
+        """ Save the tree to a file (see `tree_io`)
+
+        Node values must be packable into a numpy array (e.g. numbers).
+
+        Args:
+            path (str)
+        """
+        tree_io.write_tree(self, path)
+
+    def load(self, path, mmap=False):
+        """ Replace the contents of this tree with a tree saved by `save`
+
+        All existing proxies and storage handles are invalidated.
+
+        Args:
+            path (str)
+            mmap (bool): memory map the file instead of reading it.  The
+                tree becomes read-only (see `tree_storage.MappedTreeStorage`)
+                but opening it is near-instant and only the parts of the
+                file that are traversed are read.
+
+        Raises:
+            ValueError: if the file is not a tree file or was saved from a
+                tree with different dimensions, size or max depth
+        """
+        header, branch_bits, branch_ranks, values = tree_io.read_tree(path, mmap=mmap)
+        if (header.dimensions, header.size, header.max_depth) != (self.DIMENSIONS, self.size, self.max_depth):
+            raise ValueError('%s does not match the dimensions, size and max depth of this tree' % path)
+
+        if mmap:
+            storage = tree_storage.MappedTreeStorage(
+                self.num_children, self._get_default_node_data, branch_bits, branch_ranks, values, dtype=self.VALUE_DTYPE
+            )
+            self._replace_storage(storage, storage.create_root())
+        else:
+            is_branch = numpy.unpackbits(branch_bits)[:header.num_nodes].astype(bool)
+            if numpy.dtype(self.VALUE_DTYPE).hasobject:
+                values = values.tolist()
+            self.load_level_order(is_branch, values)
+
+    def load_level_order(self, is_branch, values):
+        # type: (numpy.ndarray, Sequence[Any]) -> None
+        """ Replace the contents of this tree with nodes listed in level
+        order (see `AbstractTreeStorage.get_level_order`), e.g. to build a
+        whole tree at once without splitting nodes one at a time.
+
+        All existing proxies and storage handles are invalidated.
+
+        Args:
+            is_branch (numpy.ndarray): bool array of whether each node is a
+                branch
+            values (Sequence[Any]): the value of each node
+        """
+        storage = self._create_storage(self._storage_cls)
+        self._replace_storage(storage, storage.load_level_order(is_branch, values))
+
+    def _replace_storage(self, storage, root):
+        """ Replace the tree's storage and root node handle
+        """
+        self._storage = storage
+        self._data = root
+        if self._code_index is not None:
+            self.build_code_index()
+        self._invalidate_all_proxies()
+        self._notify_change(1, True)
 
     def get_opposite_index(self, index):
         """ Flip the bits for the provided index
@@ -313,6 +504,9 @@ class AbstractTree(object):
     def get_node_from_point(self, point, max_depth=None):
         """ Get the leaf node that contains the provided point
 
+        If the point is exactly the origin of a branch node then that branch
+        node is returned.
+
         Args:
             point (Point): get the leaf node that contains this point
             max_depth (int): The maximum depth to traverse.  If this depth is
@@ -322,27 +516,1368 @@ class AbstractTree(object):
         Returns:
             TreeNode
         """
-        def node_matches():
-            if node.get_origin() == point:
-                return True
-            elif node.is_leaf():
+        max_depth = max_depth if max_depth is not None else self.max_depth
+        code = self.point_to_code(point, depth=max_depth)
+        if code is None:
+            return None
+        center_depth = self._get_center_depth(point, max_depth)
+        if center_depth is not None:
+            code >>= self.DIMENSIONS * (max_depth - center_depth)
+        return self.get_node_from_code(code)
+
+    def _get_center_depth(self, point, max_depth):
+        """ Get the depth of the node whose origin is exactly `point`
+
+        Node origins at depth ``d`` are odd multiples of ``size / 2**(d+1)``
+        (relative to the tree's minimum corner) so the depth can be read
+        from the number of trailing zero bits of the scaled point.
+
+        Returns:
+            Optional[int]: None if the point is not the origin of any node
+                shallower than `max_depth`
+        """
+        half_size = self.size / 2.0
+        scale = (1 << (max_depth + 1)) / self.size
+        result = None
+        for i in range(self.DIMENSIONS):
+            scaled = (point[i] + half_size) * scale
+            scaled_int = int(scaled)
+            if scaled_int != scaled or scaled_int <= 0:
+                return None
+            depth = max_depth - ((scaled_int & -scaled_int).bit_length() - 1)
+            if depth < 0 or (result is not None and depth != result):
+                return None
+            result = depth
+        if result == max_depth:
+            return None
+        return result
+
+    def get_nodes_from_points(self, points, max_depth=None):
+        """ Batch version of `get_node_from_point`
+
+        All points are pushed down the tree together one level at a time so
+        the cost is roughly one numpy operation per level instead of a
+        python loop per point.  No proxies are created; use
+        `_create_node_proxy` on individual handles if they are needed.
+
+        Args:
+            points (numpy.ndarray): (N, DIMENSIONS) array of points.  Extra
+                columns (e.g. the z component of 2D points) are ignored.
+            max_depth (int): The maximum depth to traverse.
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.ndarray]: the storage handle and value
+                of the node containing each point.  Points outside of the
+                tree get the storage's NULL handle and the default node value.
+        """
+        max_depth = max_depth if max_depth is not None else self.max_depth
+        points = numpy.asarray(points, dtype=float)[:, :self.DIMENSIONS]
+        coords, inside = self._points_to_coords(points, max_depth)
+        stop_depths = self._get_center_depths(points, max_depth)
+        handles, depths = self._descend_batch(coords, max_depth, stop_depths)
+
+        storage = self._storage
+        values = storage.get_value_batch(handles)
+        if not inside.all():
+            outside = numpy.flatnonzero(~inside)
+            handles[outside] = storage.NULL
+            for i in outside:
+                values[i] = self._get_default_node_data()
+        return handles, values
+
+    def _points_to_coords(self, points, depth):
+        # type: (numpy.ndarray, int) -> Tuple[numpy.ndarray, numpy.ndarray]
+        """ Batch version of the cell calculation in `point_to_code`
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.ndarray]: the (N, DIMENSIONS) integer
+                cell of each point at `depth` and a boolean array of which
+                points are inside of the tree.  Cells of points outside of
+                the tree are clamped.
+        """
+        half_size = self.size / 2.0
+        num_cells = 1 << depth
+        inside = numpy.all(numpy.abs(points) <= half_size, axis=1)
+        coords = ((points + half_size) * (num_cells / self.size)).astype(numpy.int64)
+        numpy.clip(coords, 0, num_cells - 1, out=coords)
+        return coords, inside
+
+    def _get_center_depths(self, points, max_depth):
+        # type: (numpy.ndarray, int) -> numpy.ndarray
+        """ Batch version of `_get_center_depth`
+
+        Returns:
+            numpy.ndarray: the depth of the node whose origin is exactly each
+                point or `max_depth` if there is no such node
+        """
+        half_size = self.size / 2.0
+        scaled = (points + half_size) * ((1 << (max_depth + 1)) / self.size)
+        scaled_int = scaled.astype(numpy.int64)
+        valid = numpy.all((scaled_int == scaled) & (scaled_int > 0), axis=1)
+
+        # depth from the number of trailing zero bits of each component
+        lowest_bit = numpy.maximum(scaled_int & -scaled_int, 1)
+        depths = max_depth - numpy.log2(lowest_bit).round().astype(numpy.int64)
+        valid &= numpy.all(depths == depths[:, :1], axis=1)
+        valid &= depths[:, 0] >= 0
+        return numpy.where(valid, depths[:, 0], max_depth)
+
+    def _descend_batch(self, coords, depth, stop_depths=None):
+        # type: (numpy.ndarray, int, Optional[numpy.ndarray]) -> Tuple[numpy.ndarray, numpy.ndarray]
+        """ Find the deepest existing node containing each cell
+
+        Args:
+            coords (numpy.ndarray): (N, DIMENSIONS) integer cells at `depth`
+            depth (int): the depth of the cells in `coords`
+            stop_depths (Optional[numpy.ndarray]): stop descending at these
+                depths even if the node is a branch
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.ndarray]: the storage handle and depth
+                of the node found for each cell
+        """
+        storage = self._storage
+        count = len(coords)
+        handles = storage.create_handle_array(self._data, count)
+        depths = numpy.zeros(count, dtype=numpy.int64)
+        active = numpy.arange(count)
+        if stop_depths is not None:
+            active = active[stop_depths > 0]
+
+        for level in range(depth):
+            if not len(active):
+                break
+            active_handles = handles[active]
+            is_branch = ~storage.is_leaf_batch(active_handles)
+            active = active[is_branch]
+            if not len(active):
+                break
+            shift = depth - 1 - level
+            active_coords = coords[active]
+            child_indexes = numpy.zeros(len(active), dtype=numpy.int64)
+            for i in range(self.DIMENSIONS):
+                child_indexes |= ((active_coords[:, i] >> shift) & 1) << i
+            handles[active] = storage.get_child_batch(active_handles[is_branch], child_indexes)
+            depths[active] = level + 1
+            if stop_depths is not None:
+                active = active[stop_depths[active] > level + 1]
+        return handles, depths
+
+    def _descend(self, coords, depth):
+        # type: (Sequence[int], int) -> Tuple[Any, int]
+        """ Scalar version of `_descend_batch`
+
+        Returns:
+            Tuple[Any, int]: the storage handle and depth of the deepest
+                existing node containing the cell
+        """
+        storage = self._storage
+        handle = self._data
+        dimension_range = range(self.DIMENSIONS)
+        for level in xrange(depth):
+            if storage.is_leaf(handle):
+                return handle, level
+            shift = depth - 1 - level
+            index = 0
+            for i in dimension_range:
+                index |= ((coords[i] >> shift) & 1) << i
+            handle = storage.get_child(handle, index)
+        return handle, depth
+
+    def point_to_code(self, point, depth=None):
+        """ Get the locational code of the node at `depth` that contains `point`
+
+        A locational code is a 1 bit followed by the child index of each
+        level from the root down to the node, i.e. the node's morton (Z-order)
+        code with a sentinel bit that encodes its depth.  The root's code is
+        1 and a child's code is ``(parent_code << DIMENSIONS) | child_index``.
+
+        The node does not need to exist in the tree.
+
+        Args:
+            point (Point)
+            depth (Optional[int]): depth of the node to get the code of.
+                Defaults to the tree's max depth.
+
+        Returns:
+            Optional[int]: None if the point is outside of the tree
+        """
+        depth = depth if depth is not None else self.max_depth
+        half_size = self.size / 2.0
+        num_cells = 1 << depth
+        scale = num_cells / self.size
+        coords = []
+        for i in range(self.DIMENSIONS):
+            component = point[i]
+            if abs(component) > half_size:
+                return None
+            coord = int((component + half_size) * scale)
+            if coord >= num_cells:  # point is on the max edge of the tree
+                coord = num_cells - 1
+            coords.append(coord)
+        return self.coords_to_code(coords, depth)
+
+    def coords_to_code(self, coords, depth):
+        """ Get the locational code of the node at `depth` with the provided
+        integer cell coordinates.
+
+        Args:
+            coords (Sequence[int]): the node's cell along each dimension in
+                the range ``[0, 2**depth)``
+            depth (int)
+
+        Returns:
+            int
+        """
+        spread_table = _get_spread_table(self.DIMENSIONS)
+        dimensions = self.DIMENSIONS
+        code = 1 << (depth * dimensions)
+        for i, coord in enumerate(coords):
+            shift = i
+            while coord:
+                code |= spread_table[coord & 0xff] << shift
+                coord >>= 8
+                shift += 8 * dimensions
+        return code
+
+    def code_to_coords(self, code):
+        """ Get the depth and integer cell coordinates of a locational code
+
+        Returns:
+            Tuple[int, List[int]]: the node's depth and cell along each dimension
+        """
+        dimensions = self.DIMENSIONS
+        depth = self.get_code_depth(code)
+        coords = [0] * dimensions
+        for level in range(depth):
+            shift = dimensions * (depth - 1 - level)
+            for i in range(dimensions):
+                coords[i] = (coords[i] << 1) | ((code >> (shift + i)) & 1)
+        return depth, coords
+
+    def get_code_depth(self, code):
+        """ Get the depth of the node with the provided locational code
+
+        Returns:
+            int
+        """
+        return (code.bit_length() - 1) // self.DIMENSIONS
+
+    def get_code_size(self, code):
+        """ Get the size of the node with the provided locational code
+
+        Returns:
+            float
+        """
+        return self.size / (1 << self.get_code_depth(code))
+
+    def get_code_origin(self, code):
+        """ Get the center point of the node with the provided locational code
+
+        Returns:
+            Point
+        """
+        depth, coords = self.code_to_coords(code)
+        size = self.size / (1 << depth)
+        half_tree_size = self.size / 2.0
+        result = Point()
+        for i, coord in enumerate(coords):
+            result[i] = (coord + 0.5) * size - half_tree_size
+        return result
+
+    def build_code_index(self):
+        """ Build a hash of locational codes for every node in the tree.
+
+        Once built, the index is kept up to date by `TreeNode.split` and
+        lets `get_node_from_code` find the deepest existing node for a code
+        with a binary search over depths (a handful of hash lookups) instead
+        of descending level by level.
+        """
+        self._code_index = {}
+        self._add_to_code_index(self._data, 1)
+
+    def _add_to_code_index(self, handle, code):
+        """ Add the node `handle` and all of its descendants to the code index
+        """
+        code_index = self._code_index
+        code_index[code] = handle
+        storage = self._storage
+        dimensions = self.DIMENSIONS
+        stack = [(handle, code)]
+        while stack:
+            handle, code = stack.pop()
+            children = storage.get_children(handle)
+            if children is None:
+                continue
+            base_code = code << dimensions
+            for index, child in enumerate(children):
+                child_code = base_code | index
+                code_index[child_code] = child
+                stack.append((child, child_code))
+
+    def _remove_from_code_index(self, handle, code):
+        """ Remove all of the descendants of the node `handle` from the code index
+        """
+        code_index = self._code_index
+        storage = self._storage
+        dimensions = self.DIMENSIONS
+        stack = [(handle, code)]
+        while stack:
+            handle, code = stack.pop()
+            children = storage.get_children(handle)
+            if children is None:
+                continue
+            base_code = code << dimensions
+            for index, child in enumerate(children):
+                child_code = base_code | index
+                del code_index[child_code]
+                stack.append((child, child_code))
+
+    def _find_code(self, code):
+        """ Find the deepest existing node that contains the node of `code`
+
+        Returns:
+            Tuple[Any, int]: the storage handle and code of the found node
+        """
+        dimensions = self.DIMENSIONS
+        depth = self.get_code_depth(code)
+        code_index = self._code_index
+        if code_index is not None:
+            handle = code_index.get(code, _MISSING)
+            if handle is not _MISSING:
+                return handle, code
+
+            # nodes only exist if their parent does so binary search for the
+            # deepest depth whose ancestor of `code` is in the index
+            low = 0
+            high = depth
+            while high - low > 1:
+                middle = (low + high) // 2
+                if (code >> (dimensions * (depth - middle))) in code_index:
+                    low = middle
+                else:
+                    high = middle
+            found_code = code >> (dimensions * (depth - low))
+            return code_index[found_code], found_code
+
+        storage = self._storage
+        is_leaf = storage.is_leaf
+        get_child = storage.get_child
+        mask = self.num_children - 1
+        handle = self._data
+        found_code = 1
+        shift = dimensions * (depth - 1)
+        while shift >= 0 and not is_leaf(handle):
+            index = (code >> shift) & mask
+            handle = get_child(handle, index)
+            found_code = (found_code << dimensions) | index
+            shift -= dimensions
+        return handle, found_code
+
+    def _create_node_proxy_from_code(self, handle, code):
+        index = code & (self.num_children - 1) if code != 1 else 0
+        return self._create_node_proxy(handle, index=index, code=code)
+
+    def get_node_from_code(self, code):
+        """ Get the deepest existing node that contains the node of `code`
+
+        For a code at the tree's max depth this is the leaf containing that
+        cell.
+
+        Args:
+            code (int): a locational code (see `point_to_code`)
+
+        Returns:
+            TreeNode
+        """
+        handle, found_code = self._find_code(code)
+        return self._create_node_proxy_from_code(handle, found_code)
+
+    def code_to_node(self, code):
+        """ Get the node with exactly the provided locational code
+
+        Args:
+            code (int): a locational code (see `point_to_code`)
+
+        Returns:
+            Optional[TreeNode]: None if the node does not exist in the tree
+        """
+        handle, found_code = self._find_code(code)
+        if found_code != code:
+            return None
+        return self._create_node_proxy_from_code(handle, code)
+
+    def add_change_listener(self, listener):
+        # type: (Callable[[int, bool], None]) -> None
+        """ Register a function to call whenever the tree changes
+
+        Listeners are called with the locational code of the node that
+        changed and whether the change was structural (a split or merge)
+        rather than just a new value.  The node's cell (see
+        `get_code_origin` and `get_code_size`) is the region that changed.
+        `compact` reports each merged node.
+        """
+        self._change_listeners.append(listener)
+
+    def remove_change_listener(self, listener):
+        # type: (Callable[[int, bool], None]) -> None
+        self._change_listeners.remove(listener)
+
+    def _notify_change(self, code, structural):
+        """ Record that the node `code` changed
+        """
+        self.generation += 1
+        if structural and self._cached_proxies:
+            self._invalidate_proxies(code)
+        for listener in self._change_listeners:
+            listener(code, structural)
+
+    def _register_cached_proxy(self, proxy):
+        # type: (TreeNode) -> None
+        """ Track a proxy that has cached results depending on the tree's
+        structure so that they can be cleared when the structure changes.
+        """
+        self._cached_proxies[id(proxy)] = proxy
+
+    def _invalidate_proxies(self, code):
+        """ Clear the structure dependent caches of the proxies affected by
+        splitting or merging the node `code`.
+
+        Only the node itself and its descendants can have different children
+        and only proxies deeper than the node whose neighbors fall inside of
+        it can have different neighbors.  Those proxies are all below the
+        node or below one of its same-depth neighbors so only they need
+        their neighbors checked.
+        """
+        dimensions = self.DIMENSIONS
+        depth = self.get_code_depth(code)
+        neighborhood = None  # type: Optional[Set[int]]
+        clear_cached_methods = decorators.clear_cached_methods
+        for proxy in self._cached_proxies.values():
+            proxy_code = proxy._code
+            shift = (proxy_code.bit_length() - 1) // dimensions * dimensions - depth * dimensions
+            if shift < 0:
+                continue
+            ancestor_code = proxy_code >> shift
+            if ancestor_code == code:
+                clear_cached_methods(proxy, proxy._CHILDREN_CACHED_METHODS)
+                if shift:
+                    clear_cached_methods(proxy, proxy._NEIGHBOR_CACHED_METHODS)
+            elif shift:
+                if neighborhood is None:
+                    neighborhood = set(self.get_neighbor_code(code, d) for d in self.neighbor_directions)
+                if ancestor_code in neighborhood and self._is_neighbor_inside(proxy_code, code, shift):
+                    clear_cached_methods(proxy, proxy._NEIGHBOR_CACHED_METHODS)
+
+    def _is_neighbor_inside(self, code, ancestor_code, shift):
+        """ Return whether any of the neighbors of the node `code` are
+        inside of the node `ancestor_code` which is `shift` bits shallower
+        """
+        get_neighbor_code = self.get_neighbor_code
+        for direction in self.neighbor_directions:
+            neighbor_code = get_neighbor_code(code, direction)
+            if neighbor_code is not None and neighbor_code >> shift == ancestor_code:
                 return True
+        return False
+
+    def _invalidate_all_proxies(self):
+        """ Clear the structure dependent caches of every tracked proxy
+        """
+        clear_cached_methods = decorators.clear_cached_methods
+        for proxy in self._cached_proxies.values():
+            clear_cached_methods(proxy, proxy._CHILDREN_CACHED_METHODS + proxy._NEIGHBOR_CACHED_METHODS)
+        self._cached_proxies.clear()
+
+    def _merge_handle(self, handle, code):
+        """ Merge the node `handle` keeping the code index up to date
+        """
+        if self._code_index is not None:
+            self._remove_from_code_index(handle, code)
+        self._storage.merge(handle)
+
+    def _get_uniform_children_value(self, handle):
+        """ Get the value shared by all of a branch's children
+
+        Returns:
+            Any: `_MISSING` if any child is a branch or the values differ
+        """
+        storage = self._storage
+        is_leaf = storage.is_leaf
+        get_value = storage.get_value
+        children = storage.get_children(handle)
+        value = get_value(children[0])
+        for child in children:
+            if not is_leaf(child) or get_value(child) != value:
+                return _MISSING
+        return value
+
+    def _compact_ancestors(self, code):
+        """ Merge the ancestors of the node `code` for as long as all of
+        their children are leaves with the same value
+        """
+        dimensions = self.DIMENSIONS
+        storage = self._storage
+        while code != 1:
+            code >>= dimensions
+            handle, found_code = self._find_code(code)
+            if found_code != code or storage.is_leaf(handle):
+                return
+            value = self._get_uniform_children_value(handle)
+            if value is _MISSING:
+                return
+            self._merge_handle(handle, code)
+            storage.set_value(handle, value)
+            self._notify_change(code, True)
+
+    def compact(self):
+        """ Collapse every subtree whose leaves all have the same value into
+        a single leaf with that value.
+
+        Storages that support it are also defragmented to release the
+        memory of the removed nodes (see `AbstractTreeStorage.defragment`)
+        so all existing proxies and storage handles are invalidated.
+
+        Each merged node is reported to the change listeners.
+
+        Returns:
+            int: the number of branch nodes that were merged
+        """
+        storage = self._storage
+        get_children = storage.get_children
+        dimensions = self.DIMENSIONS
+        merged_codes = []
+
+        # post order walk so children are compacted before their parents
+        stack = [(self._data, 1, False)]
+        while stack:
+            handle, code, children_done = stack.pop()
+            children = get_children(handle)
+            if children is None:
+                continue
+            if not children_done:
+                stack.append((handle, code, True))
+                base_code = code << dimensions
+                stack.extend((child, base_code | index, False) for index, child in enumerate(children))
+                continue
+            value = self._get_uniform_children_value(handle)
+            if value is not _MISSING:
+                self._merge_handle(handle, code)
+                storage.set_value(handle, value)
+                merged_codes.append(code)
+
+        self._data = storage.defragment(self._data)
+        if self._code_index is not None:
+            self.build_code_index()
+        self._invalidate_all_proxies()
+
+        # children are merged before their parents so only report the
+        # outermost merged nodes
+        merged_codes_set = set(merged_codes)
+        for code in merged_codes:
+            parent_code = code >> dimensions
+            if parent_code not in merged_codes_set:
+                self._notify_change(code, True)
+        return len(merged_codes)
+
+    def _get_dimension_masks(self, depth):
+        # type: (int) -> Tuple[int, ...]
+        """ Get masks of the bits of a code at `depth` that belong to each
+        dimension
+        """
+        try:
+            return self._dimension_masks[depth]
+        except KeyError:
+            pass
+        base = 0
+        for level in range(depth):
+            base |= 1 << (level * self.DIMENSIONS)
+        masks = self._dimension_masks[depth] = tuple(base << i for i in range(self.DIMENSIONS))
+        return masks
+
+    def get_neighbor_code(self, code, direction):
+        # type: (int, Sequence[int]) -> Optional[int]
+        """ Get the code of the node at the same depth as `code` that is
+        adjacent to it in a direction.
+
+        The neighbor is found by incrementing/decrementing the bits of each
+        dimension in place (dilated integer arithmetic) so the cost does not
+        depend on how far the common ancestor is.
+
+        Args:
+            code (int): a locational code (see `point_to_code`)
+            direction (Sequence[int]): -1, 0 or 1 for each dimension
+
+        Returns:
+            Optional[int]: None if the neighbor would be outside of the tree
+        """
+        masks = self._get_dimension_masks(self.get_code_depth(code))
+        for i, step in enumerate(direction):
+            if not step:
+                continue
+            mask = masks[i]
+            bits = code & mask
+            if step > 0:
+                if bits == mask:
+                    return None
+                bits = ((bits | ~mask) + 1) & mask
             else:
-                return False
+                if not bits:
+                    return None
+                bits = (bits - 1) & mask
+            code = (code & ~mask) | bits
+        return code
 
-        half_size = self.size / 2.0
-        for i in xrange(self.DIMENSIONS):
-            if abs(point[i]) > half_size:
+    def get_leaf_neighbors(self, directions=None):
+        """ Find the same-or-larger neighbor of every leaf at once
+
+        All of the neighbor lookups for a direction are done with a single
+        vectorized descent (see `get_nodes_from_points`).
+
+        Args:
+            directions (Optional[Sequence[Sequence[int]]]): the directions
+                to find neighbors in. Defaults to `face_directions`.
+
+        Returns:
+            Tuple[List[TreeNodeInfo], numpy.ndarray, numpy.ndarray]: the
+                leaves in `iter_leaves` order, the storage handle of each
+                leaf's neighbor in each direction (NULL outside of the tree)
+                and the index into the leaves of each neighbor (-1 if it is
+                outside of the tree or is a branch).  Both arrays have the
+                shape ``(len(leaves), len(directions))``.
+        """
+        directions = directions if directions is not None else self.face_directions
+        storage = self._storage
+        leaves = list(self.iter_leaves())
+        cells, depths = self._get_leaf_cells(leaves)
+        handles = self._get_neighbor_handles(cells, depths, directions)
+
+        leaf_handles = numpy.empty(len(leaves), dtype=storage.HANDLE_DTYPE)
+        for i, leaf in enumerate(leaves):
+            leaf_handles[i] = leaf.handle
+        return leaves, handles, self._get_handle_indexes(handles, leaf_handles)
+
+    def _get_neighbor_handles(self, cells, depths, directions):
+        # type: (numpy.ndarray, numpy.ndarray, Sequence[Sequence[int]]) -> numpy.ndarray
+        """ Find the same-or-larger neighbor of nodes in each direction
+
+        Args:
+            cells (numpy.ndarray): (N, DIMENSIONS) minimum corner cell of
+                each node at the max depth
+            depths (numpy.ndarray): (N,) depth of each node
+            directions (Sequence[Sequence[int]])
+
+        Returns:
+            numpy.ndarray: (N, len(directions)) storage handles (NULL
+                outside of the tree)
+        """
+        storage = self._storage
+        max_depth = self.max_depth
+        num_cells = 1 << max_depth
+        cell_sizes = (numpy.int64(1) << (max_depth - depths))[:, numpy.newaxis]
+        handles = numpy.empty((len(cells), len(directions)), dtype=storage.HANDLE_DTYPE)
+        for i, direction in enumerate(directions):
+            neighbor_cells = cells + numpy.array(direction, dtype=numpy.int64) * cell_sizes
+            inside = numpy.all((neighbor_cells >= 0) & (neighbor_cells < num_cells), axis=1)
+            numpy.clip(neighbor_cells, 0, num_cells - 1, out=neighbor_cells)
+            direction_handles, _ = self._descend_batch(neighbor_cells, max_depth, depths)
+            direction_handles[~inside] = storage.NULL
+            handles[:, i] = direction_handles
+        return handles
+
+    def _get_leaf_arrays(self):
+        # type: () -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]
+        """ Find every leaf with one batch of storage lookups per level
+        rather than walking the tree node by node like `iter_leaves`
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]: the storage
+                handle, minimum corner cell at the max depth and depth of
+                each leaf, in level order
+        """
+        storage = self._storage
+        max_depth = self.max_depth
+        num_children = self.num_children
+        child_offsets = numpy.array([
+            [bool(index & bit) for bit in self.dimension_bits]
+            for index in range(num_children)
+        ], dtype=numpy.int64)
+        child_indexes = numpy.arange(num_children)
+
+        handles = storage.create_handle_array(self._data, 1)
+        cells = numpy.zeros((1, self.DIMENSIONS), dtype=numpy.int64)
+        leaf_handles = []
+        leaf_cells = []
+        leaf_depths = []
+        for depth in range(max_depth + 1):
+            is_leaf = storage.is_leaf_batch(handles)
+            leaf_handles.append(handles[is_leaf])
+            leaf_cells.append(cells[is_leaf])
+            leaf_depths.append(numpy.full(len(leaf_cells[-1]), depth, dtype=numpy.int64))
+            is_branch = ~is_leaf
+            if depth == max_depth or not is_branch.any():
+                break
+            branch_count = int(is_branch.sum())
+            handles = storage.get_child_batch(
+                numpy.repeat(handles[is_branch], num_children),
+                numpy.tile(child_indexes, branch_count))
+            child_cells = child_offsets << (max_depth - depth - 1)
+            cells = (cells[is_branch, numpy.newaxis, :] + child_cells).reshape(-1, self.DIMENSIONS)
+        return numpy.concatenate(leaf_handles), numpy.concatenate(leaf_cells), numpy.concatenate(leaf_depths)
+
+    def _get_leaf_cells(self, leaves):
+        # type: (Sequence[TreeNodeInfo]) -> Tuple[numpy.ndarray, numpy.ndarray]
+        """ Get the minimum corner cell at the max depth and the depth of
+        each of `leaves`
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.ndarray]: (N, DIMENSIONS) integer
+                cells and (N,) depths
+        """
+        origins = numpy.array([leaf.origin for leaf in leaves], dtype=float).reshape(-1, self.DIMENSIONS)
+        sizes = numpy.array([leaf.size for leaf in leaves], dtype=float)
+        depths = numpy.array([leaf.depth for leaf in leaves], dtype=numpy.int64)
+        corners = origins + (self.size / 2.0) - (sizes / 2.0)[:, numpy.newaxis]
+        cells = numpy.rint(corners / self.min_size).astype(numpy.int64)
+        return cells, depths
+
+    def _get_handle_indexes(self, handles, lookup_handles):
+        # type: (numpy.ndarray, numpy.ndarray) -> numpy.ndarray
+        """ Get the index of each of `handles` in `lookup_handles` or -1 if
+        it is not in `lookup_handles`
+        """
+        if numpy.dtype(self._storage.HANDLE_DTYPE).hasobject:
+            index_by_handle = dict((handle, i) for i, handle in enumerate(lookup_handles))
+            indexes = [index_by_handle.get(handle, -1) for handle in handles.flat]
+            return numpy.array(indexes, dtype=numpy.int64).reshape(handles.shape)
+
+        if not handles.size or not lookup_handles.size:
+            return numpy.full(handles.shape, -1, dtype=numpy.int64)
+        lookup = numpy.full(max(handles.max(), lookup_handles.max()) + 1, -1, dtype=numpy.int64)
+        lookup[lookup_handles] = numpy.arange(len(lookup_handles))
+        return numpy.where(handles >= 0, lookup[handles], -1)
+
+    def iter_nodes(self, bbox=None, max_depth=None):
+        # type: (Optional[BoundingBox], Optional[int]) -> Iterator[TreeNodeInfo]
+        """ Iterate over the nodes of the tree in depth first order without
+        creating any `TreeNode` proxies.
+
+        The origin and size of each node are computed incrementally from its
+        parent.  If a yielded leaf is split before the iteration continues
+        then its new children are visited too.
+
+        Args:
+            bbox (Optional[AbstractBoundingBox]): only visit nodes that
+                intersect or touch this bounding box
+            max_depth (Optional[int]): do not visit nodes deeper than this
+
+        Yields:
+            TreeNodeInfo
+        """
+        classify = self._get_box_classifier(bbox) if bbox is not None else None
+        return self._iter_nodes(classify, max_depth, leaves_only=False)
+
+    def iter_leaves(self, bbox=None, max_depth=None):
+        # type: (Optional[BoundingBox], Optional[int]) -> Iterator[TreeNodeInfo]
+        """ Same as `iter_nodes` but only yields leaf nodes.
+
+        Branch nodes at `max_depth` are yielded as if they were leaves.
+        """
+        classify = self._get_box_classifier(bbox) if bbox is not None else None
+        return self._iter_nodes(classify, max_depth, leaves_only=True)
+
+    def query_box(self, bbox, inclusive=None, whole_subtrees=False, max_depth=None):
+        # type: (BoundingBox, Optional[Sequence[int]], bool, Optional[int]) -> List[TreeNodeInfo]
+        """ Get the leaves that intersect a bounding box
+
+        Args:
+            bbox (AbstractBoundingBox)
+            inclusive (Optional[Sequence[int]]): the dimensions in which
+                nodes that only touch `bbox` are considered intersecting
+                (see `AbstractBoundingBox.collides`). Defaults to all
+                dimensions.
+            whole_subtrees (bool): return branch nodes that are entirely
+                inside of `bbox` instead of descending into them
+            max_depth (Optional[int]): branch nodes at this depth are
+                returned as if they were leaves
+
+        Returns:
+            List[TreeNodeInfo]
+        """
+        classify = self._get_box_classifier(bbox, inclusive)
+        return list(self._iter_nodes(classify, max_depth, leaves_only=True, whole_subtrees=whole_subtrees))
+
+    def query_sphere(self, center, radius, whole_subtrees=False, max_depth=None):
+        # type: (Point, float, bool, Optional[int]) -> List[TreeNodeInfo]
+        """ Get the leaves that intersect a sphere (or circle for 2D trees)
+
+        See `query_box` for a description of the arguments.
+
+        Returns:
+            List[TreeNodeInfo]
+        """
+        classify = self._get_sphere_classifier(center, radius)
+        return list(self._iter_nodes(classify, max_depth, leaves_only=True, whole_subtrees=whole_subtrees))
+
+    def query_frustum(self, planes, whole_subtrees=False, max_depth=None):
+        # type: (Sequence[Sequence[float]], bool, Optional[int]) -> List[TreeNodeInfo]
+        """ Get the leaves that are at least partially inside of a convex
+        volume (e.g. a camera's view frustum) described by planes.
+
+        See `query_box` for a description of the other arguments.
+
+        Args:
+            planes (Sequence[Sequence[float]]): ``(a, b, c, d)`` coefficients
+                (one normal component per dimension followed by the offset)
+                of each plane. Points with ``a*x + b*y + c*z + d >= 0`` are
+                inside of the plane. See `Matrix.get_frustum_planes`.
+
+        Returns:
+            List[TreeNodeInfo]
+        """
+        classify = self._get_planes_classifier(planes)
+        return list(self._iter_nodes(classify, max_depth, leaves_only=True, whole_subtrees=whole_subtrees))
+
+    def query_box_extents(self, bbox, predicate=None, inclusive=None):
+        # type: (BoundingBox, Optional[Callable[[numpy.ndarray], numpy.ndarray]], Optional[Sequence[int]]) -> Tuple[numpy.ndarray, numpy.ndarray]
+        """ Get the extents of the leaves that intersect a bounding box as
+        arrays, e.g. for `sweep_box`
+
+        This is meant for small boxes that are queried every frame so the
+        walk works on integer cells and starts from the deepest node that
+        contains the whole box.  No `TreeNodeInfo` tuples are created.
+
+        Args:
+            bbox (AbstractBoundingBox)
+            predicate (Optional[Callable[[numpy.ndarray], numpy.ndarray]]):
+                gets which leaves to include from an array of their values.
+                Defaults to non-zero values.
+            inclusive (Optional[Sequence[int]]): see `query_box`
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.ndarray]: (N, DIMENSIONS) arrays of
+                the minimums and maximums of the leaves
+        """
+        dimensions = self.DIMENSIONS
+        dimension_range = range(dimensions)
+        depth = self.max_depth
+        num_cells = 1 << depth
+        half_tree_size = self.size / 2.0
+        scale = num_cells / self.size
+        empty = numpy.empty((0, dimensions))
+
+        # the range of cells at the max depth that the box covers or touches
+        # (with some tolerance for rounding).  Leaves that only touch the box
+        # are filtered out below.
+        cell_min = []
+        cell_max = []
+        for i in dimension_range:
+            low = int(math.ceil((bbox._min[i] + half_tree_size) * scale - _CELL_TOLERANCE)) - 1
+            high = int(math.floor((bbox._max[i] + half_tree_size) * scale + _CELL_TOLERANCE))
+            low = max(low, 0)
+            high = min(high, num_cells - 1)
+            if low > high:
+                return empty, empty.copy()
+            cell_min.append(low)
+            cell_max.append(high)
+
+        # start from the deepest node that contains all of the cells
+        storage = self._storage
+        is_leaf = storage.is_leaf
+        handle = self._data
+        node_depth = 0
+        while node_depth < depth and not is_leaf(handle):
+            shift = depth - 1 - node_depth
+            index = 0
+            for i in dimension_range:
+                bit = (cell_min[i] >> shift) & 1
+                if bit != (cell_max[i] >> shift) & 1:
+                    break
+                index |= bit << i
+            else:
+                handle = storage.get_child(handle, index)
+                node_depth += 1
+                continue
+            break
+        node_size = num_cells >> node_depth
+        node_low = [(cell_min[i] >> (depth - node_depth)) << (depth - node_depth) for i in dimension_range]
+
+        get_children = storage.get_children
+        child_bits = [[(index >> i) & 1 for i in dimension_range] for index in range(self.num_children)]
+        lows = []
+        sizes = []
+        handles = []
+        stack = [(handle, node_low, node_size)]
+        while stack:
+            handle, low, size = stack.pop()
+            if size == 1 or is_leaf(handle):
+                lows.append(low)
+                sizes.append(size)
+                handles.append(handle)
+                continue
+            half = size >> 1
+            for child, bits in zip(get_children(handle), child_bits):
+                child_low = [low[i] + half * bits[i] for i in dimension_range]
+                for i in dimension_range:
+                    if child_low[i] > cell_max[i] or child_low[i] + half <= cell_min[i]:
+                        break
+                else:
+                    stack.append((child, child_low, half))
+
+        # same comparisons as `_get_box_classifier`
+        cell_size = self.size / num_cells
+        mins = numpy.array(lows, dtype=float) * cell_size - half_tree_size
+        maxs = mins + (numpy.array(sizes, dtype=float) * cell_size)[:, numpy.newaxis]
+        bbox_min = numpy.array([bbox._min[i] for i in dimension_range])
+        bbox_max = numpy.array([bbox._max[i] for i in dimension_range])
+        include = (mins <= bbox_max) & (maxs >= bbox_min)
+        if inclusive is not None:
+            exclusive = [i for i in dimension_range if i not in inclusive]
+            include[:, exclusive] &= (mins[:, exclusive] < bbox_max[exclusive]) & (maxs[:, exclusive] > bbox_min[exclusive])
+        include = include.all(axis=1)
+
+        if predicate is None:
+            predicate = lambda values: values != 0
+        handle_array = storage.create_handle_array(storage.NULL, len(handles))
+        handle_array[:] = handles
+        include &= numpy.asarray(predicate(storage.get_value_batch(handle_array)), dtype=bool)
+        return mins[include], maxs[include]
+
+    def _get_ray_cell_space(self, origins, directions):
+        """ Convert rays to the space of the cells at the tree's max depth
+        where the tree spans ``[0, 2**max_depth]`` along each dimension
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]: the origins
+                and the (unit length) directions in cell space and the
+                directions in world space
+        """
+        origins = numpy.asarray(origins, dtype=float)[..., :self.DIMENSIONS]
+        directions = numpy.asarray(directions, dtype=float)[..., :self.DIMENSIONS]
+        lengths = numpy.sqrt((directions * directions).sum(axis=-1))
+        if numpy.any(lengths == 0.0):
+            raise ValueError('ray directions must not be zero length')
+        directions = directions / lengths[..., numpy.newaxis]
+        scale = (1 << self.max_depth) / self.size
+        return (origins + self.size / 2.0) * scale, directions * scale, directions
+
+    def cast_ray(self, origin, direction, max_distance=None, predicate=bool):
+        # type: (Sequence[float], Sequence[float], Optional[float], Callable[[Any], bool]) -> Optional[RaycastHit]
+        """ Find the first leaf hit by a ray
+
+        The ray steps from leaf to leaf so large uniform leaves are crossed
+        in a single step no matter how many cells they cover.
+
+        Args:
+            origin (Sequence[float])
+            direction (Sequence[float]): does not need to be normalized
+            max_distance (Optional[float]): ignore leaves further than this
+            predicate (Callable[[Any], bool]): gets whether the ray hits a
+                leaf with the given value.  Defaults to non-zero values.
+
+        Returns:
+            Optional[RaycastHit]: None if nothing was hit
+        """
+        dimensions = self.DIMENSIONS
+        dimension_range = range(dimensions)
+        depth = self.max_depth
+        num_cells = 1 << depth
+        u0, du, world_direction = self._get_ray_cell_space(origin, direction)
+        u0 = u0.tolist()
+        du = du.tolist()
+        world_direction = world_direction.tolist()
+        scale = num_cells / self.size
+
+        # clip the ray to the tree
+        t = 0.0
+        t_max = float('inf') if max_distance is None else max_distance
+        axis = None
+        bound = None
+        for i in dimension_range:
+            if du[i] == 0.0:
+                if u0[i] < 0.0 or u0[i] >= num_cells:
+                    return None
+                continue
+            t1 = -u0[i] / du[i]
+            t2 = (num_cells - u0[i]) / du[i]
+            if t1 > t2:
+                t1, t2 = t2, t1
+            if t1 > t:
+                t = t1
+                axis = i
+                bound = 0.0 if du[i] > 0.0 else float(num_cells)
+            if t2 < t_max:
+                t_max = t2
+        if t >= t_max:
+            return None
+
+        storage = self._storage
+        coords = [0] * dimensions
+        while True:
+            # find the cell at t.  Rays on a cell boundary belong to the
+            # cell they are moving into
+            for i in dimension_range:
+                if i == axis:
+                    u = bound
+                else:
+                    u = u0[i] + du[i] * t
+                if du[i] >= 0.0:
+                    coord = int(math.floor(u))
+                else:
+                    coord = int(math.ceil(u)) - 1
+                coords[i] = min(max(coord, 0), num_cells - 1)
+
+            handle, leaf_depth = self._descend(coords, depth)
+            value = storage.get_value(handle)
+            shift = depth - leaf_depth
+            if predicate(value):
+                normal = [0.0] * dimensions
+                if axis is not None:
+                    normal[axis] = -1.0 if du[axis] > 0.0 else 1.0
+                leaf_coords = [coord >> shift for coord in coords]
+                leaf_size = float(1 << shift)
+                leaf_origin = tuple((coord + 0.5) * leaf_size / scale - self.size / 2.0 for coord in leaf_coords)
+                info = TreeNodeInfo(
+                    value, leaf_origin, leaf_size / scale, leaf_depth,
+                    self.coords_to_code(leaf_coords, leaf_depth), handle, storage.is_leaf(handle),
+                )
+                point = tuple(origin[i] + world_direction[i] * t for i in dimension_range)
+                return RaycastHit(info, point, tuple(normal), t)
+
+            # step to the next leaf
+            leaf_size = 1 << shift
+            t_exit = float('inf')
+            for i in dimension_range:
+                if du[i] == 0.0:
+                    continue
+                low = (coords[i] >> shift) << shift
+                this_bound = low + leaf_size if du[i] > 0.0 else low
+                this_t = (this_bound - u0[i]) / du[i]
+                if this_t < t_exit:
+                    t_exit = this_t
+                    axis = i
+                    bound = float(this_bound)
+            if t_exit >= t_max or bound <= 0.0 or bound >= num_cells:
                 return None
+            t = t_exit
+
+    def cast_rays(self, origins, directions, max_distances=None, predicate=None):
+        # type: (numpy.ndarray, numpy.ndarray, Optional[Union[float, numpy.ndarray]], Optional[Callable[[numpy.ndarray], numpy.ndarray]]) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]
+        """ Batch version of `cast_ray`
+
+        All rays step through the tree together so the cost is a few numpy
+        operations per leaf crossed by the longest ray.
+
+        Args:
+            origins (numpy.ndarray): (N, DIMENSIONS) origins
+            directions (numpy.ndarray): (N, DIMENSIONS) directions
+            max_distances (Optional[Union[float, numpy.ndarray]]): a single
+                maximum distance or one per ray
+            predicate (Optional[Callable[[numpy.ndarray], numpy.ndarray]]):
+                gets whether the ray hits each leaf value of an array.
+                Defaults to non-zero values.
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]: the distance
+                to the hit leaf (inf for rays that don't hit anything), the
+                (N, DIMENSIONS) normal of the face that was hit and the
+                storage handle of the hit leaf (NULL for misses)
+        """
+        storage = self._storage
+        depth = self.max_depth
+        num_cells = 1 << depth
+        u0, du, _ = self._get_ray_cell_space(origins, directions)
+        count, dimensions = u0.shape
+        rows = numpy.arange(count)
+        if max_distances is None:
+            max_distances = float('inf')
+
+        distances = numpy.full(count, numpy.inf)
+        normals = numpy.zeros((count, dimensions))
+        handles = storage.create_handle_array(storage.NULL, count)
+        if predicate is None:
+            predicate = lambda values: values != 0
+
+        # clip the rays to the tree
+        moving = du != 0.0
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            t1 = numpy.where(moving, -u0 / du, -numpy.inf)
+            t2 = numpy.where(moving, (num_cells - u0) / du, numpy.inf)
+        t_near = numpy.minimum(t1, t2)
+        t_far = numpy.maximum(t1, t2)
+        outside = ~moving & ((u0 < 0.0) | (u0 >= num_cells))
+        axis = t_near.argmax(axis=1)
+        t = numpy.maximum(t_near[rows, axis], 0.0)
+        t_max = numpy.minimum(t_far.min(axis=1), max_distances)
+        axis = numpy.where(t_near[rows, axis] > 0.0, axis, -1)
+        bound = numpy.where(du[rows, axis] > 0.0, 0.0, float(num_cells))
+
+        active = rows[~outside.any(axis=1) & (t < t_max)]
+        while len(active):
+            a_u0 = u0[active]
+            a_du = du[active]
+            a_t = t[active]
+            a_axis = axis[active]
+
+            # find the cell at t
+            u = a_u0 + a_du * a_t[:, numpy.newaxis]
+            on_bound = numpy.flatnonzero(a_axis >= 0)
+            u[on_bound, a_axis[on_bound]] = bound[active[on_bound]]
+            coords = numpy.where(a_du >= 0.0, numpy.floor(u), numpy.ceil(u) - 1).astype(numpy.int64)
+            numpy.clip(coords, 0, num_cells - 1, out=coords)
 
-        node = self._create_node_proxy(self._data, parent=None, index=0)
-        depth = 0
+            leaf_handles, leaf_depths = self._descend_batch(coords, depth)
+            hit = numpy.asarray(predicate(storage.get_value_batch(leaf_handles)), dtype=bool)
+            if hit.any():
+                hit_rows = active[hit]
+                distances[hit_rows] = a_t[hit]
+                handles[hit_rows] = leaf_handles[hit]
+                hit_axis = a_axis[hit]
+                entered = hit_axis >= 0
+                normals[hit_rows[entered], hit_axis[entered]] = -numpy.sign(a_du[hit][entered, hit_axis[entered]])
+
+            # step the other rays to their next leaf
+            miss = ~hit
+            active = active[miss]
+            a_u0 = a_u0[miss]
+            a_du = a_du[miss]
+            coords = coords[miss]
+            shifts = (depth - leaf_depths[miss])[:, numpy.newaxis]
+            low = (coords >> shifts) << shifts
+            bounds = numpy.where(a_du > 0.0, low + (1 << shifts), low).astype(float)
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                exit_t = numpy.where(a_du != 0.0, (bounds - a_u0) / a_du, numpy.inf)
+            exit_axis = exit_t.argmin(axis=1)
+            miss_rows = numpy.arange(len(active))
+            exit_t = exit_t[miss_rows, exit_axis]
+            exit_bound = bounds[miss_rows, exit_axis]
+
+            t[active] = exit_t
+            axis[active] = exit_axis
+            bound[active] = exit_bound
+            active = active[(exit_t < t_max[active]) & (exit_bound > 0.0) & (exit_bound < num_cells)]
+        return distances, normals, handles
+
+    def _get_box_classifier(self, bbox, inclusive=None):
+        """ Get a function that classifies nodes against a bounding box
+
+        Node classifier functions take a node's origin tuple and half size
+        and return whether the node is `_OUTSIDE`, `_INSIDE` or
+        `_INTERSECTS` the query region.
+        """
+        dimension_range = range(self.DIMENSIONS)
+        bbox_min = tuple(bbox._min[i] for i in dimension_range)
+        bbox_max = tuple(bbox._max[i] for i in dimension_range)
+        exclusive = tuple(inclusive is not None and i not in inclusive for i in dimension_range)
+
+        def classify(origin, half_size):
+            result = _INSIDE
+            for i in dimension_range:
+                node_min = origin[i] - half_size
+                node_max = origin[i] + half_size
+                if node_min > bbox_max[i] or node_max < bbox_min[i]:
+                    return _OUTSIDE
+                if exclusive[i] and (node_min == bbox_max[i] or node_max == bbox_min[i]):
+                    return _OUTSIDE
+                if node_min < bbox_min[i] or node_max > bbox_max[i]:
+                    result = _INTERSECTS
+            return result
+        return classify
+
+    def _get_sphere_classifier(self, center, radius):
+        """ Get a function that classifies nodes against a sphere
+        """
+        dimension_range = range(self.DIMENSIONS)
+        center = tuple(center[i] for i in dimension_range)
+        radius_squared = radius * radius
+
+        def classify(origin, half_size):
+            nearest = 0.0
+            farthest = 0.0
+            for i in dimension_range:
+                distance = abs(center[i] - origin[i])
+                if distance > half_size:
+                    nearest += (distance - half_size) ** 2
+                farthest += (distance + half_size) ** 2
+            if nearest > radius_squared:
+                return _OUTSIDE
+            if farthest <= radius_squared:
+                return _INSIDE
+            return _INTERSECTS
+        return classify
+
+    def _get_planes_classifier(self, planes):
+        """ Get a function that classifies nodes against a convex volume
+        """
+        dimensions = self.DIMENSIONS
+        dimension_range = range(dimensions)
+        # each plane's normal and offset along with the sum of the absolute
+        # values of its normal which scaled by a node's half size gives the
+        # node's extent along the normal
+        planes = [
+            (tuple(plane[i] for i in dimension_range), plane[dimensions], sum(abs(plane[i]) for i in dimension_range))
+            for plane in planes
+        ]
+
+        def classify(origin, half_size):
+            result = _INSIDE
+            for normal, offset, extent in planes:
+                distance = offset
+                for i in dimension_range:
+                    distance += normal[i] * origin[i]
+                extent *= half_size
+                if distance < -extent:
+                    return _OUTSIDE
+                if distance < extent:
+                    result = _INTERSECTS
+            return result
+        return classify
+
+    def _iter_nodes(self, classify, max_depth, leaves_only, whole_subtrees=False):
+        """ Walk the tree without creating proxies
+
+        Args:
+            classify (Optional[Callable[[Tuple[float, ...], float], int]]):
+                node classifier used to prune the walk (see
+                `_get_box_classifier`). Children of nodes that are entirely
+                inside of the query region are not classified.
+            max_depth (Optional[int])
+            leaves_only (bool): only yield leaves (and branches at `max_depth`)
+            whole_subtrees (bool): yield branches that are entirely inside of
+                the query region instead of descending into them
+
+        Yields:
+            TreeNodeInfo
+        """
+        storage = self._storage
+        get_value = storage.get_value
+        get_children = storage.get_children
+        is_leaf = storage.is_leaf
+        dimensions = self.DIMENSIONS
         max_depth = max_depth if max_depth is not None else self.max_depth
-        while depth < max_depth:
-            if node_matches():
-                return node
-            node = node.get_closest_child(point)
-            depth += 1
+        child_indexes = range(self.num_children - 1, -1, -1)
+
+        # offset of each child's origin from its parent's origin keyed by
+        # the child's depth
+        child_offsets = {}  # type: Dict[int, List[Tuple[float, ...]]]
+
+        stack = [(self._data, (0.0,) * dimensions, self.size, 0, 1, classify is None)]
+        while stack:
+            handle, origin, size, depth, code, inside = stack.pop()
+            if not inside:
+                classification = classify(origin, size / 2.0)
+                if classification == _OUTSIDE:
+                    continue
+                inside = classification == _INSIDE
+
+            leaf = is_leaf(handle)
+            stop = depth >= max_depth or (whole_subtrees and inside and classify is not None)
+            if not leaves_only or leaf or stop:
+                yield TreeNodeInfo(get_value(handle), origin, size, depth, code, handle, leaf)
+            if stop:
+                continue
+            children = get_children(handle)
+            if children is None:
+                continue
+
+            child_depth = depth + 1
+            try:
+                offsets = child_offsets[child_depth]
+            except KeyError:
+                quarter_size = size / 4.0
+                offsets = child_offsets[child_depth] = [
+                    tuple(quarter_size if index & bit else -quarter_size for bit in self.dimension_bits)
+                    for index in range(self.num_children)
+                ]
+            child_size = size / 2.0
+            child_code = code << dimensions
+            for index in child_indexes:
+                child_origin = tuple(map(operator.add, origin, offsets[index]))
+                stack.append((children[index], child_origin, child_size, child_depth, child_code | index, inside))
+
+
+class TreeChangeTracker(object):
+    """ Collects the regions of a tree that changed since they were last
+    collected, e.g. to find the parts of a mesh that need to be rebuilt.
+
+    Regions are reported as the locational codes of the nodes that changed
+    so a change to a large leaf covers its whole cell while a change deep in
+    the tree only covers a small one.
+
+    Call `close` when the tracker is no longer needed so the tree stops
+    reporting changes to it.
+    """
+    def __init__(self, tree):
+        # type: (AbstractTree) -> None
+        self.tree = tree
+        self._codes = set()  # type: Set[int]
+        tree.add_change_listener(self._on_change)
+
+    def _on_change(self, code, structural):
+        # type: (int, bool) -> None
+        self._codes.add(code)
+
+    def is_dirty(self):
+        """ Return whether anything changed since the last `pop_dirty_codes`
+
+        Returns:
+            bool
+        """
+        return bool(self._codes)
+
+    def pop_dirty_codes(self):
+        """ Get the codes of the changed nodes and start collecting again
+
+        Codes inside of another changed node's cell are left out.
+
+        Returns:
+            List[int]: sorted from the largest to the smallest region
+        """
+        codes = sorted(self._codes, key=lambda code: (code.bit_length(), code))
+        self._codes = set()
+        dimensions = self.tree.DIMENSIONS
+        result = []
+        result_set = set()
+        for code in codes:
+            ancestor_code = code >> dimensions
+            while ancestor_code and ancestor_code not in result_set:
+                ancestor_code >>= dimensions
+            if not ancestor_code:
+                result.append(code)
+                result_set.add(code)
+        return result
+
+    def close(self):
+        self.tree.remove_change_listener(self._on_change)
+
+
+# sentinel for missing dictionary keys since storage handles can be None
+_MISSING = object()
+
+# node classifications returned by the functions used to prune tree walks
+_OUTSIDE = 0
+_INTERSECTS = 1
+_INSIDE = 2
+
+# tolerance (in cells) used when converting query boxes to ranges of cells
+_CELL_TOLERANCE = 1e-6
+
+# cache of tables used to spread the bits of a byte so that there are
+# (dimensions - 1) zero bits between each bit.  keyed by dimensions
+_SPREAD_TABLES = {}
 
-        return node
 
+def _get_spread_table(dimensions):
+    # type: (int) -> Tuple[int, ...]
+    try:
+        return _SPREAD_TABLES[dimensions]
+    except KeyError:
+        pass
+    table = []
+    for byte in range(256):
+        spread = 0
+        for bit in range(8):
+            if byte & (1 << bit):
+                spread |= 1 << (bit * dimensions)
+        table.append(spread)
+    _SPREAD_TABLES[dimensions] = table = tuple(table)
+    return table
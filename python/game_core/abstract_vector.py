@@ -1,12 +1,32 @@
-__all__ = ['AbstractVector']
+__all__ = ['AbstractVector', 'AbstractVectorArray', 'VectorPool']
 
 import numpy
+from typing import List
 
 
 class AbstractVector(object):
+    """ Base class for 3D points and vectors.
+
+    The binary operators (``+``, ``-``, ...) return new objects.  Hot loops
+    that run every frame should use the in-place operators or the
+    ``*_into`` methods with objects from a `VectorPool` instead so that they
+    don't allocate.
+    """
+    __slots__ = ('_data', )
+
     def __init__(self, x=0.0, y=0.0, z=0.0):
         self._data = [float(x), float(y), float(z)]
 
+    @classmethod
+    def _from_data(cls, data):
+        # type: (List[float]) -> AbstractVector
+        """ Create a vector that takes ownership of a list of 3 floats
+        without converting them
+        """
+        result = object.__new__(cls)
+        result._data = data
+        return result
+
     @classmethod
     def cast(cls, other):
         if isinstance(other, cls):
@@ -17,31 +37,102 @@ class AbstractVector(object):
             return cls(other)
 
     def copy(self):
-        return type(self)(*self._data)
+        return self._from_data(self._data[:])
+
+    def set(self, x, y, z):
+        """ Set all components in place
+
+        Returns:
+            AbstractVector: this vector
+        """
+        data = self._data
+        data[0] = x
+        data[1] = y
+        data[2] = z
+        return self
+
+    def copy_from(self, other):
+        """ Set all components from another vector in place
+
+        Returns:
+            AbstractVector: this vector
+        """
+        data = self._data
+        data[0] = other[0]
+        data[1] = other[1]
+        data[2] = other[2]
+        return self
+
+    def add_into(self, other, out):
+        """ Store ``self + other`` in `out`
+
+        Returns:
+            AbstractVector: `out`
+        """
+        a = self._data
+        out._data[:] = (a[0] + other[0], a[1] + other[1], a[2] + other[2])
+        return out
+
+    def sub_into(self, other, out):
+        """ Store ``self - other`` in `out`
+
+        Returns:
+            AbstractVector: `out`
+        """
+        a = self._data
+        out._data[:] = (a[0] - other[0], a[1] - other[1], a[2] - other[2])
+        return out
+
+    def scale_into(self, scalar, out):
+        """ Store ``self * scalar`` in `out`
+
+        Returns:
+            AbstractVector: `out`
+        """
+        a = self._data
+        out._data[:] = (a[0] * scalar, a[1] * scalar, a[2] * scalar)
+        return out
+
+    def madd(self, other, scalar, out=None):
+        """ Store ``self + other * scalar`` in `out`
+
+        Args:
+            other (AbstractVector)
+            scalar (float)
+            out (Optional[AbstractVector]): defaults to this vector
+
+        Returns:
+            AbstractVector: `out`
+        """
+        a = self._data
+        if out is None:
+            out = self
+        out._data[:] = (a[0] + other[0] * scalar, a[1] + other[1] * scalar, a[2] + other[2] * scalar)
+        return out
 
     @property
     def x(self):
-        return self[0]
+        return self._data[0]
 
     @x.setter
     def x(self, value):
-        self[0] = value
+        self._data[0] = float(value)
 
     @property
     def y(self):
-        return self[1]
+        return self._data[1]
 
     @y.setter
     def y(self, value):
-        self[1] = value
+        self._data[1] = float(value)
 
     @property
     def z(self):
-        return self[2]
+        return self._data[2]
 
     @z.setter
     def z(self, value):
-        self[2] = value
+        self._data[2] = float(value)
 
     @property
     def w(self):
@@ -57,32 +148,38 @@ class AbstractVector(object):
         self._data[index] = float(value)
 
     def __neg__(self):
-        return self * -1.0
+        a = self._data
+        return self._from_data([-a[0], -a[1], -a[2]])
 
     def __add__(self, other):
-        result = self.copy()
-        result += other
-        return result
+        if isinstance(other, AbstractVectorArray):
+            return NotImplemented
+        a = self._data
+        return self._from_data([a[0] + other[0], a[1] + other[1], a[2] + other[2]])
 
     def __iadd__(self, other):
-        for i in xrange(len(self)):
-            self._data[i] += other[i]
+        a = self._data
+        a[0] += other[0]
+        a[1] += other[1]
+        a[2] += other[2]
         return self
 
     def __sub__(self, other):
-        result = self.copy()
-        result -= other
-        return result
+        if isinstance(other, AbstractVectorArray):
+            return NotImplemented
+        a = self._data
+        return self._from_data([a[0] - other[0], a[1] - other[1], a[2] - other[2]])
 
     def __isub__(self, other):
-        for i in xrange(len(self)):
-            self._data[i] -= other[i]
+        a = self._data
+        a[0] -= other[0]
+        a[1] -= other[1]
+        a[2] -= other[2]
         return self
 
-    def _as_numpy_matrix(self):
-        return numpy.matrix([[self.x, self.y, self.z, self.w]], dtype=float)
-
     def __mul__(self, other):
+        if isinstance(other, AbstractVectorArray):
+            return NotImplemented
         result = self.copy()
         result *= other
         return result
@@ -90,19 +187,24 @@ class AbstractVector(object):
     # noinspection PyProtectedMember
     def __imul__(self, other):
         from . import Matrix
-        if isinstance(other, Matrix):
-            n_mat = self._as_numpy_matrix()
-            n_mat = numpy.dot(n_mat, other._data)
-            self._data = [n_mat.item(0, i) for i in xrange(3)]
+        a = self._data
+        if isinstance(other, (float, int)):
+            a[0] *= other
+            a[1] *= other
+            a[2] *= other
+        elif isinstance(other, Matrix):
+            a[:] = numpy.dot((a[0], a[1], a[2], self.w), other._data[:, :3]).tolist()
         elif hasattr(other, '__iter__'):
             for i in xrange(3):
-                self._data[i] *= other[i]
+                a[i] *= other[i]
         else:
             for i in xrange(3):
-                self._data[i] *= other
+                a[i] *= other
         return self
 
     def __div__(self, other):
+        if isinstance(other, AbstractVectorArray):
+            return NotImplemented
         result = self.copy()
         result /= other
         return result
@@ -128,8 +230,7 @@ class AbstractVector(object):
         return 3
 
     def __iter__(self):
-        for item in self._data:
-            yield item
+        return iter(self._data)
 
     def __eq__(self, other):
         # noinspection PyBroadException
@@ -147,3 +248,257 @@ class AbstractVector(object):
     def round(self, decimals=6):
         for i in xrange(len(self)):
             self._data[i] = round(self._data[i], decimals)
+
+
+class VectorPool(object):
+    """ A pool of reusable scratch vectors for code that runs every frame.
+
+    Call `reset` at the start of each frame (or other unit of work) and
+    `get` for each temporary vector needed.  Vectors are handed out again
+    after the next `reset` so they must not be kept.  Once the pool has
+    grown to the number of temporaries a frame needs it stops allocating.
+    """
+    def __init__(self, vector_cls, size=8):
+        # type: (type, int) -> None
+        self.vector_cls = vector_cls
+        self._vectors = [vector_cls() for _ in xrange(size)]
+        self._index = 0
+
+    def reset(self):
+        self._index = 0
+
+    def get(self, x=0.0, y=0.0, z=0.0):
+        """ Get a scratch vector set to the provided components
+
+        Returns:
+            AbstractVector
+        """
+        index = self._index
+        try:
+            vector = self._vectors[index]
+        except IndexError:
+            vector = self.vector_cls()
+            self._vectors.append(vector)
+        self._index = index + 1
+        data = vector._data
+        data[0] = x
+        data[1] = y
+        data[2] = z
+        return vector
+
+
+class AbstractVectorArray(object):
+    """ A packed array of 3D vectors stored as an (N, 3) numpy array.
+
+    Supports the same math as `AbstractVector` but on every vector at once.
+    The other operand of ``+``, ``-``, ``*`` and ``/`` can be another array of
+    the same length, a single vector, a number or a sequence of numbers with
+    one number per vector (use an (N, 1) array for an array of 3 vectors).
+    Multiplying by a `Matrix` transforms every
+    vector using `w` as the homogeneous coordinate (see `AbstractVector`).
+
+    Arrays can be passed anywhere numpy expects an array (e.g.
+    `AbstractTree.get_nodes_from_points`).
+
+    Indexing with an int returns a single `SCALAR_CLS` vector and indexing
+    with anything else returns a new array.
+    """
+    # Abstract: the vector class of a single item of the array
+    SCALAR_CLS = AbstractVector
+
+    # homogeneous coordinate of every vector in the array (see `AbstractVector.w`)
+    w = 0.0
+
+    def __init__(self, data=None):
+        """
+        Args:
+            data (Union[int, numpy.ndarray, Iterable[Sequence[float]]]): the
+                number of zero vectors to create or the vectors to copy
+        """
+        if data is None:
+            data = 0
+        if isinstance(data, (int, long)):
+            self._data = numpy.zeros((data, 3), dtype=float)
+            return
+        if not isinstance(data, numpy.ndarray):
+            data = [tuple(vector) for vector in data]
+        self._data = numpy.array(data, dtype=float).reshape(-1, 3)
+
+    @classmethod
+    def cast(cls, other):
+        if isinstance(other, cls):
+            return other
+        elif isinstance(other, AbstractVector):
+            return cls([other])
+        return cls(other)
+
+    def copy(self):
+        return type(self)(self._data)
+
+    @property
+    def x(self):
+        return self._data[:, 0]
+
+    @x.setter
+    def x(self, value):
+        self._data[:, 0] = value
+
+    @property
+    def y(self):
+        return self._data[:, 1]
+
+    @y.setter
+    def y(self, value):
+        self._data[:, 1] = value
+
+    @property
+    def z(self):
+        return self._data[:, 2]
+
+    @z.setter
+    def z(self, value):
+        self._data[:, 2] = value
+
+    def __array__(self, dtype=None):
+        if dtype is None:
+            return self._data
+        return self._data.astype(dtype)
+
+    def __str__(self):
+        return str(self._data)
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, self._data.tolist())
+
+    def __len__(self):
+        return len(self._data)
+
+    def __iter__(self):
+        scalar_cls = self.SCALAR_CLS
+        for x, y, z in self._data.tolist():
+            yield scalar_cls(x, y, z)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, long, numpy.integer)):
+            return self.SCALAR_CLS(*self._data[index])
+        result = type(self).__new__(type(self))
+        result._data = self._data[index].reshape(-1, 3)
+        return result
+
+    def __setitem__(self, index, value):
+        self._data[index] = self._as_operand(value)
+
+    def tolist(self):
+        return self._data.tolist()
+
+    def _as_operand(self, other):
+        """ Get `other` as something that broadcasts against the (N, 3) data
+        """
+        if isinstance(other, AbstractVectorArray):
+            return other._data
+        if isinstance(other, AbstractVector):
+            return other._data
+        other = numpy.asarray(other, dtype=float)
+        if other.ndim == 1 and len(other) != 3:
+            # one number per vector
+            return other[:, numpy.newaxis]
+        return other
+
+    def _as_vectors(self, other):
+        if isinstance(other, (AbstractVectorArray, AbstractVector)):
+            return other._data
+        return numpy.asarray(other, dtype=float)
+
+    def _new(self, data):
+        result = type(self).__new__(type(self))
+        result._data = data
+        return result
+
+    def __neg__(self):
+        return self._new(-self._data)
+
+    def __add__(self, other):
+        return self._new(self._data + self._as_operand(other))
+
+    __radd__ = __add__
+
+    def __iadd__(self, other):
+        self._data += self._as_operand(other)
+        return self
+
+    def __sub__(self, other):
+        return self._new(self._data - self._as_operand(other))
+
+    def __rsub__(self, other):
+        return self._new(self._as_operand(other) - self._data)
+
+    def __isub__(self, other):
+        self._data -= self._as_operand(other)
+        return self
+
+    def _transform(self, matrix):
+        matrix = matrix._data
+        result = numpy.dot(self._data, matrix[:3, :3])
+        w = self.w
+        if w:
+            result += w * matrix[3, :3]
+        return result
+
+    def __mul__(self, other):
+        from . import Matrix
+        if isinstance(other, Matrix):
+            return self._new(self._transform(other))
+        return self._new(self._data * self._as_operand(other))
+
+    def __rmul__(self, other):
+        return self._new(self._as_operand(other) * self._data)
+
+    def __imul__(self, other):
+        from . import Matrix
+        if isinstance(other, Matrix):
+            self._data = self._transform(other)
+        else:
+            self._data *= self._as_operand(other)
+        return self
+
+    def __div__(self, other):
+        return self._new(self._data / self._as_operand(other))
+
+    def __idiv__(self, other):
+        self._data /= self._as_operand(other)
+        return self
+
+    def __eq__(self, other):
+        """
+        Returns:
+            numpy.ndarray: whether each vector equals `other`
+        """
+        return numpy.all(self._data == self._as_operand(other), axis=1)
+
+    def __ne__(self, other):
+        return ~self.__eq__(other)
+
+    def dot(self, other):
+        """ Get the dot product of each vector with `other`
+
+        Returns:
+            numpy.ndarray
+        """
+        return numpy.einsum('ij,ij->i', self._data, numpy.broadcast_to(self._as_vectors(other), self._data.shape))
+
+    def cross(self, other):
+        """ Get the cross product of each vector with `other`
+        """
+        return self._new(numpy.cross(self._data, self._as_vectors(other)))
+
+    def norm(self):
+        """ Get the length of each vector
+
+        Returns:
+            numpy.ndarray
+        """
+        data = self._data
+        return numpy.sqrt(numpy.einsum('ij,ij->i', data, data))
+
+    def round(self, decimals=6):
+        numpy.round(self._data, decimals, out=self._data)
@@ -1,4 +1,7 @@
+import numpy
+
 from . import Point
+from .abstract_vector import AbstractVector
 
 class AbstractBoundingBox(object):
     _DIMENSIONS = None  # abstract
@@ -73,31 +76,49 @@ class AbstractBoundingBox(object):
             volume *= length
         return volume
 
-    def intersection(self, other, inclusive=[]):
+    @classmethod
+    def _from_points(cls, min_, max_):
+        """ Create a bounding box that takes ownership of its min and max
+        points without copying or validating them
+        """
+        bbox = cls()
+        bbox._min = min_
+        bbox._max = max_
+        return bbox
+
+    def intersection(self, other, inclusive=()):
         if not self.collides(other, inclusive):
             return None
-        min_ = [max(self._min[i], other._min[i]) for i in xrange(self._DIMENSIONS)]
-        max_ = [min(self._max[i], other._max[i]) for i in xrange(self._DIMENSIONS)]
-        return type(self)(min_, max_)
+        self_min = self._min._data
+        self_max = self._max._data
+        other_min = other._min._data
+        other_max = other._max._data
+        min_ = [max(a, b) for a, b in zip(self_min, other_min)]
+        max_ = [min(a, b) for a, b in zip(self_max, other_max)]
+        return self._from_points(Point._from_data(min_), Point._from_data(max_))
 
-    # TODO: fix mutable argument
     # TODO: rename BoundingBox.collides to "intersects"
-    def collides(self, other, inclusive=[]):
-        for i in xrange(self._DIMENSIONS):
-            if i in inclusive: func_suffix = 't'
-            else: func_suffix = 'e'
+    def collides(self, other, inclusive=()):
+        """ Get whether this bounding box overlaps another
 
-            if getattr(self._max[i], '__l%s__' % func_suffix)(other._min[i]): return False
-            if getattr(self._min[i], '__g%s__' % func_suffix)(other._max[i]): return False
-
-        # same as the following but with inclusive check
-        # if self._max.x <= other._min.x: return False # self is left of other
-        # if self._min.x >= other._max.x: return False # self is right of other
-        # if self._max.y <= other._min.y: return False # self is above other
-        # if self._min.y >= other._max.y: return False # self is below other
-        # if self._max.z <= other._min.z: return False # self is behind other
-        # if self._min.z >= other._max.z: return False # self is in front of other
+        Args:
+            other (AbstractBoundingBox)
+            inclusive (Sequence[int]): the dimensions in which boxes that
+                only touch are considered colliding
 
+        Returns:
+            bool
+        """
+        self_min = self._min._data
+        self_max = self._max._data
+        other_min = other._min._data
+        other_max = other._max._data
+        for i in xrange(self._DIMENSIONS):
+            if i in inclusive:
+                if self_max[i] < other_min[i] or self_min[i] > other_max[i]:
+                    return False
+            elif self_max[i] <= other_min[i] or self_min[i] >= other_max[i]:
+                return False
         return True # boxes overlap
 
     def translate(self, pos):
@@ -126,3 +147,231 @@ class BoundingBox2D(AbstractBoundingBox):
 
     def height(self):
         return self.get_dimension(1)
+
+
+class AbstractBoundingBoxArray(object):
+    """ A packed array of bounding boxes stored as (N, D) arrays of min and
+    max corners.
+
+    Supports the same tests as `AbstractBoundingBox` but on every box at
+    once.  The other operand of a test can be another array of the same
+    length (compared pairwise) or a single bounding box (compared with
+    every box).
+
+    Indexing with an int returns a single `SCALAR_CLS` bounding box and
+    indexing with anything else returns a new array.
+    """
+    # Abstract: the bounding box class of a single item of the array
+    SCALAR_CLS = AbstractBoundingBox
+
+    def __init__(self, mins=None, maxs=None):
+        """
+        Args:
+            mins (Optional[numpy.ndarray]): (N, D) min corners
+            maxs (Optional[numpy.ndarray]): (N, D) max corners
+        """
+        dimensions = self.SCALAR_CLS._DIMENSIONS
+        if mins is None:
+            mins = numpy.empty((0, dimensions))
+        if maxs is None:
+            maxs = mins
+        self._min = numpy.array(mins, dtype=float).reshape(-1, dimensions)
+        self._max = numpy.array(maxs, dtype=float).reshape(-1, dimensions)
+        if self._min.shape != self._max.shape:
+            raise ValueError('mins and maxs must have the same shape')
+
+    @classmethod
+    def from_boxes(cls, boxes):
+        """
+        Args:
+            boxes (Iterable[AbstractBoundingBox])
+
+        Returns:
+            AbstractBoundingBoxArray
+        """
+        dimensions = cls.SCALAR_CLS._DIMENSIONS
+        mins = []
+        maxs = []
+        for bbox in boxes:
+            mins.append(bbox._min._data[:dimensions])
+            maxs.append(bbox._max._data[:dimensions])
+        return cls(mins, maxs)
+
+    @classmethod
+    def from_centers(cls, centers, half_sizes):
+        """
+        Args:
+            centers (numpy.ndarray): (N, D) centers
+            half_sizes (Union[float, numpy.ndarray]): the half size of every
+                box, one per box or (N, D) half sizes per dimension
+
+        Returns:
+            AbstractBoundingBoxArray
+        """
+        centers = numpy.asarray(centers, dtype=float)
+        half_sizes = numpy.asarray(half_sizes, dtype=float)
+        if half_sizes.ndim == 1:
+            half_sizes = half_sizes[:, numpy.newaxis]
+        return cls._new(centers - half_sizes, centers + half_sizes)
+
+    @classmethod
+    def _new(cls, mins, maxs):
+        result = cls.__new__(cls)
+        result._min = mins
+        result._max = maxs
+        return result
+
+    def copy(self):
+        return self._new(self._min.copy(), self._max.copy())
+
+    def __len__(self):
+        return len(self._min)
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, long, numpy.integer)):
+            return self.SCALAR_CLS(self._min[index].tolist(), self._max[index].tolist())
+        return self._new(self._min[index].reshape(-1, self._min.shape[1]), self._max[index].reshape(-1, self._max.shape[1]))
+
+    def __str__(self):
+        return '<%s min=%s max=%s>' % (self.__class__.__name__, self._min.tolist(), self._max.tolist())
+
+    def min(self):
+        return self._min.copy()
+
+    def max(self):
+        return self._max.copy()
+
+    def get_dimension(self, index):
+        return self._max[:, index] - self._min[:, index]
+
+    def center(self):
+        return (self._min + self._max) / 2.0
+
+    def volume(self):
+        return numpy.prod(self._max - self._min, axis=1)
+
+    def _get_bounds(self, other):
+        """ Get the min and max corners of another box or array of boxes as
+        arrays that broadcast against this array's corners
+        """
+        if isinstance(other, AbstractBoundingBoxArray):
+            return other._min, other._max
+        dimensions = self._min.shape[1]
+        return numpy.array(other._min._data[:dimensions]), numpy.array(other._max._data[:dimensions])
+
+    def _get_inclusive_mask(self, inclusive):
+        """ Get a boolean mask with True for each inclusive dimension
+
+        Args:
+            inclusive (Union[Sequence[int], Sequence[bool]]): the inclusive
+                dimensions or a mask with one bool per dimension
+        """
+        dimensions = self._min.shape[1]
+        inclusive = numpy.asarray(inclusive)
+        if inclusive.dtype == bool and inclusive.shape == (dimensions, ):
+            return inclusive
+        mask = numpy.zeros(dimensions, dtype=bool)
+        mask[inclusive.astype(int)] = True
+        return mask
+
+    def collides(self, other, inclusive=()):
+        """ Get whether each box overlaps another box (see
+        `AbstractBoundingBox.collides`)
+
+        Args:
+            other (Union[AbstractBoundingBox, AbstractBoundingBoxArray])
+            inclusive (Union[Sequence[int], Sequence[bool]]): the dimensions
+                (or a mask with one bool per dimension) in which boxes that
+                only touch are considered colliding
+
+        Returns:
+            numpy.ndarray: a bool per box
+        """
+        other_min, other_max = self._get_bounds(other)
+        separated = (self._max < other_min) | (self._min > other_max)
+        exclusive = ~self._get_inclusive_mask(inclusive)
+        if exclusive.any():
+            touching = (self._max == other_min) | (self._min == other_max)
+            separated |= touching & exclusive
+        return ~separated.any(axis=1)
+
+    def intersection(self, other, inclusive=()):
+        """ Get the intersection of each box that collides with another box
+
+        Args:
+            other (Union[AbstractBoundingBox, AbstractBoundingBoxArray])
+            inclusive (Union[Sequence[int], Sequence[bool]]): see `collides`
+
+        Returns:
+            Tuple[numpy.ndarray, AbstractBoundingBoxArray]: the indexes of
+                the boxes that collide and their intersections
+        """
+        other_min, other_max = self._get_bounds(other)
+        indexes = numpy.flatnonzero(self.collides(other, inclusive))
+        if other_min.ndim == 2:
+            other_min = other_min[indexes]
+            other_max = other_max[indexes]
+        mins = numpy.maximum(self._min[indexes], other_min)
+        maxs = numpy.minimum(self._max[indexes], other_max)
+        return indexes, self._new(mins, maxs)
+
+    def union(self, other):
+        """ Get the boxes that encompass each box and another box
+
+        Args:
+            other (Union[AbstractBoundingBox, AbstractBoundingBoxArray])
+
+        Returns:
+            AbstractBoundingBoxArray
+        """
+        other_min, other_max = self._get_bounds(other)
+        return self._new(numpy.minimum(self._min, other_min), numpy.maximum(self._max, other_max))
+
+    def contains_point(self, points, inclusive=None):
+        """ Get whether each box contains a point
+
+        Args:
+            points (Union[Point, numpy.ndarray]): a single point or one
+                (N, D) point per box
+            inclusive (Optional[Union[Sequence[int], Sequence[bool]]]): the
+                dimensions (or a mask with one bool per dimension) in which
+                points on the boundary are contained.  Defaults to all
+                dimensions.
+
+        Returns:
+            numpy.ndarray: a bool per box
+        """
+        dimensions = self._min.shape[1]
+        if isinstance(points, AbstractVector):
+            points = points._data[:dimensions]
+        points = numpy.asarray(points, dtype=float)
+        outside = (points < self._min) | (points > self._max)
+        if inclusive is not None:
+            exclusive = ~self._get_inclusive_mask(inclusive)
+            if exclusive.any():
+                outside |= ((points == self._min) | (points == self._max)) & exclusive
+        return ~outside.any(axis=1)
+
+    def translate(self, offsets):
+        """
+        Args:
+            offsets (Union[Vector, numpy.ndarray]): a single offset or one
+                (N, D) offset per box
+
+        Returns:
+            AbstractBoundingBoxArray
+        """
+        offsets = numpy.asarray(offsets, dtype=float)[..., :self._min.shape[1]]
+        return self._new(self._min + offsets, self._max + offsets)
+
+
+class BoundingBoxArray(AbstractBoundingBoxArray):
+    SCALAR_CLS = BoundingBox
+
+
+class BoundingBox2DArray(AbstractBoundingBoxArray):
+    SCALAR_CLS = BoundingBox2D
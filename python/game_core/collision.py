@@ -0,0 +1,126 @@
+""" Swept axis aligned bounding box collision.
+
+A moving box (e.g. a character) is tested against a set of static boxes
+(e.g. the solid leaves of a tree, see `AbstractTree.query_box_extents`) by
+finding its earliest time of impact along its displacement against all of
+the static boxes at once.
+
+`slide_box` resolves a whole move by repeatedly advancing to the earliest
+impact and dropping the blocked component of the rest of the displacement.
+Every impact blocks a different dimension so it takes at most one step per
+dimension no matter how fast the box moves.
+"""
+__all__ = ['sweep_box', 'slide_box']
+
+from typing import MutableSequence, Optional, Sequence, Tuple
+
+import numpy
+
+# boxes that overlap by less than this are touching rather than colliding.
+# This absorbs rounding of positions after a move so that boxes resting on
+# or sliding along a surface don't get caught on it.
+_SKIN = 1e-5
+
+
+def sweep_box(box_min, box_max, displacement, mins, maxs):
+    # type: (Sequence[float], Sequence[float], Sequence[float], numpy.ndarray, numpy.ndarray) -> Tuple[float, Optional[int]]
+    """ Find how far a box can move along a displacement before hitting
+    any of a set of static boxes
+
+    Static boxes that the moving box already overlaps are ignored so that
+    it can move out of them.
+
+    Args:
+        box_min (Sequence[float]): minimum of the moving box
+        box_max (Sequence[float]): maximum of the moving box
+        displacement (Sequence[float])
+        mins (numpy.ndarray): (N, D) minimums of the static boxes
+        maxs (numpy.ndarray): (N, D) maximums of the static boxes
+
+    Returns:
+        Tuple[float, Optional[int]]: the fraction of `displacement` that can
+            be moved and the dimension of the face that is hit or None if
+            nothing is hit
+    """
+    count, dimensions = mins.shape
+    if not count:
+        return 1.0, None
+    box_min = numpy.array([box_min[i] for i in xrange(dimensions)], dtype=float)
+    box_max = numpy.array([box_max[i] for i in xrange(dimensions)], dtype=float)
+    displacement = numpy.array([displacement[i] for i in xrange(dimensions)], dtype=float)
+    moving = displacement != 0.0
+    if not moving.any():
+        return 1.0, None
+
+    # distance the box has to move along each dimension to touch each
+    # static box (negative when they already overlap along it)
+    gaps = numpy.where(displacement > 0.0, mins - box_max, box_min - maxs)
+    overlaps = (maxs - mins) + (box_max - box_min)
+    speeds = numpy.abs(displacement)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        t_enter = gaps / speeds
+        t_exit = (gaps + overlaps - _SKIN) / speeds
+
+    # the box never enters or leaves static boxes along dimensions that it
+    # doesn't move in so it has to already overlap them there
+    static_overlap = ((mins - box_max) < -_SKIN) & ((box_min - maxs) < -_SKIN)
+    t_enter[:, ~moving] = numpy.where(static_overlap[:, ~moving], -numpy.inf, numpy.inf)
+    t_exit[:, ~moving] = numpy.inf
+
+    axes = t_enter.argmax(axis=1)
+    rows = numpy.arange(count)
+    enter = t_enter[rows, axes]
+    hits = (
+        (enter <= 1.0)
+        & (enter < t_exit.min(axis=1))
+        & (gaps[rows, axes] >= -_SKIN)
+    )
+    if not hits.any():
+        return 1.0, None
+    hit_rows = rows[hits]
+    index = hit_rows[enter[hit_rows].argmin()]
+    return max(float(enter[index]), 0.0), int(axes[index])
+
+
+def slide_box(box_min, box_max, displacement, mins, maxs, out=None):
+    # type: (Sequence[float], Sequence[float], Sequence[float], numpy.ndarray, numpy.ndarray, Optional[MutableSequence[float]]) -> Tuple[MutableSequence[float], int]
+    """ Move a box along a displacement, sliding along the faces of the
+    static boxes that it hits
+
+    See `sweep_box` for a description of the arguments.
+
+    Args:
+        out (Optional[MutableSequence[float]]): store the resulting
+            displacement in this sequence instead of a new list
+
+    Returns:
+        Tuple[MutableSequence[float], int]: the displacement that the box
+            can move and a bit mask of the dimensions that were blocked
+    """
+    dimension_range = range(mins.shape[1])
+    remaining = [displacement[i] for i in dimension_range]
+    offset = [0.0 for _ in dimension_range]
+    start_min = [box_min[i] for i in dimension_range]
+    start_max = [box_max[i] for i in dimension_range]
+    current_min = list(start_min)
+    current_max = list(start_max)
+    blocked = 0
+    for _ in dimension_range:
+        t, axis = sweep_box(current_min, current_max, remaining, mins, maxs)
+        for i in dimension_range:
+            offset[i] += remaining[i] * t
+            current_min[i] = start_min[i] + offset[i]
+            current_max[i] = start_max[i] + offset[i]
+        if axis is None:
+            break
+        blocked |= 1 << axis
+        for i in dimension_range:
+            remaining[i] *= 1.0 - t
+        remaining[axis] = 0.0
+
+    if out is None:
+        out = offset
+    else:
+        for i in dimension_range:
+            out[i] = offset[i]
+    return out, blocked
@@ -1,74 +1,163 @@
-import functools
-import types
 import inspect
+import itertools
+import types
+
+from typing import Dict, List, Optional, Tuple
+
+# cache hits and misses of cached methods keyed by class and method name
+# while counting is enabled (see `enable_cache_stats`)
+_cache_stats = None  # type: Optional[Dict[Tuple[type, str], List[int]]]
 
 
 class EnableCachedMethods(type):
     """ This is a metaclass that, when used in conjunction with the
-    `cached_method` function decorator, will create a method that just returns
-    the cached result of the decorated method.
+    `cached_method` decorator, lets classes that define ``__slots__`` cache
+    method results.
 
-    The created method will be called by the decorator at runtime.
-    See the docs for `cached_method` for more info.
-    """
-    @staticmethod
-    def _add_cached_method(cls_dict):
-        for obj_name, obj in cls_dict.items():
-            if not inspect.isfunction(obj):
-                continue
-            if not getattr(obj, 'cached_method', False):
-                continue
-
-            code = inspect.cleandoc('''
-                def _%(func_name)s__cached(self):
-                    return self._%(func_name)s__result
-            ''') % dict(func_name=obj_name)
-            exec code in cls_dict
+    Slots are added for the result of each cached method defined on the
+    class and for the callable that returns it.  Classes without
+    ``__slots__`` store them in their instance ``__dict__`` instead.
 
+    The names of all cached methods of a class (including inherited ones)
+    are stored in its ``_cached_method_names`` attribute so that they can be
+    cleared with `clear_cached_methods`.
+    """
     def __new__(cls, name, bases, cls_dict):
-        cls._add_cached_method(cls_dict)
+        names = [
+            obj_name
+            for obj_name, obj in cls_dict.items()
+            if isinstance(obj, cached_method)
+        ]
+        if '__slots__' in cls_dict:
+            slots = cls_dict['__slots__']
+            if isinstance(slots, basestring):
+                slots = (slots, )
+            cls_dict['__slots__'] = tuple(slots) + tuple(
+                slot_name
+                for obj_name in names
+                for slot_name in (cls_dict[obj_name].result_name, cls_dict[obj_name].cached_name)
+            )
+
+        for base in bases:
+            for base_name in getattr(base, '_cached_method_names', ()):
+                if base_name not in names:
+                    names.append(base_name)
+        cls_dict['_cached_method_names'] = tuple(sorted(names))
         return type.__new__(cls, name, bases, cls_dict)
 
 
-def cached_method(func):
-    # type: (types.FunctionType) -> types.FunctionType
-    """ This is a function decorator that, when used in conjunction with the
-    `EnableCachedMethods` metaclass, sets up caching on a method so that
-    subsequent calls to it will be faster.
+class cached_method(object):
+    """ This is a method decorator that, when used in conjunction with the
+    `EnableCachedMethods` metaclass, caches the result of a method on each
+    instance so that subsequent calls to it will be faster.
+
+    The result is stored in an attribute named ``_<method name>__result``
+    along with a callable that returns it in ``_<method name>__cached``,
+    which is what cache hits return so no bound method is created for
+    them.  Clear them with `clear` (or `clear_cached_methods`) to have the
+    next call run the method again.
 
     Requirements:
         - The method must have no arguments other than the `self` argument.
+    """
+    def __init__(self, func):
+        # type: (types.FunctionType) -> None
+        # assert that the function has the required argspec
+        argspec = inspect.getargspec(func)
+        assert len(argspec.args) == 1 and argspec.args[0] == 'self', 'Invalid arg spec for decorated function.  Expected no arguments.'
 
-    Returns:
-        types.FunctionType
+        self.func = func
+        self.__name__ = func.__name__
+        self.__doc__ = func.__doc__
+        self.result_name = '_%s__result' % func.__name__
+        self.cached_name = '_%s__cached' % func.__name__
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        try:
+            cached = getattr(obj, self.cached_name)
+        except AttributeError:
+            return types.MethodType(self._call, obj)
+        if _cache_stats is not None:
+            _count(type(obj), self.__name__, 0)
+        return cached
+
+    def _call(self, obj):
+        if _cache_stats is not None:
+            _count(type(obj), self.__name__, 1)
+        result = self.func(obj)
+        setattr(obj, self.result_name, result)
+        # a C callable that returns `result`, which is faster to call than
+        # a python function
+        setattr(obj, self.cached_name, itertools.repeat(result).next)
+        return result
+
+    def clear(self, obj):
+        """ Clear the cached result of this method on an instance
+        """
+        for name in (self.cached_name, self.result_name):
+            try:
+                delattr(obj, name)
+            except AttributeError:
+                pass
+
+
+def clear_cached_methods(obj, names=None):
+    """ Clear the cached results of `cached_method` methods on an instance so
+    that the next call to each method runs the original method again.
+
+    Args:
+        obj (object): an instance of a class using `EnableCachedMethods`
+        names (Optional[Iterable[str]]): the names of the methods to clear.
+            Defaults to all of the instance's cached methods.
+    """
+    if names is None:
+        names = type(obj)._cached_method_names
+    for name in names:
+        for attr_name in ('_%s__cached' % name, '_%s__result' % name):
+            try:
+                delattr(obj, attr_name)
+            except AttributeError:
+                pass
+
+
+def _count(cls, name, index):
+    """ Count a cache hit (`index` 0) or miss (`index` 1) of a cached method
+    for a class
+    """
+    try:
+        counts = _cache_stats[cls, name]
+    except KeyError:
+        counts = _cache_stats[cls, name] = [0, 0]
+    counts[index] += 1
+
+
+def enable_cache_stats(enabled=True):
+    """ Start counting the cache hits and misses of cached methods for each
+    class (or stop counting).  Counting slows down every cached method call
+    so it is off by default.
+
+    Any previous counts are discarded.
+
+    Args:
+        enabled (bool)
     """
-    # assert that the function has the required argspec
-    argspec = inspect.getargspec(func)
-    assert len(argspec.args) == 1 and argspec.args[0] == 'self', 'Invalid arg spec for decorated function.  Expected no arguments.'
-
-    # Wrap `func` by:
-    # - assigning the result to the variable named by `cache_variable_name`
-    # - re-assigning func's name to a method that just returns the cache result.
-    #   This method will be created by the `EnableCachedMethods` metaclass.
-    # - returning the cached result
-    code = inspect.cleandoc('''
-        @functools.wraps(func)
-        def wrapped(self):
-            self._%(func_name)s__result = func(self)
-            self.%(func_name)s = self._%(func_name)s__cached
-            return self._%(func_name)s__result
-    ''') % dict(func_name=func.__name__)
-    wrapped_func_container = {
-        'functools': functools,
-        'func': func,
-    }
-    exec code in wrapped_func_container
-
-    # Add some attributes to the wrapped function created above.
-    # These attributes are required by the `EnableCachedMethods` metaclass
-    # later so that it can create a method that just returns the cached result of `func`.
-    wrapped = wrapped_func_container['wrapped']
-    wrapped.cached_method = True
-
-    return wrapped
+    global _cache_stats
+    _cache_stats = {} if enabled else None
+
 
+def get_cache_stats(cls):
+    """ Get the cache statistics of each cached method of a class since
+    `enable_cache_stats` was called.  Calls on instances of subclasses are
+    counted for the subclass.
+
+    Returns:
+        Dict[str, Tuple[int, int]]: the number of hits and misses keyed by
+            method name
+    """
+    stats = _cache_stats or {}
+    return dict(
+        (name, tuple(stats.get((cls, name), (0, 0))))
+        for name in cls._cached_method_names
+    )
@@ -39,7 +39,7 @@ def draw_coordinate_system(matrix):
                 'model_to_world_matrix',
                 1,
                 GL.GL_FALSE,
-                matrix.tolist(),
+                matrix.as_float32(),
             )
             GL.glBindVertexArray(draw_coordinate_system.vaos[i])
             GL.glDrawArrays(GL.GL_LINES, 0, 2)
@@ -1,5 +1,6 @@
 import random
 
+import numpy
 from typing import List
 
 from . import decorators
@@ -9,10 +10,8 @@ from . import Point
 from . import BoundingBox2D
 
 
-# TODO: update after AbstractTree refactor
-
-
 class HeightMapNode(abstract_tree.TreeNode):
+    __slots__ = ()
 
     @decorators.cached_method
     def get_bbox(self):
@@ -28,65 +27,6 @@ class HeightMapNode(abstract_tree.TreeNode):
         bbox_max = self.get_origin() + half_size_point
         return BoundingBox2D(bbox_min, bbox_max)
 
-    def _generate_debug_texture(self, viewport, width, height, texture):
-        """
-        Args:
-            viewport (BoundingBox2D): viewport BoudingBox in actual heightmap coordinates (not pixels)
-            width (int): viewport width in pixels
-            height (int): viewport height in pixels
-            data (List[float]): A flat list of color values that will be
-                mutated with the height colors for each pixel.  The length of
-                the list will be (width x height x 3).
-        """
-        # data range: -max_height to max_height
-        max_height = self.tree.max_height
-        height = self.get_value()
-        if height is None:
-            height = self.parent.get_value()
-        if height <= 0.0:
-            r = g = (max_height + height) / max_height * 0.5
-            b = 1.0
-        elif height > max_height:
-            r = g = b = 1.0
-        else:
-            r = height / max_height
-            g = (max_height - height) / max_height
-            b = 0.0
-
-        half_size = self.get_size() / 2.0
-        origin = self.get_origin()
-        min_size = self.tree.min_size
-        # TODO: update viewport._min/_max references once BoundingBox2D class has been refactored
-        relative_bottom_left = (origin - Point(half_size, half_size)) - viewport._min
-
-        # account for partially obscured nodes
-        #
-        sizes = [self.get_size(), self.get_size()]
-        relative_max = viewport._max + viewport._max
-        for i in xrange(2):
-            if relative_bottom_left[i] < 0.0:
-                sizes[i] += relative_bottom_left[i]
-                relative_bottom_left[i] = 0.0
-            if (relative_bottom_left[i] + sizes[i]) > relative_max[i]:
-                sizes[i] -= relative_bottom_left[i] + sizes[i] - relative_max[i]
-        pixel_sizes = [int(s / min_size) for s in sizes]
-
-        start_index = (int(relative_bottom_left.y / min_size) * width) + int(relative_bottom_left.x / min_size)
-        for row in xrange(pixel_sizes[1]):
-            index = start_index + (row * width)
-            index *= 3
-            for column in xrange(pixel_sizes[0]):
-                column *= 3
-                texture[index+column] = r
-                texture[index+column+1] = g
-                texture[index+column+2] = b
-
-        # texture_index = (int(relative_bottom_left.y / min_size) * width) + int(relative_bottom_left.x / min_size)
-        # texture_index *= 3
-        # texture[texture_index] = r
-        # texture[texture_index + 1] = g
-        # texture[texture_index + 2] = b
-
     # def _generate_debug_mesh(self):
     #     if None in self._children:
     #         x = info['origin'].x
@@ -119,122 +59,8 @@ class HeightMapNode(abstract_tree.TreeNode):
     #     return verts, normals, indices
 
     def _generate_height(self):
-        # find the items at the parent depth that are adjacent to this node
-        #
-        """
-        Corner indices:
-            +y  2 3
-            -y  0 1
-               -x +x
-        """
-        half_tree_size = self.tree.size / 2.0
-        parent_size = self.parent.get_size()
-        half_parent_size = parent_size / 2.0
-        parent_origin = self.parent.get_origin()
-        corner_points = [
-            Point(*parent_origin),
-            Point(*parent_origin),
-            Point(*parent_origin),
-            Point(*parent_origin),
-        ]
-        corner_weights = [
-            1.0,
-            1.0,
-            1.0,
-            1.0,
-        ]
-
-        if self.index & self.tree.dimension_bits[0]:
-            """
-            Child is in one of these spots:
-                . x
-                . x
-            """
-            corner_points[1].x += parent_size
-            corner_points[3].x += parent_size
-            corner_weights[1] += 1.0
-            corner_weights[3] += 1.0
-
-            # TODO: change this once you implement world patches
-            if corner_points[1].x >= half_tree_size:  # wrap to other side
-                new_x = -half_tree_size + half_parent_size
-                corner_points[1].x = new_x
-                corner_points[3].x = new_x
-        else:
-            """
-            Child is in one of these spots:
-                x .
-                x .
-            """
-            corner_points[0].x -= parent_size
-            corner_points[2].x -= parent_size
-            corner_weights[0] += 1.0
-            corner_weights[2] += 1.0
+        self.tree._generate_heights([self])
 
-            # TODO: change this once you implement world patches
-            if corner_points[0].x <= -half_tree_size:  # wrap to other side
-                new_x = half_tree_size - half_parent_size
-                corner_points[0].x = new_x
-                corner_points[2].x = new_x
-
-        if self.index & self.tree.dimension_bits[1]:
-            """
-            Child is in one of these spots:
-                x x
-                . .
-            """
-            corner_points[2].y += parent_size
-            corner_points[3].y += parent_size
-            corner_weights[2] += 1.0
-            corner_weights[3] += 1.0
-
-            # TODO: change this once you implement world patches
-            if corner_points[2].y >= half_tree_size:  # wrap to other side
-                new_y = -half_tree_size + half_parent_size
-                corner_points[2].y = new_y
-                corner_points[3].y = new_y
-        else:
-            """
-            Child is in one of these spots:
-                . .
-                x x
-            """
-            corner_points[0].y -= parent_size
-            corner_points[1].y -= parent_size
-            corner_weights[0] += 1.0
-            corner_weights[1] += 1.0
-
-            # TODO: change this once you implement world patches
-            if corner_points[0].y <= -half_tree_size:  # wrap to other side
-                new_y = half_tree_size - half_parent_size
-                corner_points[0].y = new_y
-                corner_points[1].y = new_y
-
-        # TODO: weighted average is producing horizontal and vertical lines in height
-        parent_height = 0.0
-        for i, corner_point in enumerate(corner_points):
-            if corner_point == parent_origin:
-                corner_node = self.parent
-            else:
-                # TODO: this node retrieval could likely be optimized by
-                #       caching the parent level nodes by origin before
-                #       generating child nodes
-                corner_node = self.tree.get_node_from_point(corner_point, max_depth=self.parent.get_depth())
-            corner_height = corner_node.get_value()
-            parent_height += corner_height * corner_weights[i]
-        parent_height /= sum(corner_weights)  # TODO: this could likely be optimized
-
-        origin = self.get_origin()
-        # TODO: optimize this to not rely on jumpahead since it is expensive
-        rand = random.Random( self.tree.seed )
-        rand.jumpahead( (origin.x, origin.y) )  # jumpahead is expensive so only doing it once for both x and y
-
-        # max_deviation = 1.0 / float( (self.get_depth() + 1) ** 2 )
-        # max_deviation = self.tree.get_size() / 2 ** ( self.get_depth() + 1 )
-        max_deviation = self.tree.max_height / 2 ** ( float( self.get_depth() ) ** 0.92 )
-        deviation = rand.uniform(-max_deviation, max_deviation)
-        height = parent_height + deviation
-        self.set_value(height)
 
 class HeightMap(quadtree.QuadTree):
     """
@@ -250,12 +76,13 @@ class HeightMap(quadtree.QuadTree):
         self.max_height = max_height
         self.base_height = base_height
         super(HeightMap, self).__init__(size, max_depth)
+        self.get_root().set_value(base_height)
 
-    def _create_node_proxy(self, data, parent=None, index=0):
+    def _create_node_proxy(self, data, parent=None, index=0, code=None):
         """
         :rtype: HeightMapNode
         """
-        return HeightMapNode(data, tree=self, parent=parent, index=index)
+        return HeightMapNode(data, tree=self, parent=parent, index=index, code=code)
 
     def generate(self, point, max_depth=None):
         """Generates nodes centered around `point`.
@@ -265,25 +92,25 @@ class HeightMap(quadtree.QuadTree):
         :type point: Point
         :type max_depth: int
         """
-        nodes = [self._create_node_proxy(self._data)]
+        nodes = [self.get_root()]
         depth = 0
         size = self.size
-        new_branch_data = [None] * (self.num_children + 1)
         max_depth = max_depth if max_depth is not None else self.max_depth
         while nodes and depth < max_depth:
             next_nodes = []
             """:type: list[HeightMapNode]"""
+            new_nodes = []
+            """:type: list[HeightMapNode]"""
             max_distance = size * (depth + 1)
             for node in nodes:
                 distance = point.distance( node.get_origin() )
                 if distance <= max_distance:
-                    if node.get_children() is None:
-                        # TODO: flush `get_children` cache
-                        # TODO: update the line below to set children after refactoring tree data storage
-                        node._set_data( list(new_branch_data) )
-                        node._generate_height()
+                    if node.is_leaf():
+                        node.split()
+                        new_nodes.extend( node.get_children() )
                     next_nodes.extend( node.get_children() )
                 # TODO: maybe unload children in an else statement here?
+            self._generate_heights(new_nodes)
             nodes = next_nodes
             depth += 1
             size /= 2.0
@@ -293,41 +120,94 @@ class HeightMap(quadtree.QuadTree):
 
         :type bbox: BoundingBox2D
         """
-        nodes = [self._create_node_proxy(self._data)]
-        depth = 0
-        size = self.size
-        new_branch_data = [None] * (self.num_children + 1)
-        while nodes:
-            next_nodes = []
+        for depth in range(self.max_depth):
+            new_nodes = []
             """:type: list[HeightMapNode]"""
-            half_size = size / 2.0
-            half_size_point = Point(half_size, half_size)
-            for node in nodes:
-                bbox_min = node.get_origin() - half_size_point
-                bbox_max = node.get_origin() + half_size_point
-                node_bbox = BoundingBox2D(bbox_min, bbox_max)
-                if bbox.collides(node_bbox):
-                    if node._data is None:
-                        # TODO: flush `get_children` cache
-                        # TODO: update the line below to set children after refactoring tree data storage
-                        node._set_data( list(new_branch_data) )
-                        node._generate_height()
-                    next_nodes.extend( node.get_children() )
-                # TODO: maybe unload children in an else statement here?
-            nodes = next_nodes
-            depth += 1
-            size /= 2.0
+            for info in self.query_box(bbox, inclusive=[], max_depth=depth):
+                if info.is_leaf:
+                    node = self._create_node_proxy_from_code(info.handle, info.code)
+                    node.split()
+                    new_nodes.extend( node.get_children() )
+            # TODO: maybe unload children outside of the bbox here?
+            self._generate_heights(new_nodes)
 
     def generate_all(self):
-        nodes = [self._create_node_proxy(self._data)]
-        while nodes:
-            next_nodes = []
+        nodes = [self.get_root()]
+        depth = 0
+        while nodes and depth < self.max_depth:
+            new_nodes = []
             """:type: list[HeightMapNode]"""
             for node in nodes:
-                if node._data is None:
-                    node._generate_height()
-                next_nodes.extend( node.get_children() )
-            nodes = next_nodes
+                if node.is_leaf():
+                    node.split()
+                new_nodes.extend( node.get_children() )
+            self._generate_heights(new_nodes)
+            nodes = new_nodes
+            depth += 1
+
+    def _generate_heights(self, nodes):
+        """ Generate the height of each node from the heights of the nodes
+        adjacent to its parent.
+
+        The corner lookups for all of the nodes are done with a single
+        `get_nodes_from_points` call so all of the `nodes` must have the
+        same depth.
+
+        Corner indices:
+            +y  2 3
+            -y  0 1
+               -x +x
+
+        Args:
+            nodes (List[HeightMapNode]): nodes with the same depth
+        """
+        if not nodes:
+            return
+        depth = nodes[0].get_depth()
+        half_tree_size = self.size / 2.0
+        parent_size = self.size / 2.0 ** (depth - 1)
+        half_parent_size = parent_size / 2.0
+
+        # (node, corner, dimension) array of the points to sample at the
+        # parent depth.  Each corner starts at the parent's origin and the
+        # corners on the same side as the child are moved to the parent's
+        # neighbors.
+        parent_origins = []
+        for node in nodes:
+            parent_origin = node.parent.get_origin()
+            parent_origins.append((parent_origin.x, parent_origin.y))
+        indexes = numpy.array([node.index for node in nodes])
+        corner_points = numpy.repeat(numpy.array(parent_origins)[:, numpy.newaxis, :], 4, axis=1)
+        corner_weights = numpy.ones((len(nodes), 4))
+        for dimension, dimension_bit in enumerate(self.dimension_bits):
+            positive = (indexes & dimension_bit) != 0
+            for corner in range(4):
+                corner_positive = bool(corner & dimension_bit)
+                moved = positive == corner_positive
+                corner_points[moved, corner, dimension] += parent_size if corner_positive else -parent_size
+                corner_weights[moved, corner] += 1.0
+
+            # TODO: change this once you implement world patches
+            # wrap to other side
+            coords = corner_points[:, :, dimension]
+            coords[coords >= half_tree_size] = -half_tree_size + half_parent_size
+            coords[coords <= -half_tree_size] = half_tree_size - half_parent_size
+
+        # TODO: weighted average is producing horizontal and vertical lines in height
+        _, corner_heights = self.get_nodes_from_points(corner_points.reshape(-1, 2), max_depth=depth - 1)
+        corner_heights = corner_heights.astype(float).reshape(corner_weights.shape)
+        parent_heights = (corner_heights * corner_weights).sum(axis=1) / corner_weights.sum(axis=1)
+
+        # max_deviation = 1.0 / float( (depth + 1) ** 2 )
+        # max_deviation = self.size / 2 ** ( depth + 1 )
+        max_deviation = self.max_height / 2 ** ( float( depth ) ** 0.92 )
+        for node, parent_height in zip(nodes, parent_heights):
+            origin = node.get_origin()
+            # TODO: optimize this to not rely on jumpahead since it is expensive
+            rand = random.Random( self.seed )
+            rand.jumpahead( (origin.x, origin.y) )  # jumpahead is expensive so only doing it once for both x and y
+            deviation = rand.uniform(-max_deviation, max_deviation)
+            node.set_value(float(parent_height) + deviation)
 
     def _generate_debug_texture(self, viewport, width, height, texture):
         """
@@ -339,21 +219,66 @@ class HeightMap(quadtree.QuadTree):
                 mutated with the height colors for each pixel.  The length of
                 the list will be (width x height x 3).
         """
-        nodes = [self._create_node_proxy(self._root)]
-        half_size = self.size / 2.0
-        half_size_point = Point(half_size, half_size)
-        while nodes:
-            next_nodes = []  # type: List[HeightMapNode]
-            for node in nodes:
-                bbox = BoundingBox2D(node.get_origin() - half_size_point, node.get_origin() + half_size_point)
-                if not viewport.collides(bbox):
-                    continue
-                if node.is_branch():
-                    next_nodes.extend( node.get_children() )
-                else:
-                    node._generate_debug_texture(viewport, width, height, texture)
-            nodes = next_nodes
-            half_size /= 2.0
+        for info in self.iter_leaves(bbox=viewport):
+            self._generate_leaf_debug_texture(info, viewport, width, height, texture)
+
+    def _generate_leaf_debug_texture(self, info, viewport, width, height, texture):
+        """
+        Args:
+            info (abstract_tree.TreeNodeInfo): the leaf to draw
+            viewport (BoundingBox2D): viewport BoudingBox in actual heightmap coordinates (not pixels)
+            width (int): viewport width in pixels
+            height (int): viewport height in pixels
+            data (List[float]): A flat list of color values that will be
+                mutated with the height colors for each pixel.  The length of
+                the list will be (width x height x 3).
+        """
+        # data range: -max_height to max_height
+        max_height = self.max_height
+        height = info.value
+        if height <= 0.0:
+            r = g = (max_height + height) / max_height * 0.5
+            b = 1.0
+        elif height > max_height:
+            r = g = b = 1.0
+        else:
+            r = height / max_height
+            g = (max_height - height) / max_height
+            b = 0.0
+
+        half_size = info.size / 2.0
+        origin = Point(*info.origin)
+        min_size = self.min_size
+        # TODO: update viewport._min/_max references once BoundingBox2D class has been refactored
+        relative_bottom_left = (origin - Point(half_size, half_size)) - viewport._min
+
+        # account for partially obscured nodes
+        #
+        sizes = [info.size, info.size]
+        relative_max = viewport._max + viewport._max
+        for i in xrange(2):
+            if relative_bottom_left[i] < 0.0:
+                sizes[i] += relative_bottom_left[i]
+                relative_bottom_left[i] = 0.0
+            if (relative_bottom_left[i] + sizes[i]) > relative_max[i]:
+                sizes[i] -= relative_bottom_left[i] + sizes[i] - relative_max[i]
+        pixel_sizes = [int(s / min_size) for s in sizes]
+
+        start_index = (int(relative_bottom_left.y / min_size) * width) + int(relative_bottom_left.x / min_size)
+        for row in xrange(pixel_sizes[1]):
+            index = start_index + (row * width)
+            index *= 3
+            for column in xrange(pixel_sizes[0]):
+                column *= 3
+                texture[index+column] = r
+                texture[index+column+1] = g
+                texture[index+column+2] = b
+
+        # texture_index = (int(relative_bottom_left.y / min_size) * width) + int(relative_bottom_left.x / min_size)
+        # texture_index *= 3
+        # texture[texture_index] = r
+        # texture[texture_index + 1] = g
+        # texture[texture_index + 2] = b
 
     # def _generate_debug_mesh(self):
     #     nodes = [self._create_node_proxy(self._root)]
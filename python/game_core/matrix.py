@@ -3,34 +3,107 @@ __all__ = ['Matrix', 'MatrixStack']
 import math
 
 import numpy
-from typing import Optional, TYPE_CHECKING
+from typing import Dict, Iterable, List, Optional, Union, TYPE_CHECKING
 
 if TYPE_CHECKING:
+    from .quaternion import Quaternion
     from .vector import Vector
 
 
+# tolerance used to decide whether the rotation part of a matrix is
+# orthonormal so that it can be inverted with a transpose
+_ORTHONORMAL_TOLERANCE = 1e-9
+
+# the rows modified by a rotation about each axis.  The Y rotation works on
+# rows (2, 0) so it is written as a reversed slice
+_ROWS_X = slice(1, 3)
+_ROWS_Y = slice(2, None, -2)
+_ROWS_Z = slice(0, 2)
+
+# the operations recorded by a batched MatrixStack
+_BATCH_OPS = ('rotateX', 'rotateY', 'rotateZ', 'scale', 'translate', 'multiply')
+
+# the index of the identity transform at the bottom of a batched MatrixStack
+_ROOT = -1
+
+_DIAGONAL = numpy.arange(4)
+
+
 class Matrix(object):
+    """ A 4x4 transform matrix using the row vector convention (i.e. points
+    are transformed with ``point * matrix`` and the translation is stored in
+    the last row).
+
+    The inverse and the float32 upload buffer (see `as_float32`) are cached
+    until the matrix is modified.
+    """
+    __slots__ = ('_data', '_inverse', '_float32')
+
     def __init__(self, other=None):
         from . import Quaternion
         if other is None:
-            self._data = numpy.matrix([
-                    [1, 0, 0, 0],
-                    [0, 1, 0, 0],
-                    [0, 0, 1, 0],
-                    [0, 0, 0, 1]], dtype=float)
-        elif isinstance(other, numpy.matrix):
-            self._data = other
+            data = numpy.identity(4)
         elif isinstance(other, Matrix):
-            self._data = other._data.copy()
+            data = other._data.copy()
         elif isinstance(other, Quaternion):
-            self._data = numpy.matrix([
-                    [1, 0, 0, 0],
-                    [0, 1, 0, 0],
-                    [0, 0, 1, 0],
-                    [0, 0, 0, 1]], dtype=float)
-            other.as_matrix(self)
+            data = numpy.identity(4)
+        elif isinstance(other, numpy.ndarray):
+            data = numpy.array(other, dtype=float)
+            if data.shape != (4, 4):
+                raise ValueError('Unable to cast array of shape %s to Matrix' % (data.shape, ))
         else:
-            TypeError('Unable to cast %s to Matrix' % type(other))
+            raise TypeError('Unable to cast %s to Matrix' % type(other))
+        self._data = data
+        self._inverse = None  # type: Optional[numpy.ndarray]
+        self._float32 = None  # type: Optional[numpy.ndarray]
+        if isinstance(other, Quaternion):
+            other.as_matrix(self)
+
+    @classmethod
+    def _from_array(cls, data):
+        # type: (numpy.ndarray) -> Matrix
+        """ Create a matrix that takes ownership of a 4x4 float array without
+        copying it
+        """
+        result = cls.__new__(cls)
+        result._data = data
+        result._inverse = None
+        result._float32 = None
+        return result
+
+    @classmethod
+    def from_transform(cls, translation=None, rotation=None, scale=None):
+        # type: (Optional[Iterable[float]], Optional[Union[Matrix, Quaternion]], Optional[Union[float, Iterable[float]]]) -> Matrix
+        """ Compose a scale, rotation and translation into a single matrix
+
+        This is equivalent to ``scale_matrix * rotation_matrix *
+        translation_matrix`` without building the intermediate matrices.
+
+        Args:
+            translation (Optional[Iterable[float]])
+            rotation (Optional[Union[Matrix, Quaternion]]): only the upper
+                3x3 of a matrix is used
+            scale (Optional[Union[float, Iterable[float]]])
+
+        Returns:
+            Matrix
+        """
+        from . import Quaternion
+        result = cls()
+        data = result._data
+        if rotation is not None:
+            if isinstance(rotation, Quaternion):
+                rotation.as_matrix(result)
+            else:
+                data[:3, :3] = rotation._data[:3, :3]
+        if scale is not None:
+            result._scale_rows(scale)
+        if translation is not None:
+            x, y, z = translation
+            data[3, 0] = x
+            data[3, 1] = y
+            data[3, 2] = z
+        return result
 
     @classmethod
     def from_axis_vectors(cls, x=None, y=None, z=None):
@@ -66,43 +139,57 @@ class Matrix(object):
             result[2, i] = z[i]
         return result
 
-    def as_quaternion(self):
+    def as_quaternion(self, q=None):
+        # type: (Optional[Quaternion]) -> Quaternion
+        """ Get the rotation of this matrix as a quaternion
+
+        Args:
+            q (Optional[Quaternion]): the quaternion to set instead of
+                creating a new one
+
+        Returns:
+            Quaternion
+        """
         from . import Quaternion
-        q = Quaternion()
-        tr = self[0,0] + self[1,1] + self[2,2]
+        if q is None:
+            q = Quaternion()
+        # the formulas below are for column vector matrices so swap the
+        # indices of the off diagonal terms
+        (m00, m10, m20, _), (m01, m11, m21, _), (m02, m12, m22, _), _ = self._data.tolist()
+        tr = m00 + m11 + m22
 
         if tr > 0:
-            S = math.sqrt(tr+1.0) * 2.0 # S=4*qw 
+            S = math.sqrt(tr+1.0) * 2.0 # S=4*qw
             q.w = 0.25 * S
-            q.x = (self[2,1] - self[1,2]) / S
-            q.y = (self[0,2] - self[2,0]) / S
-            q.z = (self[1,0] - self[0,1]) / S
-        elif self[0,0] > self[1,1] and self[0,0] > self[2,2]:
-            S = math.sqrt(1.0 + self[0,0] - self[1,1] - self[2,2]) * 2.0 # S=4*qx 
-            q.w = (self[2,1] - self[1,2]) / S
+            q.x = (m21 - m12) / S
+            q.y = (m02 - m20) / S
+            q.z = (m10 - m01) / S
+        elif m00 > m11 and m00 > m22:
+            S = math.sqrt(1.0 + m00 - m11 - m22) * 2.0 # S=4*qx
+            q.w = (m21 - m12) / S
             q.x = 0.25 * S
-            q.y = (self[0,1] + self[1,0]) / S
-            q.z = (self[0,2] + self[2,0]) / S
-        elif self[1,1] > self[2,2]:
-            S = math.sqrt(1.0 + self[1,1] - self[0,0] - self[2,2]) * 2.0 # S=4*qy
-            q.w = (self[0,2] - self[2,0]) / S
-            q.x = (self[0,1] + self[1,0]) / S
+            q.y = (m01 + m10) / S
+            q.z = (m02 + m20) / S
+        elif m11 > m22:
+            S = math.sqrt(1.0 + m11 - m00 - m22) * 2.0 # S=4*qy
+            q.w = (m02 - m20) / S
+            q.x = (m01 + m10) / S
             q.y = 0.25 * S
-            q.z = (self[1,2] + self[2,1]) / S
+            q.z = (m12 + m21) / S
         else:
-            S = math.sqrt(1.0 + self[2,2] - self[0,0] - self[1,1]) * 2.0 # S=4*qz
-            q.w = (self[1,0] - self[0,1]) / S
-            q.x = (self[0,2] + self[2,0]) / S
-            q.y = (self[1,2] + self[2,1]) / S
+            S = math.sqrt(1.0 + m22 - m00 - m11) * 2.0 # S=4*qz
+            q.w = (m10 - m01) / S
+            q.x = (m02 + m20) / S
+            q.y = (m12 + m21) / S
             q.z = 0.25 * S
 
         return q
 
     def transpose(self):
-         return type(self)(numpy.transpose(self._data))
+        return type(self)._from_array(self._data.T.copy())
 
     def copy(self):
-        return Matrix(self._data.copy())
+        return Matrix._from_array(self._data.copy())
 
     @classmethod
     def sizeof(cls):
@@ -115,8 +202,110 @@ class Matrix(object):
     def tolist(self):
         return self._data.tolist()
 
+    def as_float32(self):
+        # type: () -> numpy.ndarray
+        """ Get this matrix as a contiguous float32 array that can be passed
+        directly to ``glUniformMatrix4fv`` (with ``transpose`` set to
+        ``GL_FALSE``, the same layout as `tolist`).
+
+        The array is cached until this matrix is modified so it must not be
+        modified by the caller.
+
+        Returns:
+            numpy.ndarray: a (4, 4) float32 array
+        """
+        if self._float32 is None:
+            self._float32 = self._data.astype(numpy.float32)
+        return self._float32
+
     def inverse(self):
-        return type(self)(self._data.I)
+        """ Get the inverse of this matrix
+
+        Affine matrices (the last column is ``(0, 0, 0, 1)``) are inverted
+        without a full 4x4 inversion and the rotation of rigid transforms
+        (e.g. camera matrices) is inverted with a transpose. The result is
+        cached until this matrix is modified.
+
+        Returns:
+            Matrix
+        """
+        if self._inverse is None:
+            self._inverse = self._get_inverse_array()
+        result = type(self)._from_array(self._inverse.copy())
+        result._inverse = self._data.copy()
+        return result
+
+    def _get_inverse_array(self):
+        # type: () -> numpy.ndarray
+        # scalar math is much faster than numpy for a single 3x3
+        (a, b, c, p), (d, e, f, q), (g, h, i, r), (tx, ty, tz, s) = self._data.tolist()
+        if p != 0.0 or q != 0.0 or r != 0.0 or s != 1.0:
+            return numpy.linalg.inv(self._data)
+
+        tolerance = _ORTHONORMAL_TOLERANCE
+        if (abs(a * a + b * b + c * c - 1.0) < tolerance
+                and abs(d * d + e * e + f * f - 1.0) < tolerance
+                and abs(g * g + h * h + i * i - 1.0) < tolerance
+                and abs(a * d + b * e + c * f) < tolerance
+                and abs(a * g + b * h + c * i) < tolerance
+                and abs(d * g + e * h + f * i) < tolerance):
+            # rigid transform so the inverse rotation is the transpose
+            r00, r01, r02 = a, d, g
+            r10, r11, r12 = b, e, h
+            r20, r21, r22 = c, f, i
+        else:
+            c00 = e * i - f * h
+            c01 = f * g - d * i
+            c02 = d * h - e * g
+            det = a * c00 + b * c01 + c * c02
+            if det == 0.0:
+                raise numpy.linalg.LinAlgError('Singular matrix')
+            inv_det = 1.0 / det
+            r00, r01, r02 = c00 * inv_det, (c * h - b * i) * inv_det, (b * f - c * e) * inv_det
+            r10, r11, r12 = c01 * inv_det, (a * i - c * g) * inv_det, (c * d - a * f) * inv_det
+            r20, r21, r22 = c02 * inv_det, (b * g - a * h) * inv_det, (a * e - b * d) * inv_det
+
+        return numpy.array((
+            (r00, r01, r02, 0.0),
+            (r10, r11, r12, 0.0),
+            (r20, r21, r22, 0.0),
+            (
+                -(tx * r00 + ty * r10 + tz * r20),
+                -(tx * r01 + ty * r11 + tz * r21),
+                -(tx * r02 + ty * r12 + tz * r22),
+                1.0,
+            ),
+        ))
+
+    def _changed(self):
+        self._inverse = None
+        self._float32 = None
+
+    def get_frustum_planes(self):
+        """ Get the planes of the view frustum described by this matrix
+
+        This matrix should be a combined view and projection matrix (e.g.
+        ``camera.matrix.inverse() * camera.projection_matrix``) using the
+        same row vector convention as the rest of this class.
+
+        Returns:
+            List[Tuple[float, float, float, float]]: the normalized
+                ``(a, b, c, d)`` coefficients of the left, right, bottom,
+                top, near and far planes. Points inside of the frustum have
+                ``a*x + b*y + c*z + d >= 0`` for every plane.
+        """
+        columns = self._data.T
+        w = columns[3]
+        planes = []
+        for i in range(3):
+            planes.append(w + columns[i])
+            planes.append(w - columns[i])
+
+        result = []
+        for plane in planes:
+            length = math.sqrt(plane[0] ** 2 + plane[1] ** 2 + plane[2] ** 2)
+            result.append(tuple(float(c) / length for c in plane))
+        return result
 
     def __getitem__(self, index):
         if not hasattr(index, '__iter__'):
@@ -127,12 +316,15 @@ class Matrix(object):
         if not hasattr(index, '__iter__'):
             raise IndexError('index must be a sequence, not %s' % type(index).__name__)
         self._data.itemset(index[0], index[1], value)
+        self._inverse = None
+        self._float32 = None
 
     def __mul__(self, other):
-        return Matrix(numpy.dot(self._data, other._data))
+        return Matrix._from_array(numpy.dot(self._data, other._data))
 
     def __imul__(self, other):
         self._data = numpy.dot(self._data, other._data)
+        self._changed()
         return self
 
     def __str__(self):
@@ -144,73 +336,86 @@ class Matrix(object):
         result += '\t' + str(l[3]) + '\n'
         return result
 
-    def rotateX(self, fAngDeg):
-        fAngRad = math.radians(fAngDeg)
-        fCos = math.cos(fAngRad)
-        fSin = math.sin(fAngRad)
+    def _rotate_rows(self, rows, angle_deg):
+        """ Pre-multiply this matrix by a rotation about one axis in place
 
-        mat = Matrix()
-        mat[1,1] = fCos
-        mat[1,2] = fSin
-        mat[2,1] = -fSin
-        mat[2,2] = fCos
+        Only the two rows of this matrix affected by the rotation are
+        recomputed instead of multiplying by a full rotation matrix.
 
-        mat *= self
-        self._data = mat._data
-
-    def rotateY(self, fAngDeg):
-        fAngRad = math.radians(fAngDeg)
-        fCos = math.cos(fAngRad)
-        fSin = math.sin(fAngRad)
+        Args:
+            rows (slice): the two rows ``(i, j)`` to rotate as
+                ``(cos*i + sin*j, cos*j - sin*i)``
+            angle_deg (float)
+        """
+        angle_rad = math.radians(angle_deg)
+        cos = math.cos(angle_rad)
+        sin = math.sin(angle_rad)
+        block = self._data[rows]
+        block[:] = numpy.dot(((cos, sin), (-sin, cos)), block)
+        self._changed()
 
-        mat = Matrix()
-        mat[0,0] = fCos
-        mat[0,2] = -fSin
-        mat[2,0] = fSin
-        mat[2,2] = fCos
+    def rotateX(self, fAngDeg):
+        self._rotate_rows(_ROWS_X, fAngDeg)
 
-        mat *= self
-        self._data = mat._data
+    def rotateY(self, fAngDeg):
+        self._rotate_rows(_ROWS_Y, fAngDeg)
 
     def rotateZ(self, fAngDeg):
-        fAngRad = math.radians(fAngDeg)
-        fCos = math.cos(fAngRad)
-        fSin = math.sin(fAngRad)
-
-        mat = Matrix()
-        mat[0,0] = fCos
-        mat[0,1] = fSin
-        mat[1,0] = -fSin
-        mat[1,1] = fCos
-
-        mat *= self
-        self._data = mat._data
+        self._rotate_rows(_ROWS_Z, fAngDeg)
 
-    def scale(self, scaleVec):
+    def _scale_rows(self, scaleVec):
+        data = self._data
         if not hasattr(scaleVec, '__iter__'):
-            scaleVec = [scaleVec] * 3
-        mat = Matrix()
-        for index in xrange(3):
-            mat[index, index] = scaleVec[index]
+            data[:3] *= scaleVec
+        else:
+            for index in xrange(3):
+                data[index] *= scaleVec[index]
+        self._changed()
 
-        mat *= self
-        self._data = mat._data
+    def scale(self, scaleVec):
+        self._scale_rows(scaleVec)
 
     def translate(self, offsetVec):
         if not hasattr(offsetVec, '__iter__'):
             offsetVec = [offsetVec] * 3
-        mat = Matrix()
-        for index in xrange(3):
-            mat[3, index] = offsetVec[index]
+        data = self._data
+        data[3] += numpy.dot((offsetVec[0], offsetVec[1], offsetVec[2]), data[:3])
+        self._changed()
 
-        mat *= self
-        self._data = mat._data
 
 class MatrixStack(object):
-    def __init__(self):
-        self.m_currMat = Matrix()
+    """ A stack of transforms where each operation is applied before the
+    current transform and pushes the result.
+
+    By default operations are applied immediately to `top`.  A batched
+    stack records the operations instead so that the transforms of a whole
+    hierarchy can be evaluated with a few vectorized numpy calls (one per
+    level of the hierarchy) rather than one python matrix multiply per
+    operation::
+
+        stack = MatrixStack(batched=True)
+        for item in items:
+            with stack:
+                stack.translate(item.position)
+                stack.rotateY(item.heading)
+                stack.instance()
+        buffer = stack.evaluate()  # (len(items), 4, 4) float32
+
+    While batched, the stack holds the indexes of the recorded transforms
+    and `top` and `pop` return those indexes instead of matrices.
+    """
+    def __init__(self, batched=False):
+        self.batched = batched
+        self.m_currMat = _ROOT if batched else Matrix()
         self.m_matrices = []
         self.__enter_lengths = []
+        self._instances = []  # type: List[Union[int, numpy.ndarray]]
+
+        # recorded transforms when batched
+        self._parents = []  # type: List[int]
+        self._depths = []  # type: List[int]
+        self._op_nodes = dict((op, []) for op in _BATCH_OPS)  # type: Dict[str, List[int]]
+        self._op_args = dict((op, []) for op in _BATCH_OPS)  # type: Dict[str, List]
 
     def __enter__(self):
         self.__enter_lengths.append(len(self.m_matrices))
@@ -218,45 +423,175 @@ class MatrixStack(object):
     def __exit__(self, typ, val, tb):
         enter_len = self.__enter_lengths.pop()
         self.m_matrices = self.m_matrices[:enter_len]
-        if self.m_matrices:
+        self._restore_top()
+
+    def _restore_top(self):
+        """ Make the top of the stack the current transform
+        """
+        if not self.m_matrices:
+            self.m_currMat = self._get_root()
+        elif self.batched:
             self.m_currMat = self.m_matrices[-1]
         else:
-            self.m_currMat = Matrix()
+            # copy so that later operations don't modify the pushed matrix
+            self.m_currMat = self.m_matrices[-1].copy()
+
+    def _get_root(self):
+        return _ROOT if self.batched else Matrix()
 
     def top(self):
         return self.m_currMat
 
+    def _record(self, op, arg):
+        """ Record an operation applied before the current transform and
+        make the result the current transform
+        """
+        parent = self.m_currMat
+        node = len(self._parents)
+        self._parents.append(parent)
+        self._depths.append(0 if parent == _ROOT else self._depths[parent] + 1)
+        self._op_nodes[op].append(node)
+        self._op_args[op].append(arg)
+        self.m_currMat = node
+        self.m_matrices.append(node)
+
     def rotateX(self, fAngDeg):
+        if self.batched:
+            return self._record('rotateX', fAngDeg)
         self.m_currMat.rotateX(fAngDeg)
         self.push()
 
     def rotateY(self, fAngDeg):
+        if self.batched:
+            return self._record('rotateY', fAngDeg)
         self.m_currMat.rotateY(fAngDeg)
         self.push()
 
     def rotateZ(self, fAngDeg):
+        if self.batched:
+            return self._record('rotateZ', fAngDeg)
         self.m_currMat.rotateZ(fAngDeg)
         self.push()
 
     def scale(self, scaleVec):
+        if self.batched:
+            if not hasattr(scaleVec, '__iter__'):
+                scaleVec = [scaleVec] * 3
+            return self._record('scale', (scaleVec[0], scaleVec[1], scaleVec[2]))
         self.m_currMat.scale(scaleVec)
         self.push()
 
     def translate(self, offsetVec):
+        if self.batched:
+            if not hasattr(offsetVec, '__iter__'):
+                offsetVec = [offsetVec] * 3
+            return self._record('translate', (offsetVec[0], offsetVec[1], offsetVec[2]))
         self.m_currMat.translate(offsetVec)
         self.push()
 
+    def multiply(self, matrix):
+        # type: (Matrix) -> None
+        """ Apply a matrix before the current transform
+        """
+        if self.batched:
+            return self._record('multiply', matrix._data)
+        self.m_currMat = matrix * self.m_currMat
+        self.push()
+
     def push(self):
+        if self.batched:
+            raise RuntimeError('a batched MatrixStack pushes every recorded operation')
         self.m_matrices.append(self.m_currMat.copy())
 
     def pop(self):
         result = self.m_matrices.pop()
-        if len(self.m_matrices):
-            self.m_currMat = self.m_matrices[-1].copy()
+        self._restore_top()
+        return result
+
+    def instance(self):
+        # type: () -> int
+        """ Add the current transform to the buffer returned by `evaluate`
+
+        Returns:
+            int: the index of the transform in the buffer
+        """
+        if self.batched:
+            self._instances.append(self.m_currMat)
         else:
-            self.m_currMat = Matrix()
+            self._instances.append(self.m_currMat._data.copy())
+        return len(self._instances) - 1
+
+    def evaluate(self):
+        # type: () -> numpy.ndarray
+        """ Get the transforms added with `instance`
+
+        Returns:
+            numpy.ndarray: a contiguous (N, 4, 4) float32 array that can be
+                uploaded directly for instanced drawing
+        """
+        if not self._instances:
+            return numpy.empty((0, 4, 4), dtype=numpy.float32)
+        if not self.batched:
+            return numpy.array(self._instances, dtype=numpy.float32)
+
+        world = self._evaluate_nodes()
+        instances = numpy.array(self._instances)
+        result = numpy.empty((len(instances), 4, 4), dtype=numpy.float32)
+        is_root = instances == _ROOT
+        result[is_root] = numpy.identity(4)
+        result[~is_root] = world[instances[~is_root]]
         return result
 
+    def _get_local_matrices(self):
+        # type: () -> numpy.ndarray
+        """ Build the matrix of every recorded operation, vectorized per type
+        of operation
+        """
+        local = numpy.zeros((len(self._parents), 4, 4))
+        local[:, _DIAGONAL, _DIAGONAL] = 1.0
+
+        for op, (i, j) in (('rotateX', (1, 2)), ('rotateY', (2, 0)), ('rotateZ', (0, 1))):
+            nodes = self._op_nodes[op]
+            if not nodes:
+                continue
+            angles = numpy.radians(self._op_args[op])
+            cos = numpy.cos(angles)
+            sin = numpy.sin(angles)
+            local[nodes, i, i] = cos
+            local[nodes, i, j] = sin
+            local[nodes, j, i] = -sin
+            local[nodes, j, j] = cos
+
+        nodes = self._op_nodes['scale']
+        if nodes:
+            local[nodes, :3, :3] *= numpy.array(self._op_args['scale'])[:, numpy.newaxis, :]
+
+        nodes = self._op_nodes['translate']
+        if nodes:
+            local[nodes, 3, :3] = self._op_args['translate']
+
+        nodes = self._op_nodes['multiply']
+        if nodes:
+            local[nodes] = self._op_args['multiply']
+        return local
+
+    def _evaluate_nodes(self):
+        # type: () -> numpy.ndarray
+        """ Get the world transform of every recorded operation
+
+        Each operation is applied before its parent's transform so every
+        level of the hierarchy is evaluated with a single batched multiply.
+        """
+        world = self._get_local_matrices()
+        parents = numpy.array(self._parents, dtype=int)
+        depths = numpy.array(self._depths, dtype=int)
+        order = numpy.argsort(depths, kind='mergesort')
+        level_ends = numpy.cumsum(numpy.bincount(depths))
+        for start, end in zip(level_ends[:-1], level_ends[1:]):
+            nodes = order[start:end]
+            world[nodes] = numpy.matmul(world[nodes], world[parents[nodes]])
+        return world
+
     def perspective(self, fovy, aspect, zNear, zFar):
         range = math.tan(math.radians(fovy)/2.0) * zNear
         left = -range * aspect
@@ -271,6 +606,4 @@ class MatrixStack(object):
         result[2,3] = -1.0
         result[3,2] = -(2.0 * zFar * zNear) / (zFar - zNear)
 
-        self.m_currMat = result * self.m_currMat
-        self.push()
-
+        self.multiply(result)
@@ -1,43 +1,59 @@
+import numpy
 from OpenGL import GL
 
-from . import FLOAT_SIZE
-
 
 class Mesh(object):
     def __init__(self, vertices, normals, indices, draw_method):
+        """
+        The data is uploaded straight from numpy arrays that are already
+        contiguous float32 (vertices and normals) and uint32 (indices)
+        arrays.  Anything else (e.g. lists) is converted to such arrays
+        first.
+
+        Args:
+            vertices (Union[numpy.ndarray, Sequence[float]]): the x, y, z
+                components of each vertex, either flat or (N, 3)
+            normals (Union[numpy.ndarray, Sequence[float]]): the normal of
+                each vertex, either flat or (N, 3)
+            indices (Union[numpy.ndarray, Sequence[int]]): vertex indices
+            draw_method (int): e.g. GL.GL_TRIANGLES
+        """
         self.draw_method = draw_method
-        self.indices = indices
+        vertices = numpy.ascontiguousarray(vertices, dtype=numpy.float32)
+        normals = numpy.ascontiguousarray(normals, dtype=numpy.float32)
+        indices = numpy.ascontiguousarray(indices, dtype=numpy.uint32)
+        self.num_indices = indices.size
 
         self.vao = GL.glGenVertexArrays(1)
         GL.glBindVertexArray(self.vao)
 
         vertexBufferObject = GL.glGenBuffers(1)
 
+        # the normals are stored after the vertices in the same buffer
         GL.glBindBuffer(GL.GL_ARRAY_BUFFER, vertexBufferObject)
-        data = vertices + normals
-        array_type = (GL.GLfloat*len(data))
         GL.glBufferData(
                 GL.GL_ARRAY_BUFFER,
-                len(data)*FLOAT_SIZE,
-                array_type(*data),
+                vertices.nbytes + normals.nbytes,
+                None,
                 GL.GL_STATIC_DRAW)
+        GL.glBufferSubData(GL.GL_ARRAY_BUFFER, 0, vertices.nbytes, vertices)
+        GL.glBufferSubData(GL.GL_ARRAY_BUFFER, vertices.nbytes, normals.nbytes, normals)
         GL.glEnableVertexAttribArray(0)
         GL.glEnableVertexAttribArray(1)
         GL.glVertexAttribPointer(0, 3, GL.GL_FLOAT, GL.GL_FALSE, 0, None)
-        GL.glVertexAttribPointer(1, 3, GL.GL_FLOAT, GL.GL_FALSE, 0, GL.GLvoidp(len(vertices)*FLOAT_SIZE))
+        GL.glVertexAttribPointer(1, 3, GL.GL_FLOAT, GL.GL_FALSE, 0, GL.GLvoidp(vertices.nbytes))
 
         indexBufferObject = GL.glGenBuffers(1)
         GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, indexBufferObject)
-        array_type = (GL.GLuint*len(self.indices))
         GL.glBufferData(
                 GL.GL_ELEMENT_ARRAY_BUFFER,
-                len(self.indices)*FLOAT_SIZE,
-                array_type(*self.indices),
+                indices.nbytes,
+                indices,
                 GL.GL_STATIC_DRAW)
 
         GL.glBindVertexArray(0)
 
     def render(self):
         GL.glBindVertexArray(self.vao)
-        GL.glDrawElements(self.draw_method, len(self.indices), GL.GL_UNSIGNED_INT, None)
+        GL.glDrawElements(self.draw_method, self.num_indices, GL.GL_UNSIGNED_INT, None)
         GL.glBindVertexArray(0)
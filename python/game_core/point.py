@@ -1,12 +1,39 @@
-from .abstract_vector import AbstractVector
+from .abstract_vector import AbstractVector, AbstractVectorArray
+import math
+
 import numpy
 
-__all__ = ['Point']
+__all__ = ['Point', 'PointArray']
 
 class Point(AbstractVector):
+    __slots__ = ()
+
     @property
     def w(self):
         return 1.0
 
     def distance(self, other):
-        return numpy.linalg.norm(self - other)
+        if isinstance(other, AbstractVectorArray):
+            return other.distance(self)
+        data = self._data
+        x = data[0] - other[0]
+        y = data[1] - other[1]
+        z = data[2] - other[2]
+        return math.sqrt(x * x + y * y + z * z)
+
+
+class PointArray(AbstractVectorArray):
+    SCALAR_CLS = Point
+    w = 1.0
+
+    def distance(self, other):
+        """ Get the distance from each point to `other`
+
+        Args:
+            other (Union[Point, PointArray])
+
+        Returns:
+            numpy.ndarray
+        """
+        delta = self._data - self._as_vectors(other)
+        return numpy.sqrt(numpy.einsum('ij,ij->i', delta, delta))
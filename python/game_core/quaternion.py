@@ -1,127 +1,212 @@
-__all__ = ['Quaternion']
+__all__ = ['Quaternion', 'QuaternionArray']
 
 #============================================================================#
 #================================================================= IMPORTS ==#
 import math
 
 import numpy
+from typing import List, TYPE_CHECKING, Union
 
+if TYPE_CHECKING:
+    from .abstract_vector import AbstractVector, AbstractVectorArray
+    from .matrix import Matrix
+
+# above this dot product two rotations are close enough that slerp falls
+# back to a normalized linear interpolation to avoid dividing by ~0
+_SLERP_THRESHOLD = 0.9995
 
 
 #============================================================================#
 #=================================================================== CLASS ==#
 class Quaternion(object):
+    """ A rotation stored as ``(x, y, z, w)``.
+
+    Multiplying quaternions composes their rotations: ``(a * b)`` rotates
+    by ``b`` and then by ``a``.  Since `Matrix` uses the row vector
+    convention ``(a * b).as_matrix()`` is ``b.as_matrix() * a.as_matrix()``.
+    """
+    __slots__ = ('_data', )
+
     def __init__(self, *args):
+        """
+        Args:
+            *args: nothing for the identity rotation, the ``x, y, z, w``
+                components, a sequence of the 4 components, another
+                `Quaternion` to copy or a `Matrix` to get the rotation of
+
+        Raises:
+            ValueError: if the args can not be cast to a quaternion
+        """
         from . import Matrix
         if len(args) == 0:
-            self._data = numpy.array([0,0,0,0], dtype=float)
+            self._data = [0.0, 0.0, 0.0, 1.0]
+        elif len(args) == 4:
+            self._data = [float(arg) for arg in args]
+        elif len(args) == 1 and isinstance(args[0], Quaternion):
+            self._data = args[0]._data[:]
         elif len(args) == 1 and isinstance(args[0], Matrix):
-            self._data = numpy.array([0,0,0,0], dtype=float)
+            self._data = [0.0, 0.0, 0.0, 1.0]
             args[0].as_quaternion(self)
-        # elif len(args) == 1:
-        #     from .abstract_vector import AbstractVector
-        #     if isinstance(args[0], AbstractVector):
-        #         data = [item for item in args[0]]
-        #         data += [0.0]
-        #     elif len(args[0]) > 4:
-        #         data = [args[0][i] for i in xrange(4)]
-        #     else:
-        #         data = [item for item in args[0]]
-        #         data += [0.0] * (4-len(args[0]))
-        #     self._data = numpy.array(data, dtype=float)
+        elif len(args) == 1 and hasattr(args[0], '__iter__') and len(args[0]) == 4:
+            self._data = [float(arg) for arg in args[0]]
         else:
-            ValueError('Unable to cast args to Quaternion: %s' % args)
+            raise ValueError('Unable to cast args to Quaternion: %s' % (args, ))
+
+    @classmethod
+    def _from_data(cls, data):
+        # type: (List[float]) -> Quaternion
+        result = object.__new__(cls)
+        result._data = data
+        return result
+
+    @classmethod
+    def from_axis_angle(cls, v, angle):
+        # type: (AbstractVector, float) -> Quaternion
+        return cls().set_axis_angle(v, angle)
+
+    def copy(self):
+        return self._from_data(self._data[:])
 
     @property
     def x(self):
-        return self[0]
+        return self._data[0]
 
     @x.setter
     def x(self, value):
-        self[0] = value
+        self._data[0] = float(value)
 
     @property
     def y(self):
-        return self[1]
+        return self._data[1]
 
     @y.setter
     def y(self, value):
-        self[1] = value
+        self._data[1] = float(value)
 
     @property
     def z(self):
-        return self[2]
+        return self._data[2]
 
     @z.setter
     def z(self, value):
-        self[2] = value
+        self._data[2] = float(value)
 
     @property
     def w(self):
-        return self[3]
+        return self._data[3]
 
     @w.setter
     def w(self, value):
-        self[3] = value
+        self._data[3] = float(value)
 
     def __getitem__(self, index):
-        return self._data.item(index)
+        return self._data[index]
 
     def __setitem__(self, index, value):
-        self._data.itemset(index, value)
+        self._data[index] = float(value)
+
+    def __len__(self):
+        return 4
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __eq__(self, other):
+        if not isinstance(other, Quaternion):
+            return False
+        return self._data == other._data
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '%s(%s, %s, %s, %s)' % ((type(self).__name__, ) + tuple(self._data))
+
+    __str__ = __repr__
 
     def length(self):
-        return numpy.linalg.norm(self._data)
+        x, y, z, w = self._data
+        return math.sqrt(x * x + y * y + z * z + w * w)
 
     def normalize(self):
-        self._data /= self.length()
+        length = self.length()
+        data = self._data
+        for i in xrange(4):
+            data[i] /= length
+        return self
 
     def normal(self):
-        result = Quaternion()
-        result._data = self._data / self.length()
-        return result
+        return self.copy().normalize()
+
+    def dot(self, other):
+        # type: (Quaternion) -> float
+        x1, y1, z1, w1 = self._data
+        x2, y2, z2, w2 = other._data
+        return x1 * x2 + y1 * y2 + z1 * z2 + w1 * w2
 
     def __mul__(self, other):
-        from . import Vector
-        if isinstance(other, Vector):
+        from .abstract_vector import AbstractVector
+        if isinstance(other, QuaternionArray):
+            return NotImplemented
+        if isinstance(other, AbstractVector):
             return self.vector_mult(other)
-        result = Quaternion(other=self)
+        result = self.copy()
         result *= other
         return result
 
     def __imul__(self, other):
-        w1 = self.w
-        x1 = self.x
-        y1 = self.y
-        z1 = self.z
-
-        w1 = other.w
-        x1 = other.x
-        y1 = other.y
-        z1 = other.z
-
-        self.w = w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2
-        self.x = w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2
-        self.y = w1 * y2 + y1 * w2 + z1 * x2 - x1 * z2
-        self.z = w1 * z2 + z1 * w2 + x1 * y2 - y1 * x2
+        x1, y1, z1, w1 = self._data
+        x2, y2, z2, w2 = other._data
+        self._data[:] = [
+            w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2,
+            w1 * y2 + y1 * w2 + z1 * x2 - x1 * z2,
+            w1 * z2 + z1 * w2 + x1 * y2 - y1 * x2,
+            w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2,
+        ]
         return self
 
     def conjugate(self):
-        q = self.normal()
-        q.x = -q.x
-        q.y = -q.y
-        q.z = -q.z
-        return q
+        x, y, z, w = self._data
+        return self._from_data([-x, -y, -z, w])
+
+    def inverse(self):
+        x, y, z, w = self._data
+        length_sq = x * x + y * y + z * z + w * w
+        return self._from_data([-x / length_sq, -y / length_sq, -z / length_sq, w / length_sq])
 
     def vector_mult(self, v):
-        v = v.normal()
-        v = Quaternion(v.x, v.y, v.z)
-        result = self * v * self.conjugate()
-        return result.as_vector()
+        # type: (AbstractVector) -> AbstractVector
+        """ Rotate a vector by this (normalized) quaternion
+
+        Returns:
+            AbstractVector: a new vector of the same type as `v`
+        """
+        x, y, z, w = self._data
+        vx, vy, vz = v._data
+        # t = 2 * cross(q.xyz, v)
+        tx = 2.0 * (y * vz - z * vy)
+        ty = 2.0 * (z * vx - x * vz)
+        tz = 2.0 * (x * vy - y * vx)
+        # v + w * t + cross(q.xyz, t)
+        return v._from_data([
+            vx + w * tx + (y * tz - z * ty),
+            vy + w * ty + (z * tx - x * tz),
+            vz + w * tz + (x * ty - y * tx),
+        ])
 
     def get_axis_angle(self):
-        angle = math.acos(self.w) * 2.0
-        return (self.as_vector(), angle)
+        """
+        Returns:
+            Tuple[Vector, float]: the normalized axis and the angle in radians
+        """
+        from . import Vector
+        x, y, z, w = self.normal()._data
+        angle = math.acos(max(-1.0, min(1.0, w))) * 2.0
+        sin_half_angle = math.sqrt(max(0.0, 1.0 - w * w))
+        if sin_half_angle < 1e-12:
+            # no rotation so any axis will do
+            return (Vector(1.0, 0.0, 0.0), 0.0)
+        return (Vector(x / sin_half_angle, y / sin_half_angle, z / sin_half_angle), angle)
 
     def set_axis_angle(self, v, angle):
         v = v.normal()
@@ -133,6 +218,38 @@ class Quaternion(object):
         self.z = v.z * sin_angle
         return self
 
+    def nlerp(self, other, t):
+        # type: (Quaternion, float) -> Quaternion
+        """ Interpolate to another rotation along the shortest path and
+        normalize the result.  Cheaper than `slerp` but the angular speed is
+        not constant.
+        """
+        if self.dot(other) < 0.0:
+            t2 = -t
+        else:
+            t2 = t
+        t1 = 1.0 - t
+        result = self._from_data([a * t1 + b * t2 for a, b in zip(self._data, other._data)])
+        return result.normalize()
+
+    def slerp(self, other, t):
+        # type: (Quaternion, float) -> Quaternion
+        """ Spherically interpolate to another rotation along the shortest
+        path
+        """
+        dot = self.dot(other)
+        sign = 1.0
+        if dot < 0.0:
+            dot = -dot
+            sign = -1.0
+        if dot > _SLERP_THRESHOLD:
+            return self.nlerp(other, t)
+        theta = math.acos(dot)
+        sin_theta = math.sin(theta)
+        t1 = math.sin((1.0 - t) * theta) / sin_theta
+        t2 = sign * math.sin(t * theta) / sin_theta
+        return self._from_data([a * t1 + b * t2 for a, b in zip(self._data, other._data)])
+
     def as_vector(self, v=None):
         if v is None:
             from . import Vector
@@ -156,21 +273,327 @@ class Quaternion(object):
         y_sq = y * y
         z_sq = z * z
 
-        m[0,0] = 1.0 - (2.0 * y_sq) - (2.0 * z_sq) 
-        m[0,1] = (2.0 * x * y) + (2.0 * w * z) 
-        m[0,2] = (2.0 * x * z) - (2.0 * w * y) 
+        m[0,0] = 1.0 - (2.0 * y_sq) - (2.0 * z_sq)
+        m[0,1] = (2.0 * x * y) + (2.0 * w * z)
+        m[0,2] = (2.0 * x * z) - (2.0 * w * y)
 
-        m[1,0] = (2.0 * x * y) - (2.0 * w * z) 
-        m[1,1] = 1.0 - (2.0 * x_sq) - (2.0 * z_sq) 
-        m[1,2] = (2.0 * y * z) + (2.0 * w * x) 
+        m[1,0] = (2.0 * x * y) - (2.0 * w * z)
+        m[1,1] = 1.0 - (2.0 * x_sq) - (2.0 * z_sq)
+        m[1,2] = (2.0 * y * z) + (2.0 * w * x)
 
-        m[2,0] = (2.0 * x * z) + (2.0 * w * y) 
+        m[2,0] = (2.0 * x * z) + (2.0 * w * y)
         m[2,1] = (2.0 * y * z) - (2.0 * w * x)
         m[2,2] = 1.0 - (2.0 * x_sq) - (2.0 * y_sq)
 
         return m
 
 
+class QuaternionArray(object):
+    """ A packed array of quaternions stored as an (N, 4) numpy array of
+    ``(x, y, z, w)`` rows.
+
+    Supports the same operations as `Quaternion` on every quaternion at once
+    so that the orientations of many objects can be composed, interpolated
+    and converted to matrices with a few numpy calls.  The other operand of
+    an operation can be another array of the same length or a single
+    `Quaternion`.
+
+    Indexing with an int returns a single `Quaternion` and indexing with
+    anything else returns a new array.
+    """
+    def __init__(self, data=None):
+        """
+        Args:
+            data (Union[int, numpy.ndarray, Iterable[Sequence[float]]]): the
+                number of identity quaternions to create or the quaternions
+                to copy
+        """
+        if data is None:
+            data = 0
+        if isinstance(data, (int, long)):
+            self._data = numpy.zeros((data, 4), dtype=float)
+            self._data[:, 3] = 1.0
+            return
+        if not isinstance(data, numpy.ndarray):
+            data = [tuple(q) for q in data]
+        self._data = numpy.array(data, dtype=float).reshape(-1, 4)
+
+    @classmethod
+    def from_axis_angle(cls, axes, angles):
+        """
+        Args:
+            axes (Union[AbstractVectorArray, numpy.ndarray]): (N, 3) axes
+                (they don't need to be normalized)
+            angles (Union[float, numpy.ndarray]): the angles in radians
+
+        Returns:
+            QuaternionArray
+        """
+        axes = numpy.asarray(axes, dtype=float).reshape(-1, 3)
+        half_angles = numpy.asarray(angles, dtype=float) / 2.0
+        lengths = numpy.sqrt(numpy.einsum('ij,ij->i', axes, axes))
+        data = numpy.empty((len(axes), 4))
+        data[:, :3] = axes * (numpy.sin(half_angles) / lengths)[..., numpy.newaxis]
+        data[:, 3] = numpy.cos(half_angles)
+        return cls._new(data)
+
+    @classmethod
+    def from_matrices(cls, matrices):
+        """ Get the rotation of each matrix of an array (see
+        `Matrix.as_quaternion`)
+
+        Args:
+            matrices (numpy.ndarray): (N, 4, 4) or (N, 3, 3) rotation matrices
+                using the row vector convention
+
+        Returns:
+            QuaternionArray
+        """
+        m = numpy.asarray(matrices, dtype=float)
+        m00 = m[:, 0, 0]
+        m11 = m[:, 1, 1]
+        m22 = m[:, 2, 2]
+        data = numpy.empty((len(m), 4))
+
+        # use the largest component to compute the others for stability
+        trace = m00 + m11 + m22
+        use_w = trace > 0.0
+        use_x = ~use_w & (m00 > m11) & (m00 > m22)
+        use_y = ~use_w & ~use_x & (m11 > m22)
+        use_z = ~use_w & ~use_x & ~use_y
+
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            s = numpy.sqrt(1.0 + trace) * 2.0
+            data[use_w] = numpy.column_stack((
+                m[:, 1, 2] - m[:, 2, 1],
+                m[:, 2, 0] - m[:, 0, 2],
+                m[:, 0, 1] - m[:, 1, 0],
+                0.25 * s * s,
+            ))[use_w] / s[use_w, numpy.newaxis]
+
+            s = numpy.sqrt(1.0 + m00 - m11 - m22) * 2.0
+            data[use_x] = numpy.column_stack((
+                0.25 * s * s,
+                m[:, 0, 1] + m[:, 1, 0],
+                m[:, 0, 2] + m[:, 2, 0],
+                m[:, 1, 2] - m[:, 2, 1],
+            ))[use_x] / s[use_x, numpy.newaxis]
+
+            s = numpy.sqrt(1.0 + m11 - m00 - m22) * 2.0
+            data[use_y] = numpy.column_stack((
+                m[:, 0, 1] + m[:, 1, 0],
+                0.25 * s * s,
+                m[:, 1, 2] + m[:, 2, 1],
+                m[:, 2, 0] - m[:, 0, 2],
+            ))[use_y] / s[use_y, numpy.newaxis]
+
+            s = numpy.sqrt(1.0 + m22 - m00 - m11) * 2.0
+            data[use_z] = numpy.column_stack((
+                m[:, 0, 2] + m[:, 2, 0],
+                m[:, 1, 2] + m[:, 2, 1],
+                0.25 * s * s,
+                m[:, 0, 1] - m[:, 1, 0],
+            ))[use_z] / s[use_z, numpy.newaxis]
+        return cls._new(data)
+
+    @classmethod
+    def _new(cls, data):
+        result = cls.__new__(cls)
+        result._data = data
+        return result
+
+    def copy(self):
+        return type(self)(self._data)
+
+    def __array__(self, dtype=None):
+        if dtype is None:
+            return self._data
+        return self._data.astype(dtype)
+
+    def __str__(self):
+        return str(self._data)
 
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, self._data.tolist())
 
+    def __len__(self):
+        return len(self._data)
 
+    def __iter__(self):
+        for data in self._data.tolist():
+            yield Quaternion._from_data(data)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, long, numpy.integer)):
+            return Quaternion._from_data(self._data[index].tolist())
+        return self._new(self._data[index].reshape(-1, 4))
+
+    def __setitem__(self, index, value):
+        self._data[index] = self._as_operand(value)
+
+    def tolist(self):
+        return self._data.tolist()
+
+    @staticmethod
+    def _as_operand(other):
+        if isinstance(other, QuaternionArray):
+            return other._data
+        if isinstance(other, Quaternion):
+            return numpy.array(other._data)
+        return numpy.asarray(other, dtype=float)
+
+    def length(self):
+        return numpy.sqrt(numpy.einsum('ij,ij->i', self._data, self._data))
+
+    def normalize(self):
+        self._data /= self.length()[:, numpy.newaxis]
+        return self
+
+    def normal(self):
+        return self._new(self._data / self.length()[:, numpy.newaxis])
+
+    def conjugate(self):
+        data = self._data * (-1.0, -1.0, -1.0, 1.0)
+        return self._new(data)
+
+    def dot(self, other):
+        # type: (Union[QuaternionArray, Quaternion]) -> numpy.ndarray
+        other = numpy.broadcast_to(self._as_operand(other), self._data.shape)
+        return numpy.einsum('ij,ij->i', self._data, other)
+
+    @staticmethod
+    def _multiply(a, b):
+        """ Hamilton product of two arrays of quaternions that broadcast
+        against each other
+        """
+        x1, y1, z1, w1 = a[..., 0], a[..., 1], a[..., 2], a[..., 3]
+        x2, y2, z2, w2 = b[..., 0], b[..., 1], b[..., 2], b[..., 3]
+        return numpy.stack((
+            w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2,
+            w1 * y2 + y1 * w2 + z1 * x2 - x1 * z2,
+            w1 * z2 + z1 * w2 + x1 * y2 - y1 * x2,
+            w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2,
+        ), axis=-1)
+
+    def __mul__(self, other):
+        from .abstract_vector import AbstractVector, AbstractVectorArray
+        if isinstance(other, (AbstractVector, AbstractVectorArray)):
+            return self.rotate(other)
+        return self._new(self._multiply(self._data, self._as_operand(other)))
+
+    def __rmul__(self, other):
+        return self._new(self._multiply(self._as_operand(other), self._data))
+
+    def __imul__(self, other):
+        self._data = self._multiply(self._data, self._as_operand(other))
+        return self
+
+    def rotate(self, vectors):
+        # type: (Union[AbstractVector, AbstractVectorArray, numpy.ndarray]) -> Union[AbstractVectorArray, numpy.ndarray]
+        """ Rotate vectors by these (normalized) quaternions
+
+        Args:
+            vectors (Union[AbstractVector, AbstractVectorArray, numpy.ndarray]):
+                one vector per quaternion or a single vector to rotate by
+                every quaternion
+
+        Returns:
+            Union[AbstractVectorArray, numpy.ndarray]: an array of the same
+                type as `vectors` (an array of `vectors`' type for a single
+                vector) or an (N, 3) numpy array
+        """
+        from .abstract_vector import AbstractVector, AbstractVectorArray
+        from . import Point, PointArray, VectorArray
+        if isinstance(vectors, AbstractVectorArray):
+            v = vectors._data
+        elif isinstance(vectors, AbstractVector):
+            v = numpy.array(vectors._data)
+        else:
+            v = numpy.asarray(vectors, dtype=float)
+        q = self._data[:, :3]
+        w = self._data[:, 3:]
+        t = 2.0 * numpy.cross(q, v)
+        result = v + w * t + numpy.cross(q, t)
+
+        if isinstance(vectors, AbstractVectorArray):
+            return vectors._new(result)
+        elif isinstance(vectors, Point):
+            return PointArray(result)
+        elif isinstance(vectors, AbstractVector):
+            return VectorArray(result)
+        return result
+
+    def nlerp(self, other, t):
+        # type: (Union[QuaternionArray, Quaternion], Union[float, numpy.ndarray]) -> QuaternionArray
+        """ Normalized linear interpolation along the shortest path (see
+        `Quaternion.nlerp`)
+
+        Args:
+            other (Union[QuaternionArray, Quaternion])
+            t (Union[float, numpy.ndarray]): a single amount or one per
+                quaternion
+        """
+        other = self._as_operand(other)
+        t = numpy.asarray(t, dtype=float)[..., numpy.newaxis]
+        sign = numpy.where(self.dot(other) < 0.0, -1.0, 1.0)[:, numpy.newaxis]
+        return self._new(self._data * (1.0 - t) + other * (sign * t)).normalize()
+
+    def slerp(self, other, t):
+        # type: (Union[QuaternionArray, Quaternion], Union[float, numpy.ndarray]) -> QuaternionArray
+        """ Spherical interpolation along the shortest path (see
+        `Quaternion.slerp`)
+
+        Args:
+            other (Union[QuaternionArray, Quaternion])
+            t (Union[float, numpy.ndarray]): a single amount or one per
+                quaternion
+        """
+        other = self._as_operand(other)
+        t = numpy.asarray(t, dtype=float)
+        dot = self.dot(other)
+        sign = numpy.where(dot < 0.0, -1.0, 1.0)
+        dot = numpy.minimum(numpy.abs(dot), 1.0)
+
+        close = dot > _SLERP_THRESHOLD
+        theta = numpy.arccos(dot)
+        sin_theta = numpy.where(close, 1.0, numpy.sin(theta))
+        t1 = numpy.where(close, 1.0 - t, numpy.sin((1.0 - t) * theta) / sin_theta)
+        t2 = numpy.where(close, t, numpy.sin(t * theta) / sin_theta) * sign
+
+        data = self._data * t1[:, numpy.newaxis] + other * t2[:, numpy.newaxis]
+        if close.any():
+            lengths = numpy.sqrt(numpy.einsum('ij,ij->i', data[close], data[close]))
+            data[close] /= lengths[:, numpy.newaxis]
+        return self._new(data)
+
+    def as_matrices(self):
+        # type: () -> numpy.ndarray
+        """ Get the rotation matrix of each quaternion (see
+        `Quaternion.as_matrix`)
+
+        Returns:
+            numpy.ndarray: (N, 4, 4) matrices using the row vector convention
+        """
+        x, y, z, w = self._data.T
+        xx = x * x
+        yy = y * y
+        zz = z * z
+        xy = x * y
+        xz = x * z
+        yz = y * z
+        wx = w * x
+        wy = w * y
+        wz = w * z
+
+        result = numpy.zeros((len(self._data), 4, 4))
+        result[:, 0, 0] = 1.0 - 2.0 * (yy + zz)
+        result[:, 0, 1] = 2.0 * (xy + wz)
+        result[:, 0, 2] = 2.0 * (xz - wy)
+        result[:, 1, 0] = 2.0 * (xy - wz)
+        result[:, 1, 1] = 1.0 - 2.0 * (xx + zz)
+        result[:, 1, 2] = 2.0 * (yz + wx)
+        result[:, 2, 0] = 2.0 * (xz + wy)
+        result[:, 2, 1] = 2.0 * (yz - wx)
+        result[:, 2, 2] = 1.0 - 2.0 * (xx + yy)
+        result[:, 3, 3] = 1.0
+        return result
@@ -0,0 +1,156 @@
+""" Binary file format for `AbstractTree` objects.
+
+A tree is stored as a header followed by three sections, each aligned to
+`ALIGNMENT` bytes so that they can be memory mapped:
+
+    - branch bits: one bit per node in level order (see
+      `AbstractTreeStorage.get_level_order`) saying whether the node is a
+      branch, packed with ``numpy.packbits``.
+    - branch ranks: the number of branches before each block of
+      `MappedTreeStorage.RANK_BLOCK_SIZE` nodes so that the children of a
+      node can be found without reading the bits of every node before it.
+    - values: the value of each node in level order as a packed array.
+
+The structure costs a little over one bit per node and leaves only cost
+their value.
+"""
+__all__ = ['TreeFileHeader', 'write_tree', 'read_header', 'read_tree']
+
+import collections
+import struct
+
+import numpy
+
+from . import tree_storage
+
+# identifies the file type and format version
+MAGIC = 'GAMETREE'
+VERSION = 1
+
+# the byte alignment of each section
+ALIGNMENT = 16
+
+# magic, version, dimensions, max depth, size, number of nodes, value dtype length
+_HEADER_FORMAT = '<8sIIIdQI'
+
+TreeFileHeader = collections.namedtuple('TreeFileHeader', ['dimensions', 'max_depth', 'size', 'num_nodes', 'dtype'])
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _get_section_layout(header, dtype_length):
+    """ Get the offset and length (in items) of each section
+
+    Returns:
+        Tuple[Tuple[int, int], Tuple[int, int], Tuple[int, int]]: the branch
+            bits, branch ranks and values sections
+    """
+    block_size = tree_storage.MappedTreeStorage.RANK_BLOCK_SIZE
+    num_blocks = max(1, (header.num_nodes + block_size - 1) // block_size)
+    bits_offset = _align(struct.calcsize(_HEADER_FORMAT) + dtype_length)
+    bits_length = num_blocks * block_size // 8
+    ranks_offset = _align(bits_offset + bits_length)
+    values_offset = _align(ranks_offset + num_blocks * 4)
+    return (bits_offset, bits_length), (ranks_offset, num_blocks), (values_offset, header.num_nodes)
+
+
+def _get_value_array(values, dtype):
+    """ Convert the values of a tree's nodes to a packed array
+
+    Raises:
+        TypeError: if the values cannot be packed
+    """
+    if numpy.dtype(dtype).hasobject:
+        values = numpy.array(values.tolist())
+    else:
+        values = numpy.asarray(values, dtype=dtype)
+    if values.dtype.hasobject or values.ndim != 1:
+        raise TypeError('tree values can not be packed into an array of a fixed size type')
+    return values
+
+
+def write_tree(tree, path):
+    """ Write a tree to a file
+
+    Args:
+        tree (AbstractTree)
+        path (str)
+
+    Raises:
+        TypeError: if the values of the tree's nodes can not be packed
+            into a numpy array (e.g. they are arbitrary python objects)
+    """
+    storage = tree._storage
+    handles = storage.get_level_order(tree._data)
+    is_branch = ~storage.is_leaf_batch(handles)
+    values = _get_value_array(storage.get_value_batch(handles), tree.VALUE_DTYPE)
+
+    header = TreeFileHeader(tree.DIMENSIONS, tree.max_depth, tree.size, len(handles), values.dtype)
+    dtype_str = values.dtype.str
+    bits_section, ranks_section, values_section = _get_section_layout(header, len(dtype_str))
+
+    # pad to whole rank blocks so readers never index past the end
+    block_size = tree_storage.MappedTreeStorage.RANK_BLOCK_SIZE
+    padded = numpy.zeros(ranks_section[1] * block_size, dtype=bool)
+    padded[:len(is_branch)] = is_branch
+    branch_bits = numpy.packbits(padded)
+    branch_ranks = numpy.zeros(ranks_section[1], dtype='<u4')
+    branch_ranks[1:] = numpy.cumsum(padded.reshape(-1, block_size).sum(axis=1))[:-1]
+
+    with open(path, 'wb') as f:
+        f.write(struct.pack(_HEADER_FORMAT, MAGIC, VERSION, header.dimensions, header.max_depth, header.size, header.num_nodes, len(dtype_str)))
+        f.write(dtype_str)
+        for offset, array in ((bits_section[0], branch_bits), (ranks_section[0], branch_ranks), (values_section[0], values)):
+            f.write('\0' * (offset - f.tell()))
+            f.write(array.tobytes())
+
+
+def read_header(path):
+    """ Read the header of a tree file
+
+    Returns:
+        TreeFileHeader
+
+    Raises:
+        ValueError: if the file is not a tree file
+    """
+    with open(path, 'rb') as f:
+        data = f.read(struct.calcsize(_HEADER_FORMAT))
+        if len(data) != struct.calcsize(_HEADER_FORMAT):
+            raise ValueError('%s is not a tree file' % path)
+        magic, version, dimensions, max_depth, size, num_nodes, dtype_length = struct.unpack(_HEADER_FORMAT, data)
+        if magic != MAGIC:
+            raise ValueError('%s is not a tree file' % path)
+        if version != VERSION:
+            raise ValueError('%s has unsupported tree file version %s' % (path, version))
+        dtype = numpy.dtype(f.read(dtype_length))
+    return TreeFileHeader(dimensions, max_depth, size, num_nodes, dtype)
+
+
+def read_tree(path, mmap=False):
+    """ Read the arrays of a tree file
+
+    Args:
+        path (str)
+        mmap (bool): memory map the arrays instead of reading them
+
+    Returns:
+        Tuple[TreeFileHeader, numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+            the header, branch bits, branch ranks and values (see the module
+            docs)
+    """
+    header = read_header(path)
+    sections = _get_section_layout(header, len(header.dtype.str))
+    dtypes = (numpy.uint8, numpy.dtype('<u4'), header.dtype)
+    arrays = []
+    if mmap:
+        for (offset, length), dtype in zip(sections, dtypes):
+            arrays.append(numpy.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(length,)))
+    else:
+        with open(path, 'rb') as f:
+            for (offset, length), dtype in zip(sections, dtypes):
+                f.seek(offset)
+                arrays.append(numpy.fromfile(f, dtype=dtype, count=length))
+    return (header, ) + tuple(arrays)
@@ -0,0 +1,513 @@
+__all__ = ['AbstractTreeStorage', 'ObjectTreeStorage', 'ArrayTreeStorage', 'MappedTreeStorage']
+
+from typing import Any, Callable, List, Optional, Sequence
+
+import numpy
+
+
+class _TreeNodeData(object):
+    """ Internal object to store just the data of a node in a tree
+    """
+    def __init__(self, value=None, children=None):
+        # type: (Optional[Any], Optional[List[Optional[_TreeNodeData]]]) -> None
+        self.value = value
+        self.children = children
+
+
+class AbstractTreeStorage(object):
+    """ Base class for the objects that hold the permanent data of a tree.
+
+    A storage hands out "handles" for its nodes.  A handle is whatever the
+    storage needs to find a node's data again (e.g. a python object or an
+    index into an array) and is what `TreeNode` proxies keep as their
+    ``_data`` attribute.  Handles are only meaningful to the storage that
+    created them.
+
+    Attributes:
+        num_children (int): The number of children each branch node has.
+        get_default_value (Callable[[], Any]): Called to get the initial
+            value of newly created nodes.
+    """
+    # The handle used to represent a node that does not exist
+    NULL = None
+
+    # The numpy dtype used for arrays of handles
+    HANDLE_DTYPE = object
+
+    def __init__(self, num_children, get_default_value, dtype=object):
+        # type: (int, Callable[[], Any], Any) -> None
+        self.num_children = num_children
+        self.get_default_value = get_default_value
+
+    def create_root(self):
+        """ Create a leaf node to use as the root of a tree
+
+        Returns:
+            Any: the new node's handle
+        """
+        raise NotImplementedError
+
+    def get_value(self, handle):
+        raise NotImplementedError
+
+    def set_value(self, handle, value):
+        raise NotImplementedError
+
+    def is_leaf(self, handle):
+        # type: (Any) -> bool
+        raise NotImplementedError
+
+    def get_children(self, handle):
+        # type: (Any) -> Optional[Sequence[Any]]
+        """ Get the handles of a node's children
+
+        Returns:
+            Optional[Sequence[Any]]: None if the node is a leaf
+        """
+        raise NotImplementedError
+
+    def get_child(self, handle, index):
+        """ Get the handle of a single child of a branch node
+
+        .. warning:: This does NOT do any error checking for leaf nodes.
+            It is up to the caller do perform these checks.
+        """
+        raise NotImplementedError
+
+    def split(self, handle):
+        """ Give a leaf node a full set of default valued children
+        """
+        raise NotImplementedError
+
+    def merge(self, handle):
+        """ Remove all of a branch node's descendants making it a leaf.
+
+        The node keeps its current value.
+        """
+        raise NotImplementedError
+
+    def defragment(self, root):
+        """ Repack the storage so that it only holds the nodes reachable
+        from `root`.
+
+        All existing handles are invalidated.
+
+        Returns:
+            Any: the new handle of `root`
+        """
+        return root
+
+    def get_level_order(self, root):
+        """ Get the handles of all of the nodes reachable from `root` in level
+        order (breadth first) with the children of each branch kept together.
+
+        In this order the children of the n-th branch start at index
+        ``1 + n * num_children``.
+
+        Returns:
+            numpy.ndarray
+        """
+        get_children = self.get_children
+        handles = [root]
+        for handle in handles:  # appending while iterating walks each level in turn
+            children = get_children(handle)
+            if children is not None:
+                handles.extend(children)
+        result = numpy.empty(len(handles), dtype=self.HANDLE_DTYPE)
+        result[:] = handles
+        return result
+
+    def load_level_order(self, is_branch, values):
+        # type: (numpy.ndarray, Sequence[Any]) -> Any
+        """ Create the nodes of a tree from its level order description (see
+        `get_level_order`).  The storage should be empty.
+
+        Args:
+            is_branch (numpy.ndarray): whether each node is a branch
+            values (Sequence[Any]): the value of each node
+
+        Returns:
+            Any: the handle of the root node
+        """
+        root = self.create_root()
+        handles = [root]
+        branch_indexes = numpy.flatnonzero(is_branch)
+        get_children = self.get_children
+        for index in branch_indexes:
+            handle = handles[index]
+            self.split(handle)
+            handles.extend(get_children(handle))
+        set_value = self.set_value
+        for handle, value in zip(handles, values):
+            set_value(handle, value)
+        return root
+
+    def create_handle_array(self, handle, count):
+        """ Create an array of handles all set to `handle`
+
+        Returns:
+            numpy.ndarray
+        """
+        result = numpy.empty(count, dtype=self.HANDLE_DTYPE)
+        result.fill(handle)
+        return result
+
+    def is_leaf_batch(self, handles):
+        # type: (numpy.ndarray) -> numpy.ndarray
+        """ Batch version of `is_leaf`
+
+        Returns:
+            numpy.ndarray: boolean array
+        """
+        is_leaf = self.is_leaf
+        return numpy.fromiter((is_leaf(handle) for handle in handles), dtype=bool, count=len(handles))
+
+    def get_child_batch(self, handles, indexes):
+        # type: (numpy.ndarray, numpy.ndarray) -> numpy.ndarray
+        """ Batch version of `get_child`
+        """
+        get_child = self.get_child
+        result = numpy.empty(len(handles), dtype=self.HANDLE_DTYPE)
+        for i, handle in enumerate(handles):
+            result[i] = get_child(handle, indexes[i])
+        return result
+
+    def get_value_batch(self, handles):
+        # type: (numpy.ndarray) -> numpy.ndarray
+        """ Batch version of `get_value`
+        """
+        get_value = self.get_value
+        result = numpy.empty(len(handles), dtype=object)
+        for i, handle in enumerate(handles):
+            result[i] = get_value(handle)
+        return result
+
+
+class ObjectTreeStorage(AbstractTreeStorage):
+    """ Stores each node as a `_TreeNodeData` object.
+
+    Handles are the `_TreeNodeData` objects themselves.  This is the most
+    flexible storage (values can be anything and sub-trees can be built by
+    hand) but every node costs several python objects.
+    """
+    def create_root(self):
+        return _TreeNodeData(value=self.get_default_value())
+
+    def get_value(self, handle):
+        return handle.value
+
+    def set_value(self, handle, value):
+        handle.value = value
+
+    def is_leaf(self, handle):
+        return handle.children is None
+
+    def get_children(self, handle):
+        return handle.children
+
+    def get_child(self, handle, index):
+        return handle.children[index]
+
+    def split(self, handle):
+        get_default_value = self.get_default_value
+        handle.children = [_TreeNodeData(value=get_default_value()) for i in range(self.num_children)]
+
+    def merge(self, handle):
+        handle.children = None
+
+
+class ArrayTreeStorage(AbstractTreeStorage):
+    """ Stores all nodes in a pair of contiguous numpy arrays.
+
+    Handles are integer indexes into those arrays.  The children of a branch
+    are always allocated as a single contiguous block so a branch only needs
+    to store the index of its first child.  With a small value dtype (e.g.
+    ``numpy.uint16`` block ids) a node costs a handful of bytes instead of
+    the hundreds of bytes a python object costs, and whole-tree passes walk
+    memory linearly.
+
+    Merged nodes are put on a free list and reused by later splits.  Use
+    `defragment` to release them.
+
+    Attributes:
+        values (numpy.ndarray): The value of each node.
+        first_child (numpy.ndarray): The index of each node's first child or
+            -1 for leaf nodes.
+        num_nodes (int): The number of array entries that have been
+            allocated, including any on the free list.
+    """
+    NULL = -1
+    HANDLE_DTYPE = numpy.intp
+
+    def __init__(self, num_children, get_default_value, dtype=object, capacity=1024):
+        # type: (int, Callable[[], Any], Any, int) -> None
+        super(ArrayTreeStorage, self).__init__(num_children, get_default_value, dtype=dtype)
+        self.dtype = numpy.dtype(dtype)
+        self.values = numpy.empty(capacity, dtype=self.dtype)
+        self.first_child = numpy.full(capacity, -1, dtype=numpy.int32)
+        self.num_nodes = 0
+        self._free_blocks = []  # type: List[int]
+
+    @property
+    def nbytes(self):
+        """ The number of bytes used by the nodes in this storage
+
+        Returns:
+            int
+        """
+        per_node = self.values.itemsize + self.first_child.itemsize
+        num_free = len(self._free_blocks) * self.num_children
+        return (self.num_nodes - num_free) * per_node
+
+    def _reserve(self, count):
+        """ Make sure there is room for `count` more nodes, growing the arrays
+        geometrically so that repeated splits are amortized O(1).
+        """
+        required = self.num_nodes + count
+        capacity = len(self.values)
+        if required <= capacity:
+            return
+        while capacity < required:
+            capacity *= 2
+
+        values = numpy.empty(capacity, dtype=self.dtype)
+        values[:self.num_nodes] = self.values[:self.num_nodes]
+        self.values = values
+
+        first_child = numpy.full(capacity, -1, dtype=numpy.int32)
+        first_child[:self.num_nodes] = self.first_child[:self.num_nodes]
+        self.first_child = first_child
+
+    def _allocate(self, count):
+        """ Allocate `count` contiguous default valued leaf nodes
+
+        Returns:
+            int: the index of the first allocated node
+        """
+        if count == self.num_children and self._free_blocks:
+            start = self._free_blocks.pop()
+            self._init_nodes(start, start + count)
+            return start
+
+        self._reserve(count)
+        start = self.num_nodes
+        end = start + count
+        self._init_nodes(start, end)
+        self.num_nodes = end
+        return start
+
+    def _init_nodes(self, start, end):
+        """ Make the nodes in the range [start, end) default valued leaves
+        """
+        if self.dtype.hasobject:
+            # object values may be mutable so each node needs its own
+            get_default_value = self.get_default_value
+            for i in range(start, end):
+                self.values[i] = get_default_value()
+        else:
+            self.values[start:end] = self.get_default_value()
+        self.first_child[start:end] = -1
+
+    def create_root(self):
+        return self._allocate(1)
+
+    def get_value(self, handle):
+        return self.values[handle]
+
+    def set_value(self, handle, value):
+        self.values[handle] = value
+
+    def is_leaf(self, handle):
+        return self.first_child[handle] < 0
+
+    def get_children(self, handle):
+        first = int(self.first_child[handle])
+        if first < 0:
+            return None
+        return range(first, first + self.num_children)
+
+    def get_child(self, handle, index):
+        return int(self.first_child[handle]) + index
+
+    def split(self, handle):
+        self.first_child[handle] = self._allocate(self.num_children)
+
+    def merge(self, handle):
+        first_child = self.first_child
+        stack = [int(first_child[handle])]
+        first_child[handle] = -1
+        while stack:
+            start = stack.pop()
+            self._free_blocks.append(start)
+            for child in range(start, start + self.num_children):
+                child_start = int(first_child[child])
+                if child_start >= 0:
+                    stack.append(child_start)
+                    first_child[child] = -1
+
+    def get_level_order(self, root):
+        # gather the reachable nodes level by level. Child blocks stay
+        # contiguous because each branch's block is appended whole.
+        first_child = self.first_child
+        offsets = numpy.arange(self.num_children)
+        levels = [numpy.array([root], dtype=numpy.intp)]
+        while True:
+            starts = first_child[levels[-1]]
+            starts = starts[starts >= 0]
+            if not len(starts):
+                break
+            levels.append((starts[:, numpy.newaxis] + offsets).ravel())
+        return numpy.concatenate(levels)
+
+    def load_level_order(self, is_branch, values):
+        count = len(is_branch)
+        self.values = numpy.empty(count, dtype=self.dtype)
+        self.values[:] = values
+        self.first_child = _get_level_order_first_child(is_branch, self.num_children)
+        self.num_nodes = count
+        self._free_blocks = []
+        return 0
+
+    def defragment(self, root):
+        first_child = self.first_child
+        old_handles = self.get_level_order(root)
+
+        new_handles = numpy.full(self.num_nodes, -1, dtype=numpy.int32)
+        new_handles[old_handles] = numpy.arange(len(old_handles))
+        old_first_child = first_child[old_handles]
+        is_branch = old_first_child >= 0
+        new_first_child = numpy.full(len(old_handles), -1, dtype=numpy.int32)
+        new_first_child[is_branch] = new_handles[old_first_child[is_branch]]
+
+        self.values = self.values[old_handles]
+        self.first_child = new_first_child
+        self.num_nodes = len(old_handles)
+        self._free_blocks = []
+        return 0
+
+    def is_leaf_batch(self, handles):
+        return self.first_child[handles] < 0
+
+    def get_child_batch(self, handles, indexes):
+        return self.first_child[handles] + indexes
+
+    def get_value_batch(self, handles):
+        return self.values[handles]
+
+
+class MappedTreeStorage(AbstractTreeStorage):
+    """ Read-only storage over the level order arrays of a saved tree (see
+    `tree_io`).
+
+    Nothing is copied so the arrays can be memory mapped and only the
+    parts of the file that are traversed get read.  Handles are node
+    indexes in level order.  Since the children of the n-th branch start
+    at ``1 + n * num_children``, finding a child only needs the number of
+    branches before its parent which is looked up from `branch_ranks` plus
+    the bits of at most one block.
+
+    Attributes:
+        branch_bits (numpy.ndarray): ``numpy.packbits`` of whether each
+            node is a branch, padded to a multiple of `RANK_BLOCK_SIZE` bits.
+        branch_ranks (numpy.ndarray): The number of branches before each
+            block of `RANK_BLOCK_SIZE` nodes.
+        values (numpy.ndarray): The value of each node.
+    """
+    NULL = -1
+    HANDLE_DTYPE = numpy.intp
+
+    # The number of nodes for each entry of `branch_ranks`
+    RANK_BLOCK_SIZE = 64
+
+    def __init__(self, num_children, get_default_value, branch_bits, branch_ranks, values, dtype=object):
+        # type: (int, Callable[[], Any], numpy.ndarray, numpy.ndarray, numpy.ndarray, Any) -> None
+        super(MappedTreeStorage, self).__init__(num_children, get_default_value, dtype=dtype)
+        # plain array views so that indexing memory maps copies into
+        # normal, writable arrays
+        self.branch_bits = branch_bits.view(numpy.ndarray)
+        self.branch_ranks = branch_ranks.view(numpy.ndarray)
+        self.values = values.view(numpy.ndarray)
+        self.num_nodes = len(values)
+
+    def _read_only(self, *args):
+        raise RuntimeError('%s is read-only' % type(self).__name__)
+
+    set_value = split = merge = _read_only
+
+    def create_root(self):
+        return 0
+
+    def defragment(self, root):
+        return root
+
+    def _rank(self, handle):
+        """ Get the number of branches before `handle`
+        """
+        block_size = self.RANK_BLOCK_SIZE
+        block = handle // block_size
+        rank = int(self.branch_ranks[block])
+        start = block * (block_size // 8)
+        end = handle >> 3
+        if end > start:
+            rank += int(_POPCOUNT[self.branch_bits[start:end]].sum())
+        remainder = handle & 7
+        if remainder:
+            rank += int(_POPCOUNT[self.branch_bits[end] >> (8 - remainder)])
+        return rank
+
+    def get_value(self, handle):
+        return self.values[handle]
+
+    def is_leaf(self, handle):
+        return not (self.branch_bits[handle >> 3] >> (7 - (handle & 7))) & 1
+
+    def get_children(self, handle):
+        if self.is_leaf(handle):
+            return None
+        first = 1 + self._rank(handle) * self.num_children
+        return range(first, first + self.num_children)
+
+    def get_child(self, handle, index):
+        return 1 + self._rank(handle) * self.num_children + index
+
+    def get_level_order(self, root):
+        return numpy.arange(self.num_nodes, dtype=numpy.intp)
+
+    def is_leaf_batch(self, handles):
+        return ((self.branch_bits[handles >> 3] >> (7 - (handles & 7))) & 1) == 0
+
+    def _rank_batch(self, handles):
+        block_size = self.RANK_BLOCK_SIZE
+        bytes_per_block = block_size // 8
+        branch_bits = self.branch_bits
+        blocks = handles // block_size
+        ranks = self.branch_ranks[blocks].astype(numpy.int64)
+        starts = blocks * bytes_per_block
+        num_bytes = (handles & (block_size - 1)) >> 3
+        for i in range(bytes_per_block - 1):
+            full = num_bytes > i
+            ranks[full] += _POPCOUNT[branch_bits[starts[full] + i]]
+        ranks += _POPCOUNT[branch_bits[handles >> 3] >> (8 - (handles & 7))]
+        return ranks
+
+    def get_child_batch(self, handles, indexes):
+        return 1 + self._rank_batch(handles) * self.num_children + indexes
+
+    def get_value_batch(self, handles):
+        return self.values[handles]
+
+
+def _get_level_order_first_child(is_branch, num_children):
+    # type: (numpy.ndarray, int) -> numpy.ndarray
+    """ Get the index of each node's first child (or -1) in level order
+    (see `AbstractTreeStorage.get_level_order`)
+    """
+    is_branch = numpy.asarray(is_branch, dtype=bool)
+    branch_indexes = numpy.flatnonzero(is_branch)
+    first_child = numpy.full(len(is_branch), -1, dtype=numpy.int32)
+    first_child[branch_indexes] = 1 + numpy.arange(len(branch_indexes)) * num_children
+    return first_child
+
+
+# the number of set bits in each byte
+_POPCOUNT = numpy.array([bin(i).count('1') for i in range(256)], dtype=numpy.int64)
@@ -1,4 +1,4 @@
-__all__ = ['Vector']
+__all__ = ['Vector', 'VectorArray']
 
 #============================================================================#
 #================================================================= IMPORTS ==#
@@ -6,15 +6,18 @@ import math
 
 import numpy
 
-from .abstract_vector import AbstractVector
+from .abstract_vector import AbstractVector, AbstractVectorArray
 
 
 
 #============================================================================#
 #=================================================================== CLASS ==#
 class Vector(AbstractVector):
+    __slots__ = ()
+
     def length(self):
-        return numpy.linalg.norm(self)
+        x, y, z = self._data
+        return math.sqrt(x * x + y * y + z * z)
 
     def normalize(self):
         length = self.length()
@@ -28,15 +31,21 @@ class Vector(AbstractVector):
         return copy
 
     def __xor__(self, other):
-        data = numpy.cross(self, other)
-        return type(self)(*data)
+        if isinstance(other, AbstractVectorArray):
+            return NotImplemented
+        ax, ay, az = self._data
+        bx, by, bz = other[0], other[1], other[2]
+        return type(self)(ay * bz - az * by, az * bx - ax * bz, ax * by - ay * bx)
 
     def __rxor__(self, other):
         data = numpy.cross(other, self)
-        return type(self)(data)
+        return type(self)(*data)
 
     def dot(self, other):
-        return numpy.dot(self, other)
+        if isinstance(other, AbstractVectorArray):
+            return other.dot(self)
+        data = self._data
+        return data[0] * other[0] + data[1] * other[1] + data[2] * other[2]
 
     def magnitude(self):
         result = 0
@@ -46,3 +55,33 @@ class Vector(AbstractVector):
 
     def __nonzero__(self):
         return bool(self.length())
+
+
+class VectorArray(AbstractVectorArray):
+    SCALAR_CLS = Vector
+
+    def length(self):
+        """ Get the length of each vector
+
+        Returns:
+            numpy.ndarray
+        """
+        return self.norm()
+
+    def normalize(self):
+        """ Normalize each vector in place.  Zero length vectors are left as is.
+        """
+        lengths = self.norm()
+        lengths[lengths == 0] = 1.0
+        self._data /= lengths[:, numpy.newaxis]
+
+    def normal(self):
+        copy = self.copy()
+        copy.normalize()
+        return copy
+
+    def __xor__(self, other):
+        return self.cross(other)
+
+    def __rxor__(self, other):
+        return self._new(numpy.cross(self._as_vectors(other), self._data))
@@ -41,7 +41,7 @@ class Window(game_core.AbstractWindow):
 
     def _set_perspective_matrix(self):
         # TODO: move this to camera's reshape
-        projection_matrix = self.camera.projection_matrix.tolist()
+        projection_matrix = self.camera.projection_matrix.as_float32()
         for shader in game_core.shaders.REGISTRY.values():
             if 'camera_to_clip_matrix' in shader.uniforms:
                 with shader:
@@ -89,7 +89,7 @@ class Window(game_core.AbstractWindow):
         self.camera.integrate(t, delta_time, self)
 
         # TODO: move this to camera's integrate
-        i_cam_mat = self.camera.matrix.inverse().tolist()
+        i_cam_mat = self.camera.matrix.inverse().as_float32()
         for shader in game_core.shaders.REGISTRY.values():
             if 'world_to_camera_matrix' in shader.uniforms:
                 with shader:
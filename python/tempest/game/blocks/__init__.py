@@ -18,13 +18,20 @@ class BlockMeta(type):
 class AbstractBlock(object):
     __metaclass__ = BlockMeta
     _ID_TO_STATE = {}
-    def __init__(self, game, octree_item, octree_item_info):
+    def __init__(self, game, world, id, origin, size):
+        """
+        :param Game game:
+        :param World world: the world the block belongs to
+        :param int id: the block id stored in the world's octree
+        :param game_core.Point origin: the center of the block
+        :param float size:
+        """
         super(AbstractBlock, self).__setattr__('_attributes', self.attributes())
-        self.__dict__.update(self._ID_TO_STATE[octree_item.data()])
+        self.__dict__.update(self._ID_TO_STATE[id])
         self._game = game
-        self._origin = octree_item_info['origin'].copy()
-        self._size = octree_item_info['size']
-        self._world = octree_item_info['parents'][0]
+        self._origin = origin.copy()
+        self._size = size
+        self._world = world
 
     def __setattr__(self, name, value):
         if name in self._attributes:
@@ -87,92 +94,6 @@ class AbstractBlock(object):
         max_ = self._origin + offset
         return game_core.BoundingBox(min_, max_)
 
-    def solve_collision(self, start_bbox, acceleration=None):
-        # calculate a bounding box that encompasses the start/end bounding boxes
-        #
-        if acceleration:
-            end_bbox = start_bbox.translate(acceleration)
-            bbox = game_core.BoundingBox()
-            bbox.bbox_expand(start_bbox)
-            bbox.bbox_expand(end_bbox)
-        else:
-            end_bbox = start_bbox.copy()
-            bbox = start_bbox.copy()
-
-        # intersect this block's bounding box with the full movement bounding box
-        #
-        collision_box = self.bbox().intersection(bbox)
-        if not collision_box:
-            return 1.0, None
-
-        # get a before and after position
-        #
-        before = start_bbox.center()
-        after = end_bbox.center()
-        center = collision_box.center()
-
-        # expand the collision box to encompass potential solution positions.
-        # this is so that we can find the proper solution.
-        #
-        expanded_collision_bbox = collision_box.copy()
-        dimensions = [start_bbox.get_dimension(i) / 2.0 for i in xrange(3)]
-        expanded_collision_bbox._min -= dimensions
-        expanded_collision_bbox._max += dimensions
-
-        # loop through each bounding box component and determine the shortest
-        # distance along *acceleration* that will bring *bbox* out of 
-        # collision.
-        #
-        t = 1.0
-        component_index = None
-        other_indices = [(1,2), (0,2), (0,1)]
-        for i, others in enumerate(other_indices):
-            # skip this component if the acceleration for it is 0
-            #
-            if acceleration[i] == 0:
-                continue
-
-            # find the bbox center position for this component that will
-            # place it on the edge of this blocks bbox.  If this component 
-            # is not colliding, then skip it.
-            #
-            if before[i] < collision_box._min[i]:
-                component = collision_box._min[i]
-                component -= start_bbox.get_dimension(i) / 2.0
-            elif before[i] > collision_box._max[i]:
-                component = collision_box._max[i]
-                component += start_bbox.get_dimension(i) / 2.0
-            else:
-                continue
-
-            # determine the point along the acceleration vector that 
-            # intersects the component value we just found
-            #
-            this_t = (component - before[i]) / acceleration[i]
-            this_accel = acceleration * this_t
-            this_pos = before + this_accel
-
-            # determine if the new position touches the edge of this 
-            # block's bounding box
-            #
-            invalid = False
-            for other in others:
-                if this_pos[other] < expanded_collision_bbox._min[other]:
-                    invalid = True
-                    break
-                if this_pos[other] > expanded_collision_bbox._max[other]:
-                    invalid = True
-                    break
-            if invalid:
-                continue
-
-            # use the shortest solution acceleration
-            #
-            if this_t < t:
-                t = this_t
-                component_index = i
-        return t, component_index
-
     def should_neighbor_generate_mesh(self, neighbor):
         return False
 
@@ -1,3 +1,4 @@
+import os
 import random
 
 import glfw
@@ -36,7 +37,8 @@ class Game(game_core.AbstractWindow):
         self.register_blocks()
 
         from .world import World
-        self.world = World(self, 128)
+        world_size = 128
+        self.world = World(self, world_size, cache_path=self.get_world_cache_path(world_size))
 
         # from .player import Player
         # x=0.5
@@ -50,6 +52,19 @@ class Game(game_core.AbstractWindow):
         y = 64.0
         self.player = Spectator([x, y, z])
 
+    @staticmethod
+    def get_world_cache_path(size):
+        """ Get the file that the blocks of a world are cached in between
+        runs.  Each world size has its own file.
+
+        :param int size:
+        :rtype: str
+        """
+        cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'tempest')
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        return os.path.join(cache_dir, 'world_%d.tree' % size)
+
     def register_blocks(self):
         from .blocks import _BLOCKS
         current_id = 0
@@ -85,7 +100,7 @@ class Game(game_core.AbstractWindow):
             if 'worldToCameraMatrix' not in shader.uniforms:
                 continue
             with shader:
-                GL.glUniformMatrix4fv(shader.uniforms['worldToCameraMatrix'], 1, GL.GL_FALSE, i_cam_mat.tolist())
+                GL.glUniformMatrix4fv(shader.uniforms['worldToCameraMatrix'], 1, GL.GL_FALSE, i_cam_mat.as_float32())
 
         with self.shaders['skin'] as shader:
             light_dir = game_core.Vector(0.1, 1.0, 0.5)
@@ -157,5 +172,5 @@ class Game(game_core.AbstractWindow):
                     shader.uniforms['cameraToClipMatrix'],
                     1,
                     GL.GL_FALSE,
-                    self.player.projection_matrix.tolist(),
+                    self.player.projection_matrix.as_float32(),
                 )
@@ -1,7 +1,9 @@
 #============================================================================#
 #================================================================= IMPORTS ==#
+import math
 
 from OpenGL import GL
+from typing import Optional
 
 import game_core
 from . import Game
@@ -23,20 +25,28 @@ class Player(game_core.AbstractCamera):
         self.walking_force = self.mass * 2.0  # F = mass * acceleration (meters per second per second)
         self.jump_force = self.mass * 60.0 # F = mass * acceleration; average human a=30.0
 
+        self._pos = self._pos.copy()  # updated in place
         self.velocity = game_core.Vector()
         self._grounded = True
 
+        # reusable temporaries so that `update` doesn't allocate every frame
+        self._scratch_vectors = game_core.VectorPool(game_core.Vector)
+        self._scratch_points = game_core.VectorPool(game_core.Point)
+        self._scratch_bboxes = [self.bbox.copy() for _ in xrange(3)]
+
+        # proxy id in the world's entity tree, inserted on the first update
+        self._entity_proxy = None  # type: Optional[int]
+
     def render(self):
         bbox = self._get_bbox_at_pos(self._pos)
-        mat = game_core.Matrix()
-        center = bbox.center()
-        for i in xrange(3):
-            mat[i,i] = bbox.get_dimension(i)
-            mat[3,i] = center[i]
+        mat = game_core.Matrix.from_transform(
+            translation=bbox.center(),
+            scale=[bbox.get_dimension(i) for i in xrange(3)],
+        )
 
         with Game.INSTANCE.shaders['skin'] as shader:
             GL.glUniform4f(shader.uniforms['diffuseColor'], 1.0, 0.0, 0.0, 1.0)
-            GL.glUniformMatrix4fv(shader.uniforms['modelToWorldMatrix'], 1, GL.GL_FALSE, mat.tolist())
+            GL.glUniformMatrix4fv(shader.uniforms['modelToWorldMatrix'], 1, GL.GL_FALSE, mat.as_float32())
             Game.INSTANCE.cube.render()
 
     def camera_matrix(self):
@@ -47,6 +57,11 @@ class Player(game_core.AbstractCamera):
         return offset * self.matrix
 
     def update(self, time, delta_time):
+        scratch_vectors = self._scratch_vectors
+        scratch_points = self._scratch_points
+        scratch_vectors.reset()
+        scratch_points.reset()
+
         # add mouse_move to rotation values
         # 
         self._rotx += Game.INSTANCE.mouse_movement[1]
@@ -58,82 +73,59 @@ class Player(game_core.AbstractCamera):
         # convert input to an acceleration vector
         #
         if self._grounded:
-            acceleration = self._get_acceleration_on_ground(ry)
+            acceleration = self._get_acceleration_on_ground(ry, scratch_vectors.get())
         else:
-            acceleration = self._get_acceleration_in_air(ry)
-        velocity = self.velocity + (acceleration * delta_time / 2.0)
+            acceleration = self._get_acceleration_in_air(ry, scratch_vectors.get())
+        velocity = self.velocity.madd(acceleration, delta_time / 2.0, scratch_vectors.get())
 
         # clamp horizontal velocity to max_walking_speed
         #
         velocity_length = velocity.length()
         if velocity_length:
-            h_velocity = velocity.copy()
-            h_velocity[1] = 0.0
-            h_velocity_length = h_velocity.length()
+            h_velocity_length = math.sqrt(velocity[0] * velocity[0] + velocity[2] * velocity[2])
             max_walking_speed = self.max_walking_speed / delta_time
             if h_velocity_length > max_walking_speed:
-                h_velocity_length = max_walking_speed
-                h_velocity.normalize()
-                h_velocity *= h_velocity_length
-                velocity = Vector(h_velocity[0], velocity[1], h_velocity[2])
+                scale = max_walking_speed / h_velocity_length
+                velocity[0] *= scale
+                velocity[2] *= scale
 
         # if we have velocity, perform collision detection 
         # and adjust the velocity vector accordingly
         #
-        velocity_length = velocity.length()
-        if velocity_length:
-            start_pos = self._pos
-            first_loop = True
-            colliding_components = []
+        if velocity.length():
+            world = Game.INSTANCE.world
 
-            # get colliding blocks
+            # get the solid blocks that the move could hit
             #
-            bbox1 = self._get_bbox_at_pos(start_pos)
-            bbox2 = self._get_bbox_at_pos(start_pos + velocity)
-            bbox = game_core.BoundingBox()
-            bbox.bbox_expand(bbox1)
+            bbox1, bbox2, bbox = self._scratch_bboxes[:3]
+            self._get_bbox_at_pos(self._pos, bbox1)
+            self._get_bbox_at_pos(self._pos.add_into(velocity, scratch_points.get()), bbox2)
+            bbox._min.copy_from(bbox1._min)
+            bbox._max.copy_from(bbox1._max)
             bbox.bbox_expand(bbox2)
-            blocks = Game.INSTANCE.world.get_blocks(bbox)
-
-            count = 0
-            while blocks and (first_loop or solution_component is not None):
-                first_loop = False
-                if count > 3:
-                    raise Exception('infinite collision loop')
-                count += 1
-
-                # solve for collisions
-                #
-                solution_t, solution_component = self.solve_collision(start_pos, velocity, blocks)
-                if solution_component is None: # no collisions
-                    break
-                colliding_components.append(solution_component)
-
-                # prep the start position for another collision test by 
-                # moving it to the last point of collision
-                #
-                start_pos = start_pos + (velocity * solution_t)
-
-                # calculate the remaining velocity
-                # 
-                velocity_length -= (velocity_length * solution_t)
-                velocity = velocity.normal() * velocity_length
-                velocity[solution_component] = 0.0
-                velocity_length = velocity.length()
+            block_mins, block_maxs = world.get_solid_extents(bbox)
+
+            # slide along the blocks that are hit
+            #
+            displacement, blocked = game_core.slide_box(
+                bbox1._min, bbox1._max, velocity, block_mins, block_maxs, scratch_vectors.get())
 
             # set the new position
             #
-            previous_pos = self._pos.copy()
-            self._pos = start_pos + velocity
+            previous_pos = scratch_points.get().copy_from(self._pos)
+            self._pos.add_into(displacement, self._pos)
             self._pos.round()
-            self.velocity = self._pos - previous_pos
-            for component in colliding_components:
-                self.velocity[component] = 0.0
+            self._pos.sub_into(previous_pos, self.velocity)
+            for component in xrange(3):
+                if blocked & (1 << component):
+                    self.velocity[component] = 0.0
 
             # determine if we are grounded or in the air
             #
-            bbox = self._get_bbox_at_pos(self._pos)
-            self._grounded = Game.INSTANCE.world.is_grounded(bbox)
+            bbox = self._get_bbox_at_pos(self._pos, bbox)
+            self._grounded = world.is_grounded(bbox)
+
+        self._update_entity_proxy()
 
         # resolve xform components to a full matrix
         #
@@ -144,41 +136,32 @@ class Player(game_core.AbstractCamera):
         if 'P' in Game.INSTANCE.pressed_keys:
             print 'pos:', self._pos
 
-    def solve_collision(self, start_pos=None, velocity=None, blocks=None):
-        if start_pos is None:
-            start_pos = self._pos
-        if velocity is None:
-            velocity = game_core.Vector()
-
-        bbox1 = self._get_bbox_at_pos(start_pos)
-        if blocks is None:
-            pos2 = start_pos + velocity
-            bbox2 = self._get_bbox_at_pos(pos2)
-            bbox = game_core.BoundingBox()
-            bbox.bbox_expand(bbox1)
-            bbox.bbox_expand(bbox2)
-            blocks = Game.INSTANCE.world.get_blocks(bbox)
-
-        # solve collisions for each block and use the solution with 
-        # the smallest resulting velocity
-        #
-        t = 1.0
-        component = None
-        for block in blocks:
-            this_t, this_component = block.solve_collision(bbox1, velocity)
-            if this_t < t:
-                t = this_t
-                component = this_component
-
-        return t, component
-
-    def _get_bbox_at_pos(self, pos):
-        bbox = self.bbox.copy()
-        bbox._min += pos
-        bbox._max += pos
-        return bbox
-
-    def _get_acceleration_on_ground(self, ry):
+    def _update_entity_proxy(self):
+        """ Keep this player's bounding box up to date in the world's entity
+        tree
+        """
+        entities = Game.INSTANCE.world.entities
+        bbox = self._get_bbox_at_pos(self._pos, self._scratch_bboxes[2])
+        if self._entity_proxy is None:
+            self._entity_proxy = entities.insert(bbox, self)
+        else:
+            entities.move(self._entity_proxy, bbox, self.velocity)
+
+    def _get_bbox_at_pos(self, pos, out=None):
+        """ Get the player's bounding box at a position
+
+        Args:
+            pos (game_core.Point)
+            out (Optional[game_core.BoundingBox]): store the result in this
+                bounding box instead of creating a new one
+        """
+        if out is None:
+            out = self.bbox.copy()
+        self.bbox._min.add_into(pos, out._min)
+        self.bbox._max.add_into(pos, out._max)
+        return out
+
+    def _get_acceleration_on_ground(self, ry, out):
         # static_friction_coefficient = 1.0
         # kinetic_friction_coefficient = 0.8
         # friction_normal_force = self.mass * 9.81
@@ -188,7 +171,7 @@ class Player(game_core.AbstractCamera):
         # else:
         #     max_frictional_force = kinetic_friction_coefficient * friction_normal_force
 
-        force = game_core.Vector()
+        force = out.set(0.0, 0.0, 0.0)
         if 'W' in Game.INSTANCE.pressed_keys:
             force.z += 1.0
         if 'S' in Game.INSTANCE.pressed_keys:
@@ -199,26 +182,27 @@ class Player(game_core.AbstractCamera):
             force.x -= 1.0
         if force.length():
             force.normalize()
-            force = force.normal() * self.walking_force
+            force *= self.walking_force
             force *= ry
         else:
             vel_force = self.velocity.length() * self.mass
             if not vel_force:
                 pass
             elif vel_force < self.walking_force:
-                force = self.velocity.normal() * -vel_force
+                self.velocity.scale_into(-vel_force / self.velocity.length(), force)
             else:
-                force = self.velocity.normal() * -(vel_force - self.walking_force)
+                self.velocity.scale_into(-(vel_force - self.walking_force) / self.velocity.length(), force)
 
         # add jumping force
         #
         if ' ' in Game.INSTANCE.pressed_keys:
             force.y += self.jump_force
 
-        return (force / self.mass)
+        force /= self.mass
+        return force
 
-    def _get_acceleration_in_air(self, ry):
-        force = game_core.Vector()
+    def _get_acceleration_in_air(self, ry, out):
+        force = out.set(0.0, 0.0, 0.0)
         if 'W' in Game.INSTANCE.pressed_keys:
             force.z += 1.0
         if 'S' in Game.INSTANCE.pressed_keys:
@@ -231,5 +215,6 @@ class Player(game_core.AbstractCamera):
         force *= ry
         force *= self.walking_force # apply force magnitude
         force[1] -= self.mass * 9.81 # apply gravity
-        return (force / self.mass) # a = f/m
+        force /= self.mass # a = f/m
+        return force
 
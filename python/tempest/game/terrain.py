@@ -0,0 +1,299 @@
+#============================================================================#
+#================================================================= IMPORTS ==#
+import collections
+
+import numpy
+
+
+#============================================================================#
+#=============================================================== FUNCTIONS ==#
+def _square_step(values, size, stride, offsets):
+    """ Set the centers of the squares of a diamond-square level to the
+    average of the square's corners plus an offset
+
+    Args:
+        values (numpy.ndarray): (size + 1, size + 1) samples
+        size (int)
+        stride (int): half the size of the level's squares
+        offsets (numpy.ndarray): (size / 2 / stride, size / 2 / stride)
+            scaled random offsets
+    """
+    step = stride * 2
+    values[stride:size:step, stride:size:step] = offsets + (
+        values[0:size:step, 0:size:step] +
+        values[0:size:step, step:size + 1:step] +
+        values[step:size + 1:step, 0:size:step] +
+        values[step:size + 1:step, step:size + 1:step]) * 0.25
+
+
+def _diamond_step(values, size, stride, even_offsets, odd_offsets):
+    """ Set the midpoints of the squares' edges of a diamond-square level
+    that aren't on the border to the average of their neighbors plus an
+    offset
+
+    Rows alternate between points on odd and even multiples of `stride`.
+
+    Args:
+        values (numpy.ndarray): (size + 1, size + 1) samples
+        size (int)
+        stride (int)
+        even_offsets (numpy.ndarray): scaled random offsets for the rows
+            that are even multiples of `stride` (excluding the first row)
+        odd_offsets (numpy.ndarray): scaled random offsets for the rows that
+            are odd multiples of `stride` (excluding the first column)
+    """
+    step = stride * 2
+    values[step:size:step, stride:size:step] = even_offsets + (
+        values[stride:size - step:step, stride:size:step] +
+        values[step + stride:size:step, stride:size:step] +
+        values[step:size:step, 0:size:step] +
+        values[step:size:step, step:size + 1:step]) * 0.25
+    values[stride:size:step, step:size:step] = odd_offsets + (
+        values[0:size:step, step:size:step] +
+        values[step:size + 1:step, step:size:step] +
+        values[stride:size:step, stride:size - step:step] +
+        values[stride:size:step, step + stride:size:step]) * 0.25
+
+
+def generate_height_map(size, seed=1234, ratio=0.5):
+    """ Generate a tileable height map using the diamond-square algorithm
+
+    Each square and diamond step updates every point of its level at once
+    with strided slices so the cost is a few numpy operations per level.
+    Points are visited in the same order as a per point implementation and
+    the random numbers are drawn in that order, so a seed always produces
+    the same height map (the same one that the python ``random`` module
+    seeded with `seed` used to produce).
+
+    Args:
+        size (int): the number of samples along each side. Must be a power
+            of 2
+        seed (int)
+        ratio (float): how much the random offsets are scaled by at each
+            level.  Lower values give smoother terrain.
+
+    Returns:
+        numpy.ndarray: (size, size) float array of heights
+    """
+    values = numpy.zeros((size + 1, size + 1), dtype=float)
+    # seeded with a sequence so that the stream matches `random.seed(seed)`
+    random_state = numpy.random.RandomState([seed])
+    scale = float(size) / 8.0
+    stride = size // 2
+    while stride:
+        step = stride * 2
+        count = size // step
+
+        # perform 'square' step
+        #
+        offsets = random_state.random_sample((count, count)) * 2.0 - 1.0
+        _square_step(values, size, stride, scale * offsets)
+
+        # perform 'diamond' step.  Points on the first row and column wrap
+        # around to the other side of the map
+        #
+        offsets = scale * (random_state.random_sample((2 * count, count)) * 2.0 - 1.0)
+        even_offsets = offsets[0::2]
+        odd_offsets = offsets[1::2]
+        values[0, stride:size:step] = even_offsets[0] + (
+            values[0, 0:size:step] +
+            values[0, step:size + 1:step] +
+            values[size - stride, stride:size:step] +
+            values[stride, stride:size:step]) * 0.25
+        values[stride:size:step, 0] = odd_offsets[:, 0] + (
+            values[0:size:step, 0] +
+            values[step:size + 1:step, 0] +
+            values[stride:size:step, stride] +
+            values[stride:size:step, size - stride]) * 0.25
+        _diamond_step(values, size, stride, even_offsets[1:], odd_offsets[:, 1:])
+
+        # wrap the first row and column around to the last ones
+        #
+        values[size, stride:size:step] = values[0, stride:size:step]
+        values[stride:size:step, size] = values[stride:size:step, 0]
+
+        scale *= ratio
+        stride >>= 1
+
+    return values[:-1, :-1]
+
+
+#============================================================================#
+#=================================================================== CLASS ==#
+class TiledHeightMap(object):
+    """ A diamond-square height map of unlimited size that is generated one
+    square tile at a time, e.g. to stream terrain in around the player.
+
+    Each tile is generated independently from the seed and its tile
+    coordinate.  The corners and edges shared by neighboring tiles are
+    generated from the seed and their own coordinates first and are then
+    kept fixed while the tile's interior is filled in, so neighboring tiles
+    always line up no matter which one is generated first.
+
+    The most recently used tiles are cached.
+    """
+    # kinds of values keyed by coordinate that are generated independently
+    _CORNER = 0
+    _X_EDGE = 1
+    _Z_EDGE = 2
+    _INTERIOR = 3
+
+    def __init__(self, tile_size, seed=1234, ratio=0.5, max_cached_tiles=64):
+        """
+        Args:
+            tile_size (int): the number of samples along each side of a tile.
+                Must be a power of 2
+            seed (int)
+            ratio (float): see `generate_height_map`
+            max_cached_tiles (int): the number of tiles to keep.  0 turns
+                off caching
+        """
+        self.tile_size = tile_size
+        self.seed = seed
+        self.ratio = ratio
+        self.max_cached_tiles = max_cached_tiles
+        # cached tiles keyed by tile coordinate from least to most recently
+        # used
+        self._tiles = collections.OrderedDict()
+
+    def _get_random_state(self, kind, x, z):
+        """ Get a random number generator that is seeded from the height
+        map's seed and a coordinate
+
+        Returns:
+            numpy.random.RandomState
+        """
+        return numpy.random.RandomState([self.seed & 0xffffffff, kind, x & 0xffffffff, z & 0xffffffff])
+
+    def _get_corner(self, x, z):
+        """ Get the height of the corner shared by the four tiles around a
+        tile coordinate
+
+        Returns:
+            float
+        """
+        scale = self.tile_size / 8.0
+        return scale * (self._get_random_state(self._CORNER, x, z).random_sample() * 2.0 - 1.0)
+
+    def _get_edge(self, kind, x, z, start, end):
+        """ Generate the samples along a tile edge with midpoint
+        displacement
+
+        Args:
+            kind (int): `_X_EDGE` for the edge from corner ``(x, z)`` to
+                ``(x + 1, z)`` or `_Z_EDGE` for the edge to ``(x, z + 1)``
+            x (int)
+            z (int)
+            start (float): the height of the edge's first corner
+            end (float): the height of the edge's last corner
+
+        Returns:
+            numpy.ndarray: (tile_size + 1,) heights
+        """
+        size = self.tile_size
+        values = numpy.empty(size + 1, dtype=float)
+        values[0] = start
+        values[size] = end
+        random_state = self._get_random_state(kind, x, z)
+        scale = size / 8.0
+        stride = size // 2
+        while stride:
+            step = stride * 2
+            offsets = random_state.random_sample(size // step) * 2.0 - 1.0
+            values[stride:size:step] = scale * offsets + (values[0:size:step] + values[step:size + 1:step]) * 0.5
+            scale *= self.ratio
+            stride >>= 1
+        return values
+
+    def _generate_tile(self, tile_x, tile_z):
+        """ Generate the heights of a tile
+
+        Returns:
+            numpy.ndarray: (tile_size, tile_size) heights
+        """
+        size = self.tile_size
+        values = numpy.empty((size + 1, size + 1), dtype=float)
+
+        # the corners and edges shared with neighboring tiles
+        #
+        corners = [
+            [self._get_corner(tile_x + i, tile_z + j) for j in (0, 1)]
+            for i in (0, 1)
+        ]
+        values[0, :] = self._get_edge(self._Z_EDGE, tile_x, tile_z, corners[0][0], corners[0][1])
+        values[size, :] = self._get_edge(self._Z_EDGE, tile_x + 1, tile_z, corners[1][0], corners[1][1])
+        values[:, 0] = self._get_edge(self._X_EDGE, tile_x, tile_z, corners[0][0], corners[1][0])
+        values[:, size] = self._get_edge(self._X_EDGE, tile_x, tile_z + 1, corners[0][1], corners[1][1])
+
+        # the interior
+        #
+        random_state = self._get_random_state(self._INTERIOR, tile_x, tile_z)
+        scale = size / 8.0
+        stride = size // 2
+        while stride:
+            count = size // (stride * 2)
+            offsets = random_state.random_sample((count, count)) * 2.0 - 1.0
+            _square_step(values, size, stride, scale * offsets)
+            even_offsets = random_state.random_sample((count - 1, count)) * 2.0 - 1.0
+            odd_offsets = random_state.random_sample((count, count - 1)) * 2.0 - 1.0
+            _diamond_step(values, size, stride, scale * even_offsets, scale * odd_offsets)
+            scale *= self.ratio
+            stride >>= 1
+
+        # the last row and column belong to the next tiles
+        return values[:-1, :-1]
+
+    def get_tile(self, tile_x, tile_z):
+        """ Get the heights of a tile
+
+        Sample ``(i, j)`` of tile ``(tile_x, tile_z)`` is sample
+        ``(tile_x * tile_size + i, tile_z * tile_size + j)`` of the whole
+        height map.
+
+        Args:
+            tile_x (int)
+            tile_z (int)
+
+        Returns:
+            numpy.ndarray: read-only (tile_size, tile_size) heights
+        """
+        key = (tile_x, tile_z)
+        tiles = self._tiles
+        try:
+            tile = tiles.pop(key)
+        except KeyError:
+            tile = self._generate_tile(tile_x, tile_z)
+            tile.flags.writeable = False
+            while tiles and len(tiles) >= self.max_cached_tiles:
+                tiles.popitem(last=False)
+        if self.max_cached_tiles > 0:
+            tiles[key] = tile
+        return tile
+
+    def get_region(self, x, z, width, depth):
+        """ Get the heights of a rectangle of samples, which may span
+        multiple tiles
+
+        Args:
+            x (int): the first sample along x
+            z (int): the first sample along z
+            width (int): the number of samples along x
+            depth (int): the number of samples along z
+
+        Returns:
+            numpy.ndarray: (width, depth) heights
+        """
+        size = self.tile_size
+        result = numpy.empty((width, depth), dtype=float)
+        for tile_x in xrange(x // size, (x + width - 1) // size + 1):
+            start_x = max(x, tile_x * size)
+            end_x = min(x + width, (tile_x + 1) * size)
+            for tile_z in xrange(z // size, (z + depth - 1) // size + 1):
+                start_z = max(z, tile_z * size)
+                end_z = min(z + depth, (tile_z + 1) * size)
+                tile = self.get_tile(tile_x, tile_z)
+                result[start_x - x:end_x - x, start_z - z:end_z - z] = tile[
+                    start_x - tile_x * size:end_x - tile_x * size,
+                    start_z - tile_z * size:end_z - tile_z * size,
+                ]
+        return result
@@ -1,411 +1,166 @@
 #============================================================================#
 #================================================================= IMPORTS ==#
-import random
+import collections
+import math
+import os
 import time
 
 import numpy
 from OpenGL import GL
+from typing import Optional
 
 from ..data import cube
 import game_core
-from game_core import octree
 from . import blocks
-from . import Game
+from . import terrain
+
+
+# the axes along the sides of the faces perpendicular to each axis
+_U_AXES = numpy.array([1, 0, 0])
+_V_AXES = numpy.array([2, 2, 1])
 
 
 #============================================================================#
 #=============================================================== FUNCTIONS ==#
-def clamp(v, min_, max_):
-    return max(min(v, max_), min_)
-
-
-def fractal_rand():
-    return (random.random() * 2.0) - 1.0
-
-
-def avg_vals(i, j, values):
-    return (values[i-1][j-1] + 
-            values[i-1][j] +
-            values[i][j-1] +
-            values[i][j]) * 0.25
-
-
-def avg_square_vals(i, j, stride, values):
-    return (values[i-stride][j-stride] + 
-            values[i-stride][j+stride] +
-            values[i+stride][j-stride] +
-            values[i+stride][j+stride]) * 0.25
-
-
-def avg_diamond_vals(i, j, stride, size, values):
-    if i == 0:
-        return (values[i][j-stride] +
-                values[i][j+stride] +
-                values[size-stride][j] +
-                values[i+stride][j]) * 0.25
-    elif i == size:
-        return (values[i][j-stride] +
-                values[i][j+stride] +
-                values[i-stride][j] +
-                values[stride][j]) * 0.25
-    elif j == 0:
-        return (values[i-stride][j] +
-                values[i+stride][j] +
-                values[i][j+stride] +
-                values[i][size-stride]) * 0.25
-    elif j == size:
-        return (values[i-stride][j] +
-                values[i+stride][j] +
-                values[i][j-stride] +
-                values[i][stride]) * 0.25
-    else:
-        return (values[i-stride][j] +
-                values[i+stride][j] +
-                values[i][j-stride] +
-                values[i][j+stride]) * 0.25
+def _get_cube_faces(directions):
+    """ Get the faces of the unit cube mesh in `cube` in the order of
+    `directions`
+
+    Args:
+        directions (Sequence[Tuple[int, int, int]]): the direction of each
+            face's normal
+
+    Returns:
+        Tuple[numpy.ndarray, numpy.ndarray]: (6, 4, 3) bool array of whether
+            each component of each face's vertices is on the cube's positive
+            side and (6, 3) normals
+    """
+    verts = numpy.array(cube.VERTICES).reshape(6, 4, 3)
+    normals = numpy.array(cube.NORMALS).reshape(6, 4, 3)[:, 0]
+    order = [
+        [tuple(int(component) for component in normal) for normal in normals].index(tuple(direction))
+        for direction in directions
+    ]
+    return verts[order] > 0.0, normals[order]
+
+
+def _get_run_starts(positions, keys):
+    """ Find where runs of consecutive positions start in sorted arrays
+
+    Args:
+        positions (numpy.ndarray): positions that increase by 1 along a run
+        keys (Sequence[numpy.ndarray]): values that are the same along a run
+
+    Returns:
+        numpy.ndarray: bool array of whether each element starts a run
+    """
+    starts = numpy.ones(len(positions), dtype=bool)
+    starts[1:] = positions[1:] != positions[:-1] + 1
+    for key in keys:
+        starts[1:] |= key[1:] != key[:-1]
+    return starts
+
+
+def _merge_squares(keys, u, v):
+    """ Greedily merge unit squares on planes into rectangles
+
+    Squares are joined into runs along u first, then runs that cover the
+    same range of u on consecutive rows are stacked along v.
+
+    Args:
+        keys (numpy.ndarray): the plane of each square along with anything
+            else that has to match for squares to be merged
+        u (numpy.ndarray): the integer position of each square along the
+            first axis of its plane
+        v (numpy.ndarray): the integer position along the second axis
+
+    Returns:
+        Tuple[numpy.ndarray, ...]: the key, minimum u, maximum u, minimum v
+            and maximum v of each rectangle
+    """
+    order = numpy.lexsort((u, v, keys))
+    keys, u, v = keys[order], u[order], v[order]
+    starts = _get_run_starts(u, (keys, v))
+    ends = numpy.append(starts[1:], True)
+    keys, v, u_min, u_max = keys[starts], v[starts], u[starts], u[ends] + 1
+
+    order = numpy.lexsort((v, u_max, u_min, keys))
+    keys, v, u_min, u_max = keys[order], v[order], u_min[order], u_max[order]
+    starts = _get_run_starts(v, (keys, u_min, u_max))
+    ends = numpy.append(starts[1:], True)
+    return keys[starts], u_min[starts], u_max[starts], v[starts], v[ends] + 1
 
 
 #============================================================================#
 #=================================================================== CLASS ==#
-class AbstractWorldOctreeBase(object):
-    @staticmethod
-    def _get_bbox(info):
-        half_size = info['size'] * 0.5
-        offset = game_core.Vector(half_size, half_size, half_size)
-        min_ = info['origin'] - offset
-        max_ = info['origin'] + offset
-        return game_core.BoundingBox(min_, max_)
-
-    def _get_height(self, info, x, z):
-        raise NotImplementedError
-
-    def _generate_mesh(self, info):
-        raise NotImplementedError
-
-    def _get_collisions(self, info, bbox):
-        raise NotImplementedError
-
-    def _get_blocks(self, info, bbox, exclude_types, inclusive):
-        raise NotImplementedError
-    
-    def _get_block(self, info, point):
-        raise NotImplementedError
-
-    def _is_grounded(self, info, bbox):
-        raise NotImplementedError
-
-
-class _WorldOctreeBranch(AbstractWorldOctreeBase, octree._OctreeBranch):
-    # def _render(self, info, shader):
-    #     for child, child_info in self.iter_children_info(info):
-    #         if info['size'] > 4:
-    #             if abs(child_info['origin'][0]) > abs(info['origin'][0]):
-    #                 continue
-    #             # if abs(child_info['origin'][1]) > abs(info['origin'][1]):
-    #             #     continue
-    #             if abs(child_info['origin'][2]) > abs(info['origin'][2]):
-    #                 continue
-    #         child._render(child_info, shader)
-
-    def _get_height(self, info, x, z):
-        origin = info['origin']
-        index1 = 0
-        if x >= origin.x: index1 |= self._TREE_CLS._BITWISE_NUMS[0]
-        if z >= origin.z: index1 |= self._TREE_CLS._BITWISE_NUMS[2]
-        index2 = index1
-        index1 |= self._TREE_CLS._BITWISE_NUMS[1]
-
-        child1 = self._children[index1]
-        height = child1._get_height(self.get_child_info(info, index1), x, z)
-        if height is not None:
-            return height
-
-        child2 = self._children[index2]
-        return child2._get_height(self.get_child_info(info, index2), x, z)
-
-    def _get_child_info__debug(self, info, index, copy=True):
-        top_node = info['parents'][0]
-
-        if copy:
-            stime = time.time()
-            info = info.copy()
-            top_node._mesh_times['get_child_info: copy'] += time.time() - stime
-            stime = time.time()
-            info['origin'] = info['origin'].copy()
-            top_node._mesh_times['get_child_info: copy origin'] += time.time() - stime
-            stime = time.time()
-            info['parents'] = list(info['parents'])
-            top_node._mesh_times['get_child_info: copy parents'] += time.time() - stime
-        stime = time.time()
-        info['level'] += 1
-        info['size'] *= 0.5
-        info['index'] = index
-        info['parents'].append(self)
-        top_node._mesh_times['get_child_info: misc'] += time.time() - stime
+BlockHit = collections.namedtuple('BlockHit', ['block', 'point', 'normal', 'distance'])
 
-        stime = time.time()
-        half_size = info['size'] * 0.5
-        offset = []
-        for i, num in enumerate(self._TREE_CLS._BITWISE_NUMS):
-            offset.append( half_size if index&num else -half_size )
 
-        top_node._mesh_times['get_child_info: get offset'] += time.time() - stime
+class WorldNode(game_core.TreeNode):
+    """ Proxy for a node in the World octree.
 
-        stime = time.time()
-        for i, component in enumerate(offset):
-            info['origin'][i] += component
-        top_node._mesh_times['get_child_info: add offset'] += time.time() - stime
+    Leaf nodes store a block id.  Branch node values are unused.
+    """
+    __slots__ = ()
 
-        return info
-
-    def _generate_mesh(self, info):
-        top_node = info['parents'][0]
-        verts = []
-        normals = []
-        indices = []
-        # for index, child in enumerate(self._children):
-        #     child_info = self._get_child_info__debug(info, index)
-        for child, child_info in self.iter_children_info(info):
-            result = child._generate_mesh(child_info)
-            if result is None:
-                continue
-            # stime = time.time()
-            c_verts, c_normals, c_indices = result
-            info['index_offset'] += len(c_verts)/3
-            verts.extend(c_verts)
-            normals.extend(c_normals)
-            indices.extend(c_indices)
-            # top_node._mesh_times['extending_arrays'] += time.time() - stime
-        return verts, normals, indices
-
-    def _init_column_from_height_map(self, info, values, indices, min_height, max_height, origin):
-        max_ = values.max()
-        min_ = values.min()
-        all_leaf = (len(values) == 1)
-
-        # handle cases where both children are either solid or empty
-        #
-        if min_ > max_height:
-            self._children[indices[0]] = self._TREE_CLS._LEAF_CLS(1)
-            self._children[indices[1]] = self._TREE_CLS._LEAF_CLS(1)
-            return
-        elif max_ <= min_height:
-            self._children[indices[0]] = self._TREE_CLS._LEAF_CLS(0)
-            self._children[indices[1]] = self._TREE_CLS._LEAF_CLS(0)
-            return
-
-        # handle top
-        #
-        if max_ <= origin:
-            self._children[indices[0]] = self._TREE_CLS._LEAF_CLS(0)
-        elif all_leaf:
-            self._children[indices[0]] = self._TREE_CLS._LEAF_CLS(1)
-        else:
-            self._children[indices[0]] = self._TREE_CLS._BRANCH_CLS()
-            self._children[indices[0]]._init_from_height_map(self.get_child_info(info, indices[0]), values)
-
-        # handle bottom
-        #
-        if min_ > origin or all_leaf:
-            self._children[indices[1]] = self._TREE_CLS._LEAF_CLS(1)
-        else:
-            self._children[indices[1]] = self._TREE_CLS._BRANCH_CLS()
-            self._children[indices[1]]._init_from_height_map(self.get_child_info(info, indices[1]), values)
-
-    def _init_from_height_map(self, info, values):
-        # gather data to initialize each column individually
-        #
-        self._children = [None] * 8
-        full_size = len(values)
-        size = full_size / 2
-        origin = info['origin'].y
-        min_height = origin - (info['size']/2)
-        max_height = origin + (info['size']/2)
+    def get_block(self):
+        """ Create a block object for this leaf node
 
+        Returns:
+            blocks.AbstractBlock
         """
-        x o
-        o o
-        """
-        v = values[:size, :size]
-        indices = (2, 0) # -x -z
-        self._init_column_from_height_map(info, v, indices, min_height, max_height, origin)
+        world = self.tree
+        block_cls = world.game.get_block_cls(self.get_value())
+        return block_cls(world.game, world, self.get_value(), self.get_origin(), self.get_size())
 
-        """
-        o x
-        o o
-        """
-        v = values[size:full_size, :size]
-        indices = (3, 1) # +x -z
-        self._init_column_from_height_map(info, v, indices, min_height, max_height, origin)
 
-        """
-        o o
-        x o
-        """
-        v = values[:size, size:full_size]
-        indices = (6, 4) # -x +z
-        self._init_column_from_height_map(info, v, indices, min_height, max_height, origin)
-
-        """
-        o o
-        o x
-        """
-        v = values[size:full_size, size:full_size]
-        indices = (7, 5) # +x +z
-        self._init_column_from_height_map(info, v, indices, min_height, max_height, origin)
-
-    def _get_collisions(self, info, bbox):
-        this_bbox = self._get_bbox(info)
-        collision = this_bbox.intersection(bbox)
-        result = []
-        if collision:
-            for child, child_info in self.iter_children_info(info):
-                child_collisions = child._get_collisions(child_info, bbox)
-                result.extend(child_collisions)
-        return result
-
-    def _get_blocks(self, info, bbox, exclude_types, inclusive):
-        this_bbox = self._get_bbox(info)
-        collision = this_bbox.intersection(bbox, inclusive)
-        results = []
-        if collision:
-            for child, child_info in self.iter_children_info(info):
-                results.extend(child._get_blocks(child_info, bbox, exclude_types, inclusive))
-        return results
-
-    def _get_block(self, info, point):
-        index = self.get_closest_child_index(info, point)
-        child = self._children[index]
-        child_info = self.get_child_info(info, index)
-        return child._get_block(child_info, point)
-
-    def _is_grounded(self, info, bbox):
-        this_bbox = self._get_bbox(info)
-        if this_bbox.collides(bbox, inclusive=[1]):
-            for child, child_info in self.iter_children_info(info):
-                if child._is_grounded(child_info, bbox):
-                    return True
-        return False
+class World(game_core.Octree):
+    """ Octree of blocks that makes up the game world.
 
+    Leaves at the maximum depth are 1 unit blocks.  Node values are block ids
+    so the tree is stored in packed arrays rather than node objects.
+    """
+    STORAGE_CLS = game_core.ArrayTreeStorage
+    VALUE_DTYPE = numpy.uint16
 
-class _WorldOctreeLeaf(AbstractWorldOctreeBase, octree._OctreeLeaf):
-    # def _render(self, info, shader):
-    #     if not self._data:
-    #         return
-
-    #     # if abs(info['origin'][0]) > 5:
-    #     #     return
-    #     # if abs(info['origin'][2]) > 5:
-    #     #     return
-    #     if info['origin'][1] > 18 or info['origin'][1] < 10:
-    #         return
-    #     # if info['origin'][1] != 13.5:
-    #     #     return
-
-    #     mat = game_core.Matrix()
-    #     mat[0,0] = mat[1,1] = mat[2,2] = info['size']
-    #     mat[3,0] = info['origin'][0]
-    #     mat[3,1] = info['origin'][1]
-    #     mat[3,2] = info['origin'][2]
-
-    #     # if Game.INSTANCE.do_printing:
-    #     #     print 'rendering debug cube:'
-    #     #     print mat
-
-    #     GL.glUniformMatrix4fv(shader.uniforms['modelToWorldMatrix'], 1, GL.GL_FALSE, mat.tolist())
-    #     Game.INSTANCE.cube.render()
-
-    def _get_height(self, info, x, z):
-        if not self._data:
-            return None
-        return info['origin'].y+(info['size'] / 2.0)
-
-    def _generate_mesh(self, info):
-        top_node = info['parents'][0]
-        # stime = time.time()
-        block = self._get_block(info, None)
-        # top_node._mesh_times['should_generate_mesh: get_block'] += time.time() - stime
-        should_generate_mesh = block.should_generate_mesh()
-        if not should_generate_mesh:
-            return
-
-        # generate mesh data for this point
-        #
-        # stime = time.time()
-        origin_x = info['origin'].x
-        origin_y = info['origin'].y
-        origin_z = info['origin'].z
-        size = info['size']
-        normals = info['cube'].NORMALS
-        cube_verts = info['cube'].VERTICES
-        # top_node._mesh_times['gathering_info'] += time.time() - stime
-        # stime = time.time()
-        verts = []
-        for i in xrange(0, len(cube_verts), 3):
-            # vert = origin + game_core.Vector([cube_verts[i], cube_verts[i+1], cube_verts[i+2]]) * size
-            # verts.append(vert.x)
-            # verts.append(vert.y)
-            # verts.append(vert.z)
-            verts.append(origin_x + cube_verts[i] * size)
-            verts.append(origin_y + cube_verts[i+1] * size)
-            verts.append(origin_z + cube_verts[i+2] * size)
-        # top_node._mesh_times['generating_verts'] += time.time() - stime
-
-        # stime = time.time()
-        indices = [i + info['index_offset'] for i in info['cube'].INDICES]
-        # top_node._mesh_times['generating_indices'] += time.time() - stime
-        return verts, normals, indices
-
-    def _get_collisions(self, info, bbox):
-        if not bool(self._data):
-            return []
-        this_bbox = self._get_bbox(info)
-        collision = this_bbox.intersection(bbox)
-        if collision:
-            return [(collision, self._get_block(info, None))]
-        else:
-            return []
-
-    def _get_blocks(self, info, bbox, exclude_types, inclusive):
-        block_cls = Game.INSTANCE.get_block_cls(self._data)
-        if block_cls in exclude_types:
-            return []
-
-        this_bbox = self._get_bbox(info)
-        collision = this_bbox.intersection(bbox, inclusive)
-        if collision:
-            return [block_cls(Game.INSTANCE, self, info)]
-        else:
-            return []
-
-    def _get_block(self, info, point):
-        block_cls = Game.INSTANCE.get_block_cls(self._data)
-        return block_cls(Game.INSTANCE, self, info)
-
-    def _is_grounded(self, info, bbox):
-        block_cls = Game.INSTANCE.get_block_cls(self._data)
-        if not block_cls.is_solid():
-            return False
-
-        this_bbox = self._get_bbox(info)
-        return this_bbox.collides(bbox, inclusive=[1])
-
-
-class World(octree.Octree):
-    def __init__(self, size):
+    def __init__(self, game, size, cache_path=None):
         """
+        :param Game game:
         :param int size:
+        :param str cache_path: If provided the blocks are loaded from this
+            file when it exists instead of being generated and are saved to
+            it after being generated.  A file saved from a world of a
+            different size is ignored (and replaced).
         """
-        super(World, self).__init__(size)
+        super(World, self).__init__(size, max_depth=int(math.log(size, 2)))
+        self.game = game
         self.mesh = None
 
-        stime = time.time()
-        self._generation_height_map = self._generate_height_map()
-        print 'height map generation time:', (time.time() - stime)
+        # spatial index of dynamic entities (e.g. the player) for broad
+        # phase entity vs entity checks
+        self.entities = game_core.DynamicAABBTree()
+
+        # lookup array of whether each block id is solid. Built on first use
+        self._solid_ids = None  # type: Optional[numpy.ndarray]
+
+        # height of the top of the highest solid block in each (x, z) column
+        # of cells (-inf for empty columns).  Kept up to date by
+        # `_on_change` so height queries don't have to walk the tree
+        self._heights = None  # type: Optional[numpy.ndarray]
+
+        if not self._load_cache(cache_path):
+            self._generate()
+            if cache_path is not None:
+                stime = time.time()
+                self.save(cache_path)
+                print 'octree save time:', (time.time() - stime)
 
         stime = time.time()
-        self._init_from_height_map(self._generation_height_map)
-        print 'octree initialization time:', (time.time() - stime)
+        num_cells = 1 << self.max_depth
+        self._heights = numpy.full((num_cells, num_cells), -numpy.inf)
+        self._update_heights(0, num_cells, 0, num_cells)
+        self.add_change_listener(self._on_change)
+        print 'height field time:', (time.time() - stime)
 
         # stime = time.time()
         # self._debug_mesh = None
@@ -441,46 +196,41 @@ class World(octree.Octree):
         # print '  TOTAL:', total_time
         print 'mesh generation time:', total_time
 
+    def _load_cache(self, cache_path):
+        """ Load the blocks from a file saved by a previous run
+
+        The file is read into regular array storage rather than memory
+        mapped so that the world can still be edited.
+
+        Returns:
+            bool: whether the blocks were loaded
+        """
+        if cache_path is None or not os.path.exists(cache_path):
+            return False
+        stime = time.time()
+        try:
+            self.load(cache_path)
+        except ValueError as e:
+            print 'ignoring world cache:', e
+            return False
+        print 'octree load time:', (time.time() - stime)
+        return True
+
+    def _generate(self):
+        """ Generate the blocks from a random height map
+        """
+        stime = time.time()
+        self._generation_height_map = self._generate_height_map()
+        print 'height map generation time:', (time.time() - stime)
+
+        stime = time.time()
+        self._init_from_height_map(self._generation_height_map)
+        print 'octree initialization time:', (time.time() - stime)
+
     def _generate_height_map(self):
         """generates a height map using a modified diamond-square algorithm
         """
-
-        size = int(self.size())
-        values = numpy.zeros((size+1, size+1), dtype=float)
-        sea_level = 0.0
-        ratio = 0.5
-        scale = float(size) / 8.0
-        stride = size / 2
-
-        random.seed(1234)
-        while stride:
-            # perform 'square' step
-            #
-            for i in xrange(stride, size, stride*2):
-                for j in xrange(stride, size, stride*2):
-                    values[i][j] = scale * fractal_rand() + avg_square_vals(i, j, stride, values)
-
-            # perform 'diamond' step
-            #
-            odd_line = False
-            for i in xrange(0, size, stride):
-                odd_line = (odd_line is False)
-                start = 0
-                if odd_line:
-                    start = stride
-                for j in xrange(start, size, stride*2):
-                    values[i][j] = scale * fractal_rand() + avg_diamond_vals(i, j, stride, size, values)
-
-                    if i == 0:
-                        values[size][j] = values[i][j]
-                    if j == 0:
-                        values[i][size] = values[i][j]
-
-            scale *= ratio
-            stride >>= 1
-
-        values = values[:-1, :-1]
-        return values
+        return terrain.generate_height_map(int(self.size))
 
     def _generate_debug_mesh(self, values):
         # # print height map
@@ -502,8 +252,8 @@ class World(octree.Octree):
         verts = []
         normals = []
         indices = []
-        start_x = -(self.size() / 2)
-        start_z = -(self.size() / 2)
+        start_x = -(self.size / 2)
+        start_z = -(self.size / 2)
         cube_verts = cube.VERTICES
         for x, row in enumerate(values):
             x = start_x + float(x) + 0.5
@@ -533,17 +283,221 @@ class World(octree.Octree):
 
         self._debug_mesh = game_core.Mesh(verts, normals, indices, GL.GL_TRIANGLES)
 
+    def _get_default_node_data(self):
+        return 0
+
+    def _create_node_proxy(self, data, parent=None, index=0, code=None):
+        """
+        :rtype: WorldNode
+        """
+        return WorldNode(data, tree=self, parent=parent, index=index, code=code)
+
+    def _create_block(self, info):
+        """ Create a block object for a leaf returned by one of the tree's
+        iterators or queries
+
+        :param game_core.TreeNodeInfo info:
+        :rtype: blocks.AbstractBlock
+        """
+        block_cls = self.game.get_block_cls(info.value)
+        return block_cls(self.game, self, info.value, game_core.Point(*info.origin), info.size)
+
+    @staticmethod
+    def _get_leaf_bounds(info):
+        """
+        :param game_core.TreeNodeInfo info:
+        :rtype: game_core.BoundingBox
+        """
+        half_size = info.size / 2.0
+        origin = game_core.Point(*info.origin)
+        half_size_vector = game_core.Vector(half_size, half_size, half_size)
+        return game_core.BoundingBox(origin - half_size_vector, origin + half_size_vector)
+
+    def _get_face_visibility(self, ids):
+        """ Get whether blocks draw their faces against each other
+
+        Args:
+            ids (numpy.ndarray): unique block ids
+
+        Returns:
+            numpy.ndarray: (len(ids), len(ids) + 1) bool array of whether a
+                block with the first id draws its face against a block with
+                the second id.  The last column is for faces against the
+                outside of the world.
+        """
+        origin = game_core.Point()
+        id_blocks = [
+            self.game.get_block_cls(int(id_))(self.game, self, int(id_), origin, self.min_size)
+            for id_ in ids
+        ]
+        return numpy.array([
+            [neighbor.should_neighbor_generate_mesh(block) for neighbor in id_blocks] + [True]
+            if block.should_generate_mesh() else [False] * (len(id_blocks) + 1)
+            for block in id_blocks
+        ], dtype=bool).reshape(len(id_blocks), len(id_blocks) + 1)
+
     def _generate_mesh(self):
-        info = self._get_info()
-        info['cube'] = cube
-        info['index_offset'] = 0
-        verts, normals, indices = self._root._generate_mesh(info)
-        # stime = time.time()
+        """ Generate a mesh of the block faces that can be seen
+
+        Faces between blocks that hide each other (e.g. two solid blocks)
+        are culled by checking each leaf's same-or-larger neighbors.  The
+        part of a leaf's face that is against smaller leaves is found from
+        the smaller leaves' side.  The remaining faces are broken up into
+        unit squares and merged back into as few rectangles as possible per
+        plane and block id.
+        """
+        leaf_handles, cells, depths = self._get_leaf_arrays()
+        neighbor_handles = self._get_neighbor_handles(cells, depths, self.face_directions)
+        neighbor_indexes = self._get_handle_indexes(neighbor_handles, leaf_handles)
+        max_depth = self.max_depth
+        num_cells = 1 << max_depth
+        cell_sizes = numpy.int64(1) << (max_depth - depths)
+        ids, id_indexes = numpy.unique(self._storage.get_value_batch(leaf_handles), return_inverse=True)
+        visibility = self._get_face_visibility(ids)
+        outside_index = len(ids)
+
+        # gather the visible faces as the index of their direction in
+        # `face_directions`, the leaf whose cells they cover, the cell
+        # coordinate of their plane and the index of their block id
+        #
+        face_directions = []
+        face_leaves = []
+        face_planes = []
+        face_ids = []
+        for direction_index, direction in enumerate(self.face_directions):
+            axis = direction_index // 2
+            planes = cells[:, axis] + (cell_sizes if direction[axis] > 0 else 0)
+            neighbors = neighbor_indexes[:, direction_index]
+            has_leaf = neighbors >= 0
+            neighbor_ids = id_indexes[neighbors]
+            outside = neighbor_handles[:, direction_index] == self._storage.NULL
+
+            # the leaf's own face against a same-or-larger leaf or the
+            # outside of the world
+            front_ids = numpy.where(has_leaf, neighbor_ids, outside_index)
+            visible = numpy.flatnonzero((has_leaf | outside) & visibility[id_indexes, front_ids])
+            face_directions.append(numpy.full(len(visible), direction_index, dtype=numpy.int64))
+            face_leaves.append(visible)
+            face_planes.append(planes[visible])
+            face_ids.append(id_indexes[visible])
+
+            # the part of a larger neighbor's face that is against the leaf
+            visible = numpy.flatnonzero(
+                has_leaf & (depths[neighbors] < depths) & visibility[neighbor_ids, id_indexes])
+            face_directions.append(numpy.full(len(visible), direction_index ^ 1, dtype=numpy.int64))
+            face_leaves.append(visible)
+            face_planes.append(planes[visible])
+            face_ids.append(neighbor_ids[visible])
+
+        face_directions = numpy.concatenate(face_directions)
+        face_leaves = numpy.concatenate(face_leaves)
+        face_planes = numpy.concatenate(face_planes)
+        face_ids = numpy.concatenate(face_ids)
+
+        # break the faces up into unit squares
+        #
+        face_sizes = cell_sizes[face_leaves]
+        counts = face_sizes * face_sizes
+        squares = numpy.repeat(numpy.arange(len(counts)), counts)
+        offsets = numpy.arange(len(squares)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        square_sizes = face_sizes[squares]
+        square_axes = face_directions[squares] // 2
+        square_cells = cells[face_leaves[squares]]
+        rows = numpy.arange(len(squares))
+        u = square_cells[rows, _U_AXES[square_axes]] + offsets // square_sizes
+        v = square_cells[rows, _V_AXES[square_axes]] + offsets % square_sizes
+        keys = (face_ids[squares] * len(self.face_directions) + face_directions[squares]) * (num_cells + 1)
+        keys += face_planes[squares]
+
+        keys, u_min, u_max, v_min, v_max = _merge_squares(keys, u, v)
+        directions = (keys // (num_cells + 1)) % len(self.face_directions)
+        axes = directions // 2
+
+        # create a quad for each rectangle by copying the matching cube
+        # face's corners from either side of the rectangle.  The mesh data
+        # is written straight into the float32/uint32 arrays that the mesh
+        # uploads
+        #
+        count = len(keys)
+        rows = numpy.arange(count)
+        mins = numpy.empty((count, 3), dtype=numpy.float32)
+        mins[rows, axes] = keys % (num_cells + 1)
+        maxs = mins.copy()
+        mins[rows, _U_AXES[axes]] = u_min
+        mins[rows, _V_AXES[axes]] = v_min
+        maxs[rows, _U_AXES[axes]] = u_max
+        maxs[rows, _V_AXES[axes]] = v_max
+        half_size = self.size / 2.0
+        mins *= self.min_size
+        mins -= half_size
+        maxs *= self.min_size
+        maxs -= half_size
+
+        corners, face_normals = _get_cube_faces(self.face_directions)
+        verts = numpy.empty((count, 4, 3), dtype=numpy.float32)
+        verts[:] = mins[:, numpy.newaxis, :]
+        numpy.copyto(verts, maxs[:, numpy.newaxis, :], where=corners[directions])
+        normals = numpy.empty((count, 4, 3), dtype=numpy.float32)
+        normals[:] = face_normals[directions][:, numpy.newaxis, :]
+        indices = numpy.empty((count, 6), dtype=numpy.uint32)
+        numpy.add((rows * 4)[:, numpy.newaxis], cube.INDICES[:6], out=indices, casting='unsafe')
         self.mesh = game_core.Mesh(verts, normals, indices, GL.GL_TRIANGLES)
-        # self._mesh_times['creating_mesh'] = time.time() - stime
 
     def _init_from_height_map(self, values):
-        self._root._init_from_height_map(self._get_info(), values)
+        """ Fill the world with solid blocks below a height map
+
+        A block is solid if the height of its column is above the bottom of
+        the block.  Min/max pyramids of the height map tell whether each node
+        of a level is entirely solid, entirely empty or has to be split, so
+        the compact tree is built one level at a time, straight into level
+        order arrays (see `AbstractTree.load_level_order`).
+
+        Args:
+            values (numpy.ndarray): (num_cells, num_cells) heights indexed by
+                x and z cell
+        """
+        max_depth = self.max_depth
+        num_cells = 1 << max_depth
+        cell_size = float(self.size) / num_cells
+        half_size = self.size / 2.0
+
+        # level i of the pyramids holds the min/max height of every square of
+        # 2**i by 2**i columns
+        #
+        min_pyramid = [values]
+        max_pyramid = [values]
+        for _ in xrange(max_depth):
+            count = len(min_pyramid[-1]) // 2
+            min_pyramid.append(min_pyramid[-1].reshape(count, 2, count, 2).min(axis=3).min(axis=1))
+            max_pyramid.append(max_pyramid[-1].reshape(count, 2, count, 2).max(axis=3).max(axis=1))
+
+        x_bit, y_bit, z_bit = self.dimension_bits
+        child_offsets = numpy.array([
+            (bool(i & x_bit), bool(i & y_bit), bool(i & z_bit))
+            for i in xrange(1 << self.DIMENSIONS)
+        ], dtype=numpy.int64)
+
+        # cell coordinates of the nodes of the current level divided by
+        # their size in cells
+        coords = numpy.zeros((1, 3), dtype=numpy.int64)
+        is_branch_levels = []
+        value_levels = []
+        for depth in xrange(max_depth + 1):
+            node_cells = num_cells >> depth
+            min_heights = min_pyramid[max_depth - depth][coords[:, 0], coords[:, 2]]
+            max_heights = max_pyramid[max_depth - depth][coords[:, 0], coords[:, 2]]
+            bottom = coords[:, 1] * (node_cells * cell_size) - half_size
+            solid = min_heights > bottom + (node_cells - 1) * cell_size
+            is_branch = ~solid & (max_heights > bottom)
+            if depth == max_depth:
+                is_branch[:] = False
+            is_branch_levels.append(is_branch)
+            value_levels.append(solid.astype(self.VALUE_DTYPE))
+            if not is_branch.any():
+                break
+            coords = (coords[is_branch, numpy.newaxis, :] * 2 + child_offsets).reshape(-1, 3)
+
+        self.load_level_order(numpy.concatenate(is_branch_levels), numpy.concatenate(value_levels))
 
     def render(self):
         with self.game.shaders['skin'] as shader:
@@ -551,7 +505,7 @@ class World(octree.Octree):
                     shader.uniforms['modelToWorldMatrix'], 
                     1, 
                     GL.GL_FALSE, 
-                    game_core.Matrix().tolist())
+                    game_core.Matrix().as_float32())
             GL.glUniform4f(shader.uniforms['diffuseColor'], 0.5, 1.0, 0.5, 1.0)
             self.mesh.render()
 
@@ -567,11 +521,106 @@ class World(octree.Octree):
             # for child, child_info in self.iter_children_info(info):
             #     child._render(child_info, shader)
 
+    def _update_heights(self, x_start, x_end, z_start, z_end):
+        """ Recompute the heights of a range of columns
+
+        Args:
+            x_start (int): first column cell along x
+            x_end (int): column cell after the last one along x
+            z_start (int)
+            z_end (int)
+        """
+        heights = self._heights
+        heights[x_start:x_end, z_start:z_end] = -numpy.inf
+        solid_ids = self._get_solid_ids()
+        half_size = self.size / 2.0
+        cell_size = self.size / (1 << self.max_depth)
+        bbox = game_core.BoundingBox(
+            [x_start * cell_size - half_size, -half_size, z_start * cell_size - half_size],
+            [x_end * cell_size - half_size, half_size, z_end * cell_size - half_size],
+        )
+        for info in self.iter_leaves(bbox):
+            if not solid_ids[info.value]:
+                continue
+            x, y, z = info.origin
+            half_cells = info.size / cell_size / 2.0
+            x = (x + half_size) / cell_size
+            z = (z + half_size) / cell_size
+            region = heights[
+                max(int(x - half_cells), x_start):min(int(x + half_cells), x_end),
+                max(int(z - half_cells), z_start):min(int(z + half_cells), z_end),
+            ]
+            numpy.maximum(region, y + info.size / 2.0, out=region)
+
+    def _on_change(self, code, structural):
+        """ Update the heights of the columns that a change to the node
+        `code` could affect
+        """
+        depth, coords = self.code_to_coords(code)
+        shift = self.max_depth - depth
+        self._update_heights(
+            coords[0] << shift, (coords[0] + 1) << shift,
+            coords[2] << shift, (coords[2] + 1) << shift,
+        )
+
+    def _get_column(self, component):
+        """ Get the column cell containing an x or z component.  Components
+        outside of the world are clamped to the edge columns.
+
+        Returns:
+            int
+        """
+        num_cells = 1 << self.max_depth
+        cell = int(math.floor((component + self.size / 2.0) * (num_cells / self.size)))
+        return min(max(cell, 0), num_cells - 1)
+
     def get_height(self, x, z):
-        return self._root._get_height(self._get_info(), x, z)
+        """ Get the height of the top of the highest solid block in the
+        column containing a point
+
+        Points outside of the world get the height of the closest column.
+
+        Args:
+            x (float)
+            z (float)
+
+        Returns:
+            Optional[float]: None if there are no solid blocks in the column
+        """
+        height = self._heights[self._get_column(x), self._get_column(z)]
+        if height == -numpy.inf:
+            return None
+        return float(height)
+
+    def get_heights(self, x, z):
+        """ Batch version of `get_height`
+
+        Args:
+            x (numpy.ndarray): x components
+            z (numpy.ndarray): z components
+
+        Returns:
+            numpy.ndarray: the heights.  NaN for columns without solid blocks
+        """
+        num_cells = 1 << self.max_depth
+        scale = num_cells / self.size
+        half_size = self.size / 2.0
+        columns_x = numpy.clip(numpy.floor((numpy.asarray(x) + half_size) * scale), 0, num_cells - 1).astype(numpy.int64)
+        columns_z = numpy.clip(numpy.floor((numpy.asarray(z) + half_size) * scale), 0, num_cells - 1).astype(numpy.int64)
+        heights = self._heights[columns_x, columns_z]
+        heights[heights == -numpy.inf] = numpy.nan
+        return heights
 
     def get_collisions(self, bbox):
-        return self._root._get_collisions(self._get_info(), bbox)
+        infos = [info for info in self.query_box(bbox, inclusive=[]) if info.value]
+        if not infos:
+            return []
+        leaves = game_core.BoundingBoxArray.from_centers(
+            [info.origin for info in infos],
+            [info.size / 2.0 for info in infos],
+        )
+        indexes, collisions = leaves.intersection(bbox)
+        return [(collisions[i], self._create_block(infos[index])) for i, index in enumerate(indexes)]
 
     def get_blocks(self, bbox, exclude_types=None, inclusive=None):
         """Retrieve a list of blocks contained within *bbox*
@@ -590,21 +639,152 @@ class World(octree.Octree):
             exclude_types = [blocks.Air]
         if inclusive is None:
             inclusive = []
-        return self._root._get_blocks(self._get_info(), bbox, exclude_types, inclusive)
+        get_block_cls = self.game.get_block_cls
+        result = []
+        for info in self.query_box(bbox, inclusive=inclusive):
+            if get_block_cls(info.value) not in exclude_types:
+                result.append(self._create_block(info))
+        return result
 
     def get_block(self, point):
-        bounds = self.size() / 2.0
-        if point.x > bounds or point.z > bounds or point.y > bounds:
+        node = self.get_node_from_point(point)
+        if node is None:
+            return None
+        return node.get_block()
+
+    def get_block_ids(self, points):
+        """ Get the block id at each of the provided points
+
+        Args:
+            points (numpy.ndarray): (N, 3) array of points
+
+        Returns:
+            numpy.ndarray: block ids. Points outside of the world get 0 (air)
+        """
+        _, values = self.get_nodes_from_points(points)
+        return values
+
+    def _get_hit_ids(self, exclude_types):
+        """ Get a lookup array of whether rays hit each block id
+
+        Returns:
+            numpy.ndarray: bool array indexed by block id
+        """
+        if exclude_types is None:
+            exclude_types = [blocks.Air]
+        return numpy.array([cls not in exclude_types for cls in self.game.block_ids_to_cls], dtype=bool)
+
+    def raycast(self, origin, direction, max_distance=None, exclude_types=None):
+        """ Find the first block hit by a ray
+
+        Empty and uniform regions of the world are crossed one octree leaf
+        at a time rather than one block at a time.
+
+        Args:
+            origin (game_core.Point)
+            direction (game_core.Vector): does not need to be normalized
+            max_distance (Optional[float]): ignore blocks further than this
+            exclude_types (Optional[List[Type[blocks.AbstractBlock]]]): block
+                types that rays pass through. Defaults to [blocks.Air]
+
+        Returns:
+            Optional[BlockHit]: None if no block was hit. The normal is the
+                face of the block that was hit, or zero if the origin is
+                inside of the block
+        """
+        hit_ids = self._get_hit_ids(exclude_types)
+        hit = self.cast_ray(
+            tuple(origin), tuple(direction), max_distance, predicate=lambda value: hit_ids[value])
+        if hit is None:
             return None
-        return self._root._get_block(self._get_info(), point)
+        return BlockHit(
+            self._create_block(hit.info),
+            game_core.Point(*hit.point),
+            game_core.Vector(*hit.normal),
+            hit.distance,
+        )
+
+    def raycast_batch(self, origins, directions, max_distance=None, exclude_types=None):
+        """ Batch version of `raycast`
+
+        Args:
+            origins (numpy.ndarray): (N, 3) array of origins
+            directions (numpy.ndarray): (N, 3) array of directions
+            max_distance (Optional[Union[float, numpy.ndarray]]): a single
+                maximum distance or one per ray
+            exclude_types (Optional[List[Type[blocks.AbstractBlock]]])
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]: the id of the
+                block hit by each ray (0 for misses), the distance to it (inf
+                for misses) and the (N, 3) normal of the face that was hit
+        """
+        hit_ids = self._get_hit_ids(exclude_types)
+        distances, normals, handles = self.cast_rays(
+            origins, directions, max_distance, predicate=lambda values: hit_ids[values])
+        ids = numpy.zeros(len(distances), dtype=self.VALUE_DTYPE)
+        hits = numpy.isfinite(distances)
+        ids[hits] = self._storage.get_value_batch(handles[hits])
+        return ids, distances, normals
+
+    def _get_solid_ids(self):
+        """ Get a lookup array of whether each block id is solid
+
+        Returns:
+            numpy.ndarray: bool array indexed by block id
+        """
+        if self._solid_ids is None:
+            self._solid_ids = numpy.array([cls.is_solid() for cls in self.game.block_ids_to_cls], dtype=bool)
+        return self._solid_ids
+
+    def get_solid_extents(self, bbox):
+        """ Get the extents of the solid blocks that intersect or touch a
+        bounding box without creating block objects (see
+        `game_core.slide_box`)
+
+        Args:
+            bbox (game_core.BoundingBox)
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.ndarray]: (N, 3) arrays of the
+                minimums and maximums of the blocks
+        """
+        solid_ids = self._get_solid_ids()
+        return self.query_box_extents(bbox, predicate=lambda value: solid_ids[value])
 
     def is_grounded(self, bbox):
-        return self._root._is_grounded(self._get_info(), bbox)
+        """ Get whether any solid blocks touch or intersect a bounding box.
+        Blocks that only touch its sides are ignored.
 
+        This is answered from the column heights unless there are solid
+        blocks above the bottom of the box (e.g. under an overhang) or the
+        box has no width or depth.
 
-_WorldOctreeBranch._TREE_CLS = World
-_WorldOctreeLeaf._TREE_CLS = World
+        Args:
+            bbox (game_core.BoundingBox)
 
-World._LEAF_CLS = _WorldOctreeLeaf
-World._BRANCH_CLS = _WorldOctreeBranch
+        Returns:
+            bool
+        """
+        # the columns that the box intersects (excluding ones it only touches)
+        num_cells = 1 << self.max_depth
+        scale = num_cells / self.size
+        half_size = self.size / 2.0
+        x_start = max(int(math.floor((bbox._min[0] + half_size) * scale)), 0)
+        x_end = min(int(math.ceil((bbox._max[0] + half_size) * scale)), num_cells)
+        z_start = max(int(math.floor((bbox._min[2] + half_size) * scale)), 0)
+        z_end = min(int(math.ceil((bbox._max[2] + half_size) * scale)), num_cells)
+        if x_start < x_end and z_start < z_end:
+            heights = self._heights[x_start:x_end, z_start:z_end]
+            bottom = bbox._min[1]
+            if heights.max() < bottom:
+                return False
+            if ((heights >= bottom) & (heights <= bbox._max[1])).any():
+                return True
+
+        solid_ids = self._get_solid_ids()
+        for info in self.query_box(bbox, inclusive=[1]):
+            if solid_ids[info.value]:
+                return True
+        return False
 
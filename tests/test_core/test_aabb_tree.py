@@ -0,0 +1,61 @@
+import random
+
+import game_core
+
+
+def _random_box(rng):
+    center = [rng.uniform(0.0, 20.0) for _ in range(3)]
+    half_size = [rng.uniform(0.1, 1.0) for _ in range(3)]
+    return game_core.BoundingBox(
+        [c - h for c, h in zip(center, half_size)],
+        [c + h for c, h in zip(center, half_size)],
+    )
+
+
+def test_dynamic_aabb_tree():
+    rng = random.Random(7)
+    tree = game_core.DynamicAABBTree(margin=0.1)
+    proxies = {}
+    for i in range(200):
+        proxies[tree.insert(_random_box(rng), data=i)] = i
+    for proxy in list(proxies)[::3]:
+        tree.remove(proxy)
+        del proxies[proxy]
+    for proxy in list(proxies)[::2]:
+        tree.move(proxy, _random_box(rng), displacement=(0.5, 0.0, -0.5))
+
+    assert len(tree) == len(proxies)
+    assert sorted(tree.iter_proxies()) == sorted(proxies)
+    assert tree.height() <= 12
+
+    fat = dict((proxy, tree.get_fat_bbox(proxy)) for proxy in proxies)
+    everything = [0, 1, 2]
+    for _ in range(20):
+        bbox = _random_box(rng)
+        expected = sorted(proxy for proxy in proxies if fat[proxy].collides(bbox, everything))
+        assert sorted(tree.query(bbox)) == expected
+
+    ordered = sorted(proxies)
+    expected_pairs = [
+        (a, b)
+        for i, a in enumerate(ordered)
+        for b in ordered[i + 1:]
+        if fat[a].collides(fat[b], everything)
+    ]
+    assert tree.query_pairs() == expected_pairs
+
+    proxy = ordered[0]
+    assert tree.get_data(proxy) == proxies[proxy]
+    center = fat[proxy].center()
+    hits = tree.raycast([center.x, -10.0, center.z], [0.0, 1.0, 0.0])
+    assert proxy in [hit for _, hit in hits]
+    assert [t for t, _ in hits] == sorted(t for t, _ in hits)
+
+
+def test_move_inside_fat_box():
+    tree = game_core.DynamicAABBTree(margin=0.5)
+    proxy = tree.insert(game_core.BoundingBox([0.0, 0.0, 0.0], [1.0, 1.0, 1.0]))
+    other = tree.insert(game_core.BoundingBox([5.0, 0.0, 0.0], [6.0, 1.0, 1.0]))
+    assert not tree.move(proxy, game_core.BoundingBox([0.25, 0.0, 0.0], [1.25, 1.0, 1.0]))
+    assert tree.move(proxy, game_core.BoundingBox([4.0, 0.0, 0.0], [5.0, 1.0, 1.0]))
+    assert tree.query_pairs() == [(proxy, other)]
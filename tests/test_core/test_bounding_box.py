@@ -0,0 +1,51 @@
+import numpy
+
+import game_core
+
+
+def test_collides():
+    a = game_core.BoundingBox([0.0, 0.0, 0.0], [1.0, 1.0, 1.0])
+    b = game_core.BoundingBox([1.0, 0.5, 0.5], [2.0, 1.5, 1.5])
+    assert not a.collides(b)
+    assert a.collides(b, inclusive=[0])
+    assert not a.collides(b, inclusive=[1, 2])
+
+    intersection = a.intersection(b, inclusive=[0])
+    assert list(intersection.min()) == [1.0, 0.5, 0.5]
+    assert list(intersection.max()) == [1.0, 1.0, 1.0]
+    assert a.intersection(b) is None
+
+
+def test_bounding_box_array():
+    boxes = game_core.BoundingBoxArray.from_centers(
+        [(0.5, 0.5, 0.5), (1.5, 0.5, 0.5), (5.0, 5.0, 5.0)],
+        [0.5, 0.5, 1.0],
+    )
+    assert len(boxes) == 3
+    assert list(boxes[1].min()) == [1.0, 0.0, 0.0]
+    assert list(boxes.volume()) == [1.0, 1.0, 8.0]
+
+    query = game_core.BoundingBox([0.5, 0.5, 0.5], [1.0, 1.0, 1.0])
+    assert boxes.collides(query).tolist() == [True, False, False]
+    assert boxes.collides(query, inclusive=[0]).tolist() == [True, True, False]
+    assert boxes.collides(query, inclusive=[True, False, False]).tolist() == [True, True, False]
+
+    indexes, intersections = boxes.intersection(query, inclusive=[0])
+    assert indexes.tolist() == [0, 1]
+    assert intersections.min().tolist() == [[0.5, 0.5, 0.5], [1.0, 0.5, 0.5]]
+    assert intersections.max().tolist() == [[1.0, 1.0, 1.0], [1.0, 1.0, 1.0]]
+
+    # pairwise with another array
+    others = boxes.translate([0.5, 0.0, 0.0])
+    assert boxes.collides(others).tolist() == [True, True, True]
+    assert boxes.collides(others[::-1]).tolist() == [False, True, False]
+
+    union = boxes.union(query)
+    assert union.max().tolist()[0] == [1.0, 1.0, 1.0]
+    assert union.min().tolist()[2] == [0.5, 0.5, 0.5]
+
+    point = game_core.Point(1.0, 0.5, 0.5)
+    assert boxes.contains_point(point).tolist() == [True, True, False]
+    assert boxes.contains_point(point, inclusive=[]).tolist() == [False, False, False]
+    points = numpy.array([(0.5, 0.5, 0.5), (0.0, 0.0, 0.0), (5.0, 5.0, 6.0)])
+    assert boxes.contains_point(points).tolist() == [True, False, True]
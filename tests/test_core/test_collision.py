@@ -0,0 +1,41 @@
+import numpy
+
+import game_core
+
+
+# a floor of 1 unit blocks and a wall along x = 2
+_MINS = numpy.array([(x, -1.0, z) for x in range(-4, 4) for z in range(-4, 4)] + [(2.0, 0.0, 0.0), (2.0, 1.0, 0.0)])
+_MAXS = _MINS + 1.0
+
+
+def test_sweep_box():
+    t, axis = game_core.sweep_box((0.0, 0.5, 0.0), (1.0, 1.5, 1.0), (0.0, -1.0, 0.0), _MINS, _MAXS)
+    assert (t, axis) == (0.5, 1)
+    t, axis = game_core.sweep_box((0.0, 0.5, 0.0), (1.0, 1.5, 1.0), (0.0, 1.0, 0.0), _MINS, _MAXS)
+    assert (t, axis) == (1.0, None)
+
+    # resting on the floor and sliding along it
+    t, axis = game_core.sweep_box((0.0, 0.0, 0.0), (1.0, 1.0, 1.0), (0.5, 0.0, 0.0), _MINS, _MAXS)
+    assert (t, axis) == (1.0, None)
+    t, axis = game_core.sweep_box((0.0, 0.0, 0.0), (1.0, 1.0, 1.0), (4.0, 0.0, 0.0), _MINS, _MAXS)
+    assert (t, axis) == (0.25, 0)
+
+    # boxes that are already overlapping are ignored
+    t, axis = game_core.sweep_box((2.25, 0.25, 0.25), (2.75, 0.75, 0.75), (0.0, 0.0, 1.0), _MINS, _MAXS)
+    assert (t, axis) == (1.0, None)
+
+    t, axis = game_core.sweep_box((0.0, 0.0, 0.0), (1.0, 1.0, 1.0), (1.0, 0.0, 0.0), _MINS[:0], _MAXS[:0])
+    assert (t, axis) == (1.0, None)
+
+
+def test_slide_box():
+    displacement, blocked = game_core.slide_box((0.0, 0.5, 0.0), (1.0, 1.5, 1.0), (2.0, -1.0, 0.5), _MINS, _MAXS)
+    assert displacement == [1.0, -0.5, 0.5]
+    assert blocked == 0b011
+
+    # fast moves can't tunnel through thin walls
+    out = game_core.Vector()
+    displacement, blocked = game_core.slide_box((0.0, 0.0, 0.0), (1.0, 1.0, 1.0), (100.0, -100.0, 0.0), _MINS, _MAXS, out)
+    assert displacement is out
+    assert list(out) == [1.0, 0.0, 0.0]
+    assert blocked == 0b011
@@ -21,15 +21,103 @@ def test_cached_method():
             Foo.count += 1
             return Foo.count
 
-    assert hasattr(Foo, '_bar__cached')
-
-    inst1 = Foo()
-    inst2 = Foo()
-    assert inst1.bar() == inst1.bar()
-    assert inst2.bar() == inst2.bar()
-    assert inst1.bar() != inst2.bar()
+    decorators.enable_cache_stats()
+    try:
+        inst1 = Foo()
+        inst2 = Foo()
+        assert inst1.bar() == inst1.bar()
+        assert inst2.bar() == inst2.bar()
+        assert inst1.bar() != inst2.bar()
+        assert decorators.get_cache_stats(Foo) == {'bar': (4, 2)}
+    finally:
+        decorators.enable_cache_stats(False)
 
     assert hasattr(inst1, '_bar__result')
     assert inst1._bar__result == 1
-    assert inst1.bar.__name__ == '_bar__cached'
+    assert Foo.bar.__name__ == 'bar'
+    assert decorators.get_cache_stats(Foo) == {'bar': (0, 0)}
+
+
+def test_cached_method_slots():
+    class Foo(object):
+        __metaclass__ = decorators.EnableCachedMethods
+        __slots__ = ('value', )
+
+        def __init__(self, value):
+            self.value = value
+
+        @decorators.cached_method
+        def bar(self):
+            return [self.value]
+
+    inst = Foo(1)
+    assert not hasattr(inst, '__dict__')
+    assert inst.bar() is inst.bar()
+    assert inst.bar() == [1]
+    inst.value = 2
+    Foo.bar.clear(inst)
+    assert inst.bar() == [2]
+
+
+def test_cache_stats():
+    class Foo(object):
+        __metaclass__ = decorators.EnableCachedMethods
+        __slots__ = ()
+
+        @decorators.cached_method
+        def bar(self):
+            return None
+
+    class Bar(Foo):
+        __slots__ = ()
+
+    class Baz(Foo):
+        __slots__ = ()
+
+    decorators.enable_cache_stats()
+    try:
+        inst = Bar()
+        for _ in range(3):
+            inst.bar()
+        Baz().bar()
+        assert decorators.get_cache_stats(Foo) == {'bar': (0, 0)}
+        assert decorators.get_cache_stats(Bar) == {'bar': (2, 1)}
+        assert decorators.get_cache_stats(Baz) == {'bar': (0, 1)}
+    finally:
+        decorators.enable_cache_stats(False)
+    inst.bar()
+    assert decorators.get_cache_stats(Bar) == {'bar': (0, 0)}
+
+
+def test_clear_cached_methods():
+    class Foo(object):
+        __metaclass__ = decorators.EnableCachedMethods
+
+        count = 0
+
+        @decorators.cached_method
+        def bar(self):
+            Foo.count += 1
+            return Foo.count
+
+        @decorators.cached_method
+        def baz(self):
+            return Foo.count
+
+    class Bar(Foo):
+        @decorators.cached_method
+        def qux(self):
+            return None
+
+    assert Foo._cached_method_names == ('bar', 'baz')
+    assert Bar._cached_method_names == ('bar', 'baz', 'qux')
 
+    inst = Foo()
+    assert inst.bar() == 1
+    assert inst.baz() == 1
+    decorators.clear_cached_methods(inst, ['bar'])
+    assert inst.bar() == 2
+    assert inst.baz() == 1
+    decorators.clear_cached_methods(inst)
+    assert not hasattr(inst, '_bar__result')
+    assert inst.baz() == 2
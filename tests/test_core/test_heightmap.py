@@ -0,0 +1,40 @@
+import game_core
+
+
+def _get_leaves(height_map):
+    return [(info.origin, info.size, info.value) for info in height_map.iter_leaves()]
+
+
+def test_generate_all():
+    height_map = game_core.HeightMap(16, 4.0, 3, seed=1)
+    height_map.generate_all()
+    leaves = _get_leaves(height_map)
+    assert len(leaves) == 64
+    assert set(size for _, size, _ in leaves) == set([2.0])
+
+    # the heights only depend on the seed
+    other = game_core.HeightMap(16, 4.0, 3, seed=1)
+    other.generate_all()
+    assert _get_leaves(other) == leaves
+    other = game_core.HeightMap(16, 4.0, 3, seed=2)
+    other.generate_all()
+    assert [value for _, _, value in _get_leaves(other)] != [value for _, _, value in leaves]
+
+
+def test_generate_area():
+    height_map = game_core.HeightMap(16, 4.0, 3, seed=1)
+    height_map.generate_area(game_core.BoundingBox2D(game_core.Point(1.0, 1.0), game_core.Point(3.0, 3.0)))
+
+    # only the nodes that intersect the box are split
+    assert sorted((origin, size) for origin, size, _ in _get_leaves(height_map)) == [
+        ((-4.0, -4.0), 8.0),
+        ((-4.0, 4.0), 8.0),
+        ((1.0, 1.0), 2.0),
+        ((1.0, 3.0), 2.0),
+        ((2.0, 6.0), 4.0),
+        ((3.0, 1.0), 2.0),
+        ((3.0, 3.0), 2.0),
+        ((4.0, -4.0), 8.0),
+        ((6.0, 2.0), 4.0),
+        ((6.0, 6.0), 4.0),
+    ]
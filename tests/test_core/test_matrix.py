@@ -0,0 +1,105 @@
+import numpy
+
+import game_core
+
+
+def _assert_close(matrix, expected):
+    assert numpy.allclose(matrix.tolist(), expected)
+
+
+def test_compose():
+    # each operation is applied before the existing transform
+    matrix = game_core.Matrix()
+    matrix.translate([1.0, 2.0, 3.0])
+    matrix.rotateY(90.0)
+    matrix.scale(2.0)
+
+    expected = game_core.Matrix()
+    expected[0, 0] = 0.0
+    expected[0, 2] = -2.0
+    expected[1, 1] = 2.0
+    expected[2, 0] = 2.0
+    expected[2, 2] = 0.0
+    expected[3, 0] = 1.0
+    expected[3, 1] = 2.0
+    expected[3, 2] = 3.0
+    _assert_close(matrix, expected.tolist())
+
+    point = game_core.Point(1.0, 0.0, 0.0) * matrix
+    assert numpy.allclose(list(point), [1.0, 2.0, 1.0])
+
+    rotation = game_core.Matrix()
+    rotation.rotateY(90.0)
+    composed = game_core.Matrix.from_transform(translation=[1.0, 2.0, 3.0], rotation=rotation, scale=2.0)
+    _assert_close(composed, expected.tolist())
+
+
+def test_inverse():
+    rigid = game_core.Matrix()
+    rigid.rotateX(30.0)
+    rigid.rotateZ(-45.0)
+    rigid.translate([4.0, -2.0, 1.0])
+    _assert_close(rigid.inverse() * rigid, numpy.identity(4))
+
+    affine = rigid.copy()
+    affine.scale([1.0, 2.0, 3.0])
+    _assert_close(affine.inverse() * affine, numpy.identity(4))
+
+    projective = game_core.Matrix(numpy.arange(16.0).reshape(4, 4) + numpy.identity(4) * 10.0)
+    _assert_close(projective.inverse(), numpy.linalg.inv(projective.tolist()))
+
+    # the cached inverse is invalidated when the matrix changes and modifying
+    # the result does not affect the cache
+    inverse = rigid.inverse()
+    inverse[3, 0] = 100.0
+    _assert_close(rigid.inverse() * rigid, numpy.identity(4))
+    rigid[3, 0] = 0.0
+    _assert_close(rigid.inverse() * rigid, numpy.identity(4))
+
+
+def test_as_float32():
+    matrix = game_core.Matrix()
+    matrix.translate([1.0, 2.0, 3.0])
+    data = matrix.as_float32()
+    assert data.dtype == numpy.float32
+    assert data.flags.c_contiguous
+    assert data.tolist() == matrix.tolist()
+    assert matrix.as_float32() is data
+
+    matrix.rotateZ(90.0)
+    assert numpy.allclose(matrix.as_float32(), matrix.tolist())
+
+
+def _build_scene(stack):
+    stack.translate([0.0, 1.0, 0.0])
+    for i in range(5):
+        with stack:
+            stack.rotateY(i * 30.0)
+            stack.translate([float(i), 0.0, 2.0])
+            stack.instance()
+            with stack:
+                stack.rotateX(45.0)
+                stack.scale([1.0, 2.0, 3.0])
+                stack.rotateZ(-10.0 * i)
+                stack.instance()
+    stack.perspective(45.0, 1.5, 0.1, 100.0)
+    stack.instance()
+
+
+def test_batched_matrix_stack():
+    stack = game_core.MatrixStack()
+    _build_scene(stack)
+    expected = stack.evaluate()
+
+    batched = game_core.MatrixStack(batched=True)
+    _build_scene(batched)
+    result = batched.evaluate()
+    assert result.dtype == numpy.float32
+    assert result.shape == (11, 4, 4)
+    assert result.flags.c_contiguous
+    assert numpy.allclose(result, expected, atol=1e-6)
+
+    # instances at the bottom of the stack are the identity
+    batched = game_core.MatrixStack(batched=True)
+    batched.instance()
+    assert batched.evaluate().tolist() == [numpy.identity(4).tolist()]
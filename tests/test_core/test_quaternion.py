@@ -0,0 +1,52 @@
+import math
+
+import numpy
+import pytest
+
+import game_core
+
+
+def test_quaternion():
+    assert list(game_core.Quaternion()) == [0.0, 0.0, 0.0, 1.0]
+    with pytest.raises(ValueError):
+        game_core.Quaternion(1.0, 2.0)
+
+    rx = game_core.Quaternion.from_axis_angle(game_core.Vector(1.0, 0.0, 0.0), math.pi / 2.0)
+    ry = game_core.Quaternion.from_axis_angle(game_core.Vector(0.0, 1.0, 0.0), math.pi / 2.0)
+    v = game_core.Vector(0.0, 0.0, 1.0)
+    assert numpy.allclose(list(rx * v), [0.0, -1.0, 0.0])
+    assert numpy.allclose(list((ry * rx) * v), list(ry * (rx * v)))
+    assert numpy.allclose(list(v * rx.as_matrix()), list(rx * v))
+    assert numpy.allclose((ry * rx).as_matrix().tolist(), (rx.as_matrix() * ry.as_matrix()).tolist())
+
+    q = game_core.Quaternion(rx.as_matrix())
+    assert numpy.allclose(list(q), list(rx))
+
+    axis, angle = rx.get_axis_angle()
+    assert numpy.allclose(list(axis), [1.0, 0.0, 0.0])
+    assert numpy.isclose(angle, math.pi / 2.0)
+
+    half = game_core.Quaternion().slerp(rx, 0.5)
+    assert numpy.isclose(half.get_axis_angle()[1], math.pi / 4.0)
+
+
+def test_quaternion_array():
+    axes = numpy.array([(1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 2.0)])
+    angles = numpy.array([0.5, 1.0, -2.0])
+    quats = game_core.QuaternionArray.from_axis_angle(axes, angles)
+    other = game_core.QuaternionArray.from_axis_angle(axes[::-1], angles)
+    vectors = game_core.VectorArray([(1.0, 2.0, 3.0), (0.0, 0.0, 1.0), (-1.0, 0.5, 0.0)])
+
+    product = quats * other
+    rotated = quats.rotate(vectors)
+    assert isinstance(rotated, game_core.VectorArray)
+    matrices = quats.as_matrices()
+    slerped = quats.slerp(other, numpy.array([0.0, 0.25, 1.0]))
+    for i in range(len(quats)):
+        assert numpy.allclose(list(product[i]), list(quats[i] * other[i]))
+        assert numpy.allclose(list(rotated[i]), list(quats[i] * vectors[i]))
+        assert numpy.allclose(matrices[i], quats[i].as_matrix().tolist())
+        assert numpy.allclose(list(slerped[i]), list(quats[i].slerp(other[i], [0.0, 0.25, 1.0][i])))
+
+    assert numpy.allclose(numpy.asarray(game_core.QuaternionArray.from_matrices(matrices)), numpy.asarray(quats))
+    assert numpy.allclose(quats.nlerp(quats, 0.5).tolist(), quats.tolist())
@@ -1,7 +1,12 @@
+import os
+import shutil
+import tempfile
 import unittest
 
+import numpy
+
 import game_core
-from game_core.abstract_tree import _TreeNodeData
+from game_core.tree_storage import _TreeNodeData
 
 
 class TreeTestCase(unittest.TestCase):
@@ -49,3 +54,416 @@ class TreeTestCase(unittest.TestCase):
         assert self.tree.get_node_from_point(game_core.Point(3.0, 1.0))._data is self.tree._data.children[3].children[1]
         assert self.tree.get_node_from_point(game_core.Point(1.0, 3.0))._data is self.tree._data.children[3].children[2]
         assert self.tree.get_node_from_point(game_core.Point(3.0, 3.0))._data is self.tree._data.children[3].children[3]
+
+    def test_codes(self):
+        tree = self.tree
+        assert tree.point_to_code(game_core.Point(-3.0, -3.0), depth=0) == 0b1
+        assert tree.point_to_code(game_core.Point(3.0, -3.0), depth=1) == 0b101
+        assert tree.point_to_code(game_core.Point(-1.0, 3.0), depth=2) == 0b11011
+        assert tree.point_to_code(game_core.Point(3.5, 3.5)) == 0b1111111
+        assert tree.point_to_code(game_core.Point(4.0, 4.0)) == 0b1111111
+        assert tree.point_to_code(game_core.Point(4.5, 0.0)) is None
+
+        assert tree.code_to_coords(0b11011) == (2, [1, 3])
+        assert tree.coords_to_code([1, 3], 2) == 0b11011
+        assert tree.get_code_origin(0b11011) == game_core.Point(-1.0, 3.0)
+
+        assert tree.code_to_node(0b11011)._data is tree._data.children[2].children[3]
+        assert tree.code_to_node(0b1101100) is None
+        assert tree.get_node_from_code(0b1101100)._data is tree._data.children[2].children[3]
+
+    def test_node_from_code(self):
+        node = self.tree.get_node_from_code(0b11011)
+        assert node.get_code() == 0b11011
+        assert node.index == 3
+        assert node.get_depth() == 2
+        assert node.get_size() == 2.0
+        assert node.get_origin() == game_core.Point(-1.0, 3.0)
+        assert node.parent._data is self.tree._data.children[2]
+        assert node.parent.get_children()[3].get_origin() == node.get_origin()
+
+    def test_code_index(self):
+        tree = self.tree
+        codes = [tree.point_to_code(game_core.Point(x, y)) for x in (-3.5, -0.5, 0.5, 3.5) for y in (-3.5, -0.5, 0.5, 3.5)]
+        expected = [tree.get_node_from_code(code)._data for code in codes]
+        tree.build_code_index()
+        assert len(tree._code_index) == 21
+        assert [tree.get_node_from_code(code)._data for code in codes] == expected
+
+        # splitting keeps the index up to date
+        node = tree.get_node_from_code(codes[0])
+        node.split()
+        assert len(tree._code_index) == 25
+        assert tree.get_node_from_code(codes[0])._data is node._data.children[0]
+
+    def test_get_nodes_from_points(self):
+        tree = self.tree
+        points = [
+            (0.0, 0.0),
+            (2.0, -2.0),
+            (-1.0, 3.0),
+            (3.5, 3.5),
+            (4.0, -4.0),
+            (4.5, 0.0),
+        ]
+        handles, values = tree.get_nodes_from_points(numpy.array(points))
+        assert handles[0] is tree._data
+        assert handles[1] is tree._data.children[1]
+        assert list(values[2:5]) == [11, 15, 5]
+        assert handles[5] is None and values[5] is None
+
+        for point, handle in zip(points[:5], handles[:5]):
+            assert tree.get_node_from_point(game_core.Point(*point))._data is handle
+
+        handles, values = tree.get_nodes_from_points(numpy.array(points[2:4]), max_depth=1)
+        assert handles[0] is tree._data.children[2]
+        assert handles[1] is tree._data.children[3]
+
+    def test_iter_nodes(self):
+        tree = self.tree
+        infos = list(tree.iter_nodes())
+        assert len(infos) == 21
+        assert infos[0].code == 1 and infos[0].origin == (0.0, 0.0) and infos[0].size == 8.0
+        assert not infos[0].is_leaf
+        for info in infos:
+            node = tree.code_to_node(info.code)
+            assert node._data is info.handle
+            assert node.get_value() == info.value
+            assert node.get_depth() == info.depth
+            assert node.get_size() == info.size
+            assert tuple(node.get_origin())[:2] == info.origin
+
+        leaves = list(tree.iter_leaves())
+        assert [info.value for info in leaves] == list(range(16))
+        assert all(info.is_leaf and info.depth == 2 for info in leaves)
+        assert [info.code for info in tree.iter_leaves(max_depth=1)] == [0b100, 0b101, 0b110, 0b111]
+
+        bbox = game_core.BoundingBox2D(game_core.Point(-1.5, 0.5), game_core.Point(-0.5, 1.5))
+        assert [info.value for info in tree.iter_leaves(bbox=bbox)] == [9]
+        bbox = game_core.BoundingBox2D(game_core.Point(-2.0, 0.0), game_core.Point(0.0, 2.0))
+        assert [info.value for info in tree.iter_leaves(bbox=bbox)] == [2, 3, 6, 8, 9, 10, 11, 12, 14]
+
+        # splitting a yielded leaf visits its new children
+        visited = []
+        for info in tree.iter_nodes():
+            visited.append(info.code)
+            if info.code == 0b10000:
+                tree.code_to_node(info.code).split()
+        assert visited[visited.index(0b10000) + 1] == 0b1000000
+        assert len(visited) == 25
+
+    def test_query_box(self):
+        tree = self.tree
+        bbox = game_core.BoundingBox2D(game_core.Point(-2.0, 0.0), game_core.Point(0.0, 2.0))
+        assert [info.value for info in tree.query_box(bbox)] == [2, 3, 6, 8, 9, 10, 11, 12, 14]
+        assert [info.value for info in tree.query_box(bbox, inclusive=[])] == [9]
+        assert [info.value for info in tree.query_box(bbox, inclusive=[0])] == [8, 9, 12]
+
+        bbox = game_core.BoundingBox2D(game_core.Point(-4.0, -4.0), game_core.Point(0.5, 0.5))
+        infos = tree.query_box(bbox, inclusive=[], whole_subtrees=True)
+        assert [info.code for info in infos] == [0b100, 0b10100, 0b10110, 0b11000, 0b11001, 0b11100]
+        assert not infos[0].is_leaf
+
+    def test_query_box_extents(self):
+        tree = self.tree
+        bbox = game_core.BoundingBox2D(game_core.Point(-2.0, 0.0), game_core.Point(0.0, 2.0))
+        mins, maxs = tree.query_box_extents(bbox)
+        assert len(mins) == 9
+        mins, maxs = tree.query_box_extents(bbox, inclusive=[])
+        assert mins.tolist() == [[-2.0, 0.0]]
+        assert maxs.tolist() == [[0.0, 2.0]]
+        mins, maxs = tree.query_box_extents(bbox, predicate=lambda values: values % 2 == 0, inclusive=[0])
+        assert sorted(mins.tolist()) == [[-4.0, 0.0], [0.0, 0.0]]
+
+    def test_query_sphere(self):
+        tree = self.tree
+        assert [info.value for info in tree.query_sphere(game_core.Point(-3.0, -3.0), 0.5)] == [0]
+        assert [info.value for info in tree.query_sphere(game_core.Point(), 1.0)] == [3, 6, 9, 12]
+        assert [info.code for info in tree.query_sphere(game_core.Point(), 10.0, whole_subtrees=True)] == [1]
+
+    def test_query_frustum(self):
+        tree = self.tree
+        # 1 <= x <= 3 and -1 <= y <= 1
+        planes = [(1.0, 0.0, -1.0), (-1.0, 0.0, 3.0), (0.0, 1.0, 1.0), (0.0, -1.0, 1.0)]
+        assert [info.value for info in tree.query_frustum(planes)] == [6, 7, 12, 13]
+
+    def test_cast_ray(self):
+        tree = self.tree
+        hit = tree.cast_ray((-5.0, -3.0), (2.0, 0.0))
+        assert hit.info.value == 1
+        assert hit.point == (-2.0, -3.0)
+        assert hit.normal == (-1.0, 0.0)
+        assert hit.distance == 3.0
+        assert tree.cast_ray((-5.0, -3.0), (1.0, 0.0), max_distance=2.5) is None
+        assert tree.cast_ray((-5.0, -3.0), (1.0, 0.0), predicate=lambda value: value >= 6) is None
+        assert tree.cast_ray((-5.0, -3.0), (-1.0, 0.0)) is None
+
+        # rays that start inside of a leaf hit it immediately
+        hit = tree.cast_ray((-1.0, -3.0), (1.0, 0.0))
+        assert hit.info.value == 1
+        assert hit.normal == (0.0, 0.0)
+        assert hit.distance == 0.0
+
+        hit = tree.cast_ray((3.0, 5.0), (0.0, -1.0), predicate=lambda value: value < 13)
+        assert hit.info.value == 7
+        assert hit.normal == (0.0, 1.0)
+        assert hit.distance == 5.0
+
+    def test_cast_rays(self):
+        origins = numpy.array([(-5.0, -3.0), (-5.0, -3.0), (-1.0, -3.0), (3.0, 5.0)])
+        directions = numpy.array([(2.0, 0.0), (-1.0, 0.0), (1.0, 0.0), (0.0, -1.0)])
+        distances, normals, _ = self.tree.cast_rays(origins, directions)
+        assert list(distances) == [3.0, numpy.inf, 0.0, 1.0]
+        assert normals.tolist() == [[-1.0, 0.0], [0.0, 0.0], [0.0, 0.0], [0.0, 1.0]]
+
+    def test_neighbors(self):
+        tree = self.tree
+        tree._data.children[3].children[0].children = [_TreeNodeData(value=i) for i in range(16, 20)]
+
+        node = tree.get_node_from_code(0b11011)  # value 11
+        assert tree.get_neighbor_code(0b11011, (1, 0)) == 0b11110
+        assert tree.get_neighbor_code(0b11011, (0, 1)) is None
+        assert node.get_neighbor(0, negative=True).get_value() == 10
+        assert node.get_neighbor(0, negative=False).get_value() == 14
+        assert node.get_neighbor(1, negative=True).get_value() == 9
+        assert node.get_neighbor(1, negative=False) is None
+        assert [n.get_value() if n else None for n in node.get_neighbors()] == [10, 14, 9, None]
+
+        # same-or-larger neighbors of a deeper node and its diagonals
+        node = tree.get_node_from_code(0b1110000)  # value 16
+        assert [n.get_value() if n else None for n in node.get_neighbors()] == [9, 17, 6, 18]
+        diagonals = node.get_diagonal_neighbors()
+        assert len(diagonals) == 8
+        assert diagonals[:4] == node.get_neighbors()
+        assert diagonals[tree.neighbor_directions.index((-1, -1))].get_value() == 3
+        assert diagonals[tree.neighbor_directions.index((1, 1))].get_value() == 19
+        assert node.get_neighbor_in_direction((-1, 0)) == tree.get_node_from_code(0b11001)
+        assert tree.get_root().get_neighbors() is None
+
+    def test_leaf_neighbors(self):
+        tree = self.tree
+        leaves, handles, indexes = tree.get_leaf_neighbors()
+        assert handles.shape == indexes.shape == (16, 4)
+        assert [leaf.value for leaf in leaves] == list(range(16))
+        # leaf 11 has neighbors 10 (-x), 14 (+x), 9 (-y) and nothing in +y
+        assert list(handles[11]) == [leaves[10].handle, leaves[14].handle, leaves[9].handle, None]
+        assert list(indexes[11]) == [10, 14, 9, -1]
+
+        # the same leaves found a level at a time
+        tree.get_node_from_code(0b110).merge()
+        leaves = list(tree.iter_leaves())
+        handles, cells, depths = tree._get_leaf_arrays()
+        assert list(handles) == [leaves[8].handle] + [leaf.handle for leaf in leaves[:8] + leaves[9:]]
+        expected_cells, expected_depths = tree._get_leaf_cells([leaves[8]] + leaves[:8] + leaves[9:])
+        assert (cells == expected_cells).all()
+        assert (depths == expected_depths).all()
+
+    def test_merge(self):
+        tree = self.tree
+        tree.build_code_index()
+        node = tree.get_node_from_code(0b110)
+        assert len(node.get_children()) == 4
+        node.merge()
+        assert node.is_leaf()
+        assert not node.get_children()
+        assert tree.get_node_from_point(game_core.Point(-3.0, 3.0))._data is tree._data.children[2]
+        assert len(tree._code_index) == 17
+
+    def test_compact(self):
+        tree = self.tree
+        for child in tree._data.children[1].children:
+            child.value = 1
+        for child in tree._data.children[3].children:
+            child.value = 1
+        assert tree.compact() == 2
+        assert tree._data.children[1].children is None
+        assert tree._data.children[1].value == 1
+        assert tree._data.children[3].children is None
+
+        for child in tree._data.children[0].children + tree._data.children[2].children:
+            child.value = 1
+        assert tree.compact() == 3
+        assert tree._data.children is None
+        assert tree._data.value == 1
+
+    def test_auto_compact(self):
+        tree = game_core.QuadTree(8, 3, auto_compact=True)
+        root = tree.get_root()
+        root.split()
+        root.get_children()[0].split()
+        for child in tree.get_node_from_code(0b100).get_children()[:3]:
+            child.set_value(1)
+        assert not tree.get_root().is_leaf()
+        tree.get_node_from_code(0b10011).set_value(1)
+        assert tree.get_node_from_code(0b100).is_leaf()
+        assert tree.get_node_from_code(0b100).get_value() == 1
+
+        for code in (0b101, 0b110, 0b111):
+            tree.get_node_from_code(code).set_value(1)
+        assert tree.get_root().is_leaf()
+        assert tree.get_root().get_value() == 1
+
+    def test_cache_invalidation(self):
+        tree = game_core.QuadTree(8, 3)
+        root = tree.get_root()
+        root.split()
+        assert len(root.get_children()) == 4
+        bottom_left, bottom_right = root.get_children()[:2]
+        bottom_left.split()
+        inner = bottom_left.get_children()[1]  # touches bottom_right
+        far = bottom_left.get_children()[0]
+        assert inner.get_neighbors()[1] == bottom_right
+        far_neighbors = far.get_neighbors()
+
+        generation = tree.generation
+        bottom_right.split()
+        assert tree.generation > generation
+        assert inner.get_neighbors()[1] == tree.code_to_node(0b10100)
+        assert far.get_neighbors() is far_neighbors
+        assert bottom_right.get_children()
+
+        bottom_right.merge()
+        assert inner.get_neighbors()[1] == bottom_right
+        assert not bottom_right.get_children()
+
+        root.merge()
+        assert not root.get_children()
+
+    def test_change_tracker(self):
+        tree = game_core.QuadTree(8, 3)
+        changes = []
+        tree.add_change_listener(lambda code, structural: changes.append((code, structural)))
+        tracker = game_core.TreeChangeTracker(tree)
+        root = tree.get_root()
+        root.split()
+        root.get_children()[3].split()
+        root.get_children()[3].get_children()[0].set_value(1)
+        root.get_children()[2].set_value(2)
+        assert changes == [(0b1, True), (0b111, True), (0b11100, False), (0b110, False)]
+        assert tracker.pop_dirty_codes() == [0b1]
+        assert not tracker.is_dirty()
+
+        root.get_children()[3].get_children()[0].set_value(2)
+        root.get_children()[2].set_value(1)
+        assert tracker.pop_dirty_codes() == [0b110, 0b11100]
+        tracker.close()
+        root.get_children()[2].set_value(2)
+        assert not tracker.is_dirty()
+
+        del changes[:]
+        root.get_children()[3].get_children()[0].set_value(None)
+        tree.compact()
+        assert changes[-1] == (0b111, True)
+
+class ArrayStorageTreeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tree = game_core.QuadTree(8, 3, storage_cls=game_core.ArrayTreeStorage)
+        root = self.tree.get_root()
+        root.split()
+        for i, child in enumerate(root.get_children()):
+            child.split()
+            for j, grandchild in enumerate(child.get_children()):
+                grandchild.set_value(i * 4 + j)
+
+    def test_storage(self):
+        storage = self.tree._storage
+        assert isinstance(storage, game_core.ArrayTreeStorage)
+        assert storage.num_nodes == 21
+        assert storage.nbytes < 21 * 16
+        assert self.tree.get_root().is_branch()
+        assert list(storage.get_children(self.tree._data)) == [1, 2, 3, 4]
+
+    def test_get_node(self):
+        assert self.tree.get_node_from_point(game_core.Point())._data == self.tree._data
+        assert self.tree.get_node_from_point(game_core.Point(-3.0, -3.0)).get_value() == 0
+        assert self.tree.get_node_from_point(game_core.Point(3.0, -3.0)).get_value() == 5
+        assert self.tree.get_node_from_point(game_core.Point(-1.0, 3.0)).get_value() == 11
+        assert self.tree.get_node_from_point(game_core.Point(3.0, 3.0)).get_value() == 15
+
+    def test_get_nodes_from_points(self):
+        points = numpy.array([(0.0, 0.0, 0.0), (-3.0, -3.0, 0.0), (3.0, -3.0, 0.0), (-1.0, 3.0, 0.0), (9.0, 0.0, 0.0)])
+        handles, values = self.tree.get_nodes_from_points(points)
+        assert handles[0] == self.tree._data
+        assert handles[4] == self.tree._storage.NULL
+        assert list(values[1:4]) == [0, 5, 11]
+
+    def test_cast_rays(self):
+        origins = numpy.array([(-5.0, -3.0), (3.0, 5.0), (3.0, 5.0)])
+        directions = numpy.array([(1.0, 0.0), (0.0, -1.0), (0.0, 1.0)])
+        distances, normals, handles = self.tree.cast_rays(origins, directions, max_distances=[4.0, 4.0, 4.0])
+        assert list(distances) == [3.0, 1.0, numpy.inf]
+        assert list(self.tree._storage.get_value_batch(handles[:2])) == [1, 15]
+        assert handles[2] == self.tree._storage.NULL
+        hit = self.tree.cast_ray((3.0, 5.0), (0.0, -1.0))
+        assert hit.info.handle == handles[1]
+
+    def test_growth(self):
+        storage = game_core.ArrayTreeStorage(8, lambda: 0, dtype='uint8', capacity=2)
+        root = storage.create_root()
+        storage.split(root)
+        storage.split(storage.get_child(root, 7))
+        assert storage.num_nodes == 17
+        assert len(storage.values) >= 17
+        assert storage.get_value(storage.get_child(root, 7)) == 0
+        assert storage.is_leaf(storage.get_child(root, 0))
+        assert not storage.is_leaf(storage.get_child(root, 7))
+
+    def test_merge_and_defragment(self):
+        storage = self.tree._storage
+        node = self.tree.get_node_from_code(0b101)
+        node.merge()
+        assert storage.num_nodes == 21
+        assert storage.nbytes == 17 * (storage.values.itemsize + 4)
+
+        # merged blocks are reused
+        node.split()
+        assert storage.num_nodes == 21
+
+        node.merge()
+        self.tree.compact()
+        assert storage.num_nodes == 17
+        assert len(storage.values) == 17
+        assert self.tree.get_node_from_point(game_core.Point(3.0, 3.0)).get_value() == 15
+        assert self.tree.get_node_from_point(game_core.Point(3.0, -3.0)).is_leaf()
+
+    def test_load_level_order(self):
+        # root, its 4 children and then their 16 children
+        is_branch = numpy.array([True] * 5 + [False] * 16)
+        values = [-1] * 5 + range(16)
+        expected_leaves = [(info.code, info.value) for info in self.tree.iter_leaves()]
+        for storage_cls in (None, game_core.ArrayTreeStorage):
+            tree = game_core.QuadTree(8, 3, storage_cls=storage_cls)
+            changes = []
+            tree.add_change_listener(lambda code, structural: changes.append((code, structural)))
+            tree.load_level_order(is_branch, values)
+            assert changes == [(1, True)]
+            assert [(info.code, info.value) for info in tree.iter_leaves()] == expected_leaves
+            assert tree.get_node_from_point(game_core.Point(3.0, -3.0)).get_value() == 5
+
+    def test_save_and_load(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'tree.bin')
+            # branch values are None which can not be packed
+            self.assertRaises(TypeError, self.tree.save, path)
+
+            for node in [self.tree.get_root()] + list(self.tree.get_root().get_children()):
+                node.set_value(-1)
+            self.tree.save(path)
+            points = numpy.array([(-3.0, -3.0, 0.0), (3.0, -3.0, 0.0), (-1.0, 3.0, 0.0), (0.0, 0.0, 0.0)])
+            expected_leaves = [(info.code, info.value) for info in self.tree.iter_leaves()]
+
+            for storage_cls in (None, game_core.ArrayTreeStorage):
+                for mmap in (False, True):
+                    tree = game_core.QuadTree(8, 3, storage_cls=storage_cls)
+                    tree.load(path, mmap=mmap)
+                    assert [(info.code, info.value) for info in tree.iter_leaves()] == expected_leaves
+                    assert list(tree.get_nodes_from_points(points)[1]) == [0, 5, 11, -1]
+                    assert tree.get_node_from_code(0b11111).get_value() == 15
+                    assert tree.get_node_from_code(0b110).get_neighbors()[1].get_value() == -1
+
+            self.assertRaises(RuntimeError, tree.get_root().split)
+            self.assertRaises(ValueError, game_core.QuadTree(8, 4).load, path)
+            self.assertRaises(ValueError, game_core.Octree(8, 3).load, path)
+        finally:
+            shutil.rmtree(temp_dir)
@@ -0,0 +1,50 @@
+import numpy
+
+import game_core
+
+
+def test_vector_array_math():
+    vectors = game_core.VectorArray([(1.0, 0.0, 0.0), (0.0, 2.0, 0.0), (3.0, 4.0, 0.0)])
+    assert len(vectors) == 3
+    assert isinstance(vectors[1], game_core.Vector)
+    assert vectors[1] == game_core.Vector(0.0, 2.0, 0.0)
+    assert list(vectors.length()) == [1.0, 2.0, 5.0]
+    assert (vectors + game_core.Vector(1.0, 1.0, 1.0)).tolist()[2] == [4.0, 5.0, 1.0]
+    assert (game_core.Vector(1.0, 1.0, 1.0) - vectors).tolist()[2] == [-2.0, -3.0, 1.0]
+    assert (vectors * numpy.array([[2.0], [1.0], [0.5]])).tolist() == [[2.0, 0.0, 0.0], [0.0, 2.0, 0.0], [1.5, 2.0, 0.0]]
+    assert list(vectors.dot(game_core.Vector(0.0, 1.0, 0.0))) == [0.0, 2.0, 4.0]
+    assert (vectors ^ game_core.Vector(0.0, 0.0, 1.0))[0] == game_core.Vector(0.0, -1.0, 0.0)
+    assert numpy.allclose(vectors.normal().length(), 1.0)
+
+    vectors[0] = (0.0, 0.0, 0.0)
+    vectors.normalize()
+    assert vectors[0] == game_core.Vector()
+
+
+def test_point_array_transform():
+    matrix = game_core.Matrix()
+    matrix[3, 0] = 10.0
+    points = game_core.PointArray([(1.0, 2.0, 3.0), (0.0, 0.0, 0.0)])
+    vectors = game_core.VectorArray(numpy.asarray(points))
+    assert (points * matrix).tolist() == [[11.0, 2.0, 3.0], [10.0, 0.0, 0.0]]
+    assert (vectors * matrix).tolist() == [[1.0, 2.0, 3.0], [0.0, 0.0, 0.0]]
+    assert (points * matrix)[0] == game_core.Point(1.0, 2.0, 3.0) * matrix
+    assert list(points.distance(game_core.Point(1.0, 2.0, 3.0))) == [0.0, game_core.Point().distance((1.0, 2.0, 3.0))]
+
+
+def test_in_place_math():
+    pool = game_core.VectorPool(game_core.Vector, size=1)
+    a = game_core.Vector(1.0, 2.0, 3.0)
+    out = pool.get()
+    assert a.add_into((1.0, 1.0, 1.0), out) is out
+    assert out == game_core.Vector(2.0, 3.0, 4.0)
+    assert a.sub_into(out, pool.get()) == game_core.Vector(-1.0, -1.0, -1.0)
+    assert a.scale_into(2.0, out) == game_core.Vector(2.0, 4.0, 6.0)
+    assert a.madd(out, 0.5) is a
+    assert a == game_core.Vector(2.0, 4.0, 6.0)
+
+    vectors = list(pool._vectors)
+    pool.reset()
+    assert pool.get() is vectors[0]
+    assert pool.get(1.0) == game_core.Vector(1.0, 0.0, 0.0)
+    assert pool._vectors == vectors
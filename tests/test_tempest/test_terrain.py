@@ -0,0 +1,95 @@
+import numpy
+
+from tempest.game import terrain
+
+
+def test_generate_height_map():
+    # the heights that the per point implementation seeded through the
+    # random module generated
+    expected = numpy.array([
+        [0.0, -0.055249210310316155, 0.17395936702142206, 0.30072576058499945],
+        [-0.04249354028838878, 0.3007707663791164, 0.07943224909558333, 0.31491728383643636],
+        [-0.2592817620953434, 0.3054711365331269, 0.46645353569213877, 0.0988328786315062],
+        [0.07618557139139236, 0.1363965716840289, 0.29737634762584175, 0.18106452589854688],
+    ])
+    values = terrain.generate_height_map(4, seed=1234)
+    assert values.shape == (4, 4)
+    assert (values == expected).all()
+
+    values = terrain.generate_height_map(64, seed=1234)
+    assert (terrain.generate_height_map(64, seed=1234) == values).all()
+    assert not (terrain.generate_height_map(64, seed=1235) == values).all()
+
+
+def test_tiled_height_map_edges(monkeypatch):
+    # record the edges that each tile is generated against
+    edges = {}
+    get_edge = terrain.TiledHeightMap._get_edge
+
+    def record_edge(self, kind, x, z, start, end):
+        result = get_edge(self, kind, x, z, start, end)
+        edges.setdefault((kind, x, z), []).append(result)
+        return result
+
+    monkeypatch.setattr(terrain.TiledHeightMap, '_get_edge', record_edge)
+
+    size = 16
+    tiles = terrain.TiledHeightMap(size, seed=3)
+    tile = tiles.get_tile(0, 0)
+    x_neighbor = tiles.get_tile(1, 0)
+    z_neighbor = tiles.get_tile(0, 1)
+    diagonal = tiles.get_tile(1, 1)
+
+    # both tiles along an edge are generated against the same samples. The
+    # last row and column of a tile's samples belong to the next tiles
+    for key in [(terrain.TiledHeightMap._Z_EDGE, 1, 0), (terrain.TiledHeightMap._X_EDGE, 0, 1)]:
+        assert len(edges[key]) == 2
+        assert (edges[key][0] == edges[key][1]).all()
+    z_edge = edges[terrain.TiledHeightMap._Z_EDGE, 1, 0][0]
+    x_edge = edges[terrain.TiledHeightMap._X_EDGE, 0, 1][0]
+    assert (x_neighbor[0, :] == z_edge[:-1]).all()
+    assert (z_neighbor[:, 0] == x_edge[:-1]).all()
+    assert diagonal[0, 0] == z_edge[-1] == x_edge[-1]
+
+    # neighbors line up no matter which tile is generated first
+    other = terrain.TiledHeightMap(size, seed=3)
+    assert (other.get_tile(1, 0) == x_neighbor).all()
+    assert (other.get_tile(0, 0) == tile).all()
+
+    region = tiles.get_region(-4, 8, 24, 12)
+    assert region.shape == (24, 12)
+    assert (region[:4, :8] == tiles.get_tile(-1, 0)[12:, 8:]).all()
+    assert (region[4:20, :8] == tile[:, 8:]).all()
+    assert (region[20:, :8] == x_neighbor[:4, 8:]).all()
+    assert (region[4:20, 8:] == z_neighbor[:, :4]).all()
+    assert (region[20:, 8:] == diagonal[:4, :4]).all()
+
+
+def test_tiled_height_map_seed():
+    tile = terrain.TiledHeightMap(16, seed=3).get_tile(2, -1)
+    assert (terrain.TiledHeightMap(16, seed=3).get_tile(2, -1) == tile).all()
+    assert not (terrain.TiledHeightMap(16, seed=4).get_tile(2, -1) == tile).all()
+    assert not (terrain.TiledHeightMap(16, seed=3).get_tile(-1, 2) == tile).all()
+
+
+def test_tiled_height_map_cache():
+    tiles = terrain.TiledHeightMap(8, max_cached_tiles=2)
+    first = tiles.get_tile(0, 0)
+    assert not first.flags.writeable
+    second = tiles.get_tile(1, 0)
+    assert tiles.get_tile(0, 0) is first
+
+    # the least recently used tile is evicted and regenerated when needed
+    tiles.get_tile(2, 0)
+    assert list(tiles._tiles) == [(0, 0), (2, 0)]
+    assert tiles.get_tile(0, 0) is first
+    regenerated = tiles.get_tile(1, 0)
+    assert regenerated is not second
+    assert (regenerated == second).all()
+    assert list(tiles._tiles) == [(0, 0), (1, 0)]
+
+    # caching can be turned off
+    tiles = terrain.TiledHeightMap(8, max_cached_tiles=0)
+    assert (tiles.get_tile(0, 0) == first).all()
+    assert (tiles.get_tile(0, 0) == first).all()
+    assert not tiles._tiles
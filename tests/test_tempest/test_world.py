@@ -0,0 +1,345 @@
+import os
+
+import numpy
+
+import game_core
+from tempest.game import blocks
+from tempest.game import game
+from tempest.game import world
+
+
+class _Game(object):
+    """ The parts of `Game` that a `World` uses
+    """
+    def __init__(self):
+        self.block_ids_to_cls = []
+        current_id = 0
+        for cls in blocks._BLOCKS:
+            next_id = cls.register(current_id)
+            self.block_ids_to_cls.extend([cls] * (next_id - current_id))
+            current_id = next_id
+
+    def get_block_cls(self, id):
+        return self.block_ids_to_cls[id]
+
+
+def _create_world(monkeypatch, size, heights=None, cache_path=None):
+    """ Create a world without uploading its mesh
+
+    Args:
+        heights (Optional[numpy.ndarray]): the height map to generate the
+            world from instead of a random one
+    """
+    monkeypatch.setattr(game_core, 'Mesh', lambda *args: None)
+    if heights is not None:
+        monkeypatch.setattr(world.World, '_generate_height_map', lambda self: heights)
+    return world.World(_Game(), size, cache_path=cache_path)
+
+
+def _create_pillar_world(monkeypatch):
+    """ Create an 8 unit world with flat ground at y=0 and a pillar on top
+    of it from (2, 0, 2) to (3, 2, 3)
+    """
+    heights = numpy.zeros((8, 8))
+    heights[6, 6] = 2.0
+    return _create_world(monkeypatch, 8, heights=heights)
+
+
+def _get_leaves(w):
+    return [(info.origin, info.size, info.value) for info in w.iter_leaves()]
+
+
+def _set_block(w, point, value):
+    """ Split the leaf containing a point down to a single block and set the
+    block's value
+    """
+    node = w.get_node_from_point(point)
+    while node.get_depth() < w.max_depth:
+        node.split()
+        node = w.get_node_from_point(point)
+    node.set_value(value)
+
+
+def _get_cell_centers(w):
+    num_cells = 1 << w.max_depth
+    return (numpy.arange(num_cells) + 0.5) * (w.size / num_cells) - w.size / 2.0
+
+
+def _get_solid_cells(w):
+    """ Get whether the block at the center of each cell is solid as an
+    array indexed by x, y and z cell
+    """
+    centers = _get_cell_centers(w)
+    points = numpy.stack(numpy.meshgrid(centers, centers, centers, indexing='ij'), axis=-1)
+    ids = w.get_block_ids(points.reshape(-1, 3)).reshape(points.shape[:3])
+    return w._get_solid_ids()[ids]
+
+
+def _get_column_heights(w):
+    """ Get the height of each column of cells from the blocks at the
+    centers of its cells.  -inf for columns without solid blocks
+    """
+    tops = _get_cell_centers(w) + w.min_size / 2.0
+    return numpy.where(_get_solid_cells(w), tops[:, numpy.newaxis], -numpy.inf).max(axis=1)
+
+
+def _merge(squares):
+    """ Merge (key, u, v) squares and get the sorted (key, u_min, u_max,
+    v_min, v_max) rectangles
+    """
+    keys, u, v = (numpy.array(column) for column in zip(*squares))
+    return sorted(zip(*[column.tolist() for column in world._merge_squares(keys, u, v)]))
+
+
+def test_get_run_starts():
+    positions = numpy.array([0, 1, 2, 4, 5, 5, 6])
+    keys = numpy.array([0, 0, 0, 0, 0, 1, 1])
+    assert list(world._get_run_starts(positions, (keys, ))) == [True, False, False, True, False, True, False]
+
+
+def test_merge_squares():
+    # a 2x2 square
+    assert _merge([(0, 1, 1), (0, 0, 0), (0, 1, 0), (0, 0, 1)]) == [(0, 0, 2, 0, 2)]
+
+    # an L: a row of 3 with a square on top of its first square
+    assert _merge([(0, 0, 0), (0, 1, 0), (0, 2, 0), (0, 0, 1)]) == [(0, 0, 1, 1, 2), (0, 0, 3, 0, 1)]
+
+    # gaps within a row
+    assert _merge([(0, 0, 0), (0, 1, 0), (0, 3, 0)]) == [(0, 0, 2, 0, 1), (0, 3, 4, 0, 1)]
+
+    # rows with different ranges or that aren't consecutive don't stack
+    assert _merge([(0, 0, 0), (0, 1, 0), (0, 1, 1), (0, 2, 1)]) == [(0, 0, 2, 0, 1), (0, 1, 3, 1, 2)]
+    assert _merge([(0, 0, 0), (0, 0, 2)]) == [(0, 0, 1, 0, 1), (0, 0, 1, 2, 3)]
+
+    # squares with different keys don't merge
+    assert _merge([(0, 0, 0), (1, 1, 0), (1, 1, 1)]) == [(0, 0, 1, 0, 1), (1, 1, 2, 0, 2)]
+
+
+def test_generate_mesh(monkeypatch):
+    meshes = []
+    monkeypatch.setattr(game_core, 'Mesh', lambda *args: meshes.append(args))
+    w = world.World(_Game(), 2)
+
+    # two solid blocks next to each other along x in an otherwise empty world
+    is_branch = numpy.array([True] + [False] * 8)
+    values = numpy.zeros(9, dtype=w.VALUE_DTYPE)
+    values[1:3] = 1
+    w.load_level_order(is_branch, values)
+    w._generate_mesh()
+    verts, normals, indices, _ = meshes[-1]
+    quads = verts.reshape(-1, 4, 3)
+    quad_normals = normals.reshape(-1, 4, 3)[:, 0]
+
+    # the faces between the blocks are culled, the 4 sides are merged
+    # across both blocks and the ends are left
+    assert len(quads) == 6
+    assert indices.size == 6 * 6
+    assert not (quads[:, :, 0] == 0.0).all(axis=1).any()
+    ends = quad_normals[:, 0] != 0.0
+    assert sorted(quads[ends, 0, 0] * quad_normals[ends, 0]) == [1.0, 1.0]
+    sides = quads[~ends]
+    assert ((sides.max(axis=1) - sides.min(axis=1)).max(axis=1) == 2.0).all()
+
+
+def test_world_cache(monkeypatch, tmpdir):
+    monkeypatch.setenv('HOME', str(tmpdir))
+    path = game.Game.get_world_cache_path(8)
+    assert path.startswith(str(tmpdir))
+    assert path != game.Game.get_world_cache_path(16)
+    assert os.path.isdir(os.path.dirname(path))
+
+    generated = []
+    generate = world.World._generate
+    monkeypatch.setattr(world.World, '_generate', lambda self: generated.append(self.size) or generate(self))
+
+    # the first world saves its blocks and the next one loads them
+    first = _create_world(monkeypatch, 8, cache_path=path)
+    assert os.path.exists(path)
+    second = _create_world(monkeypatch, 8, cache_path=path)
+    assert generated == [8]
+    assert isinstance(second._storage, game_core.ArrayTreeStorage)
+    assert _get_leaves(second) == _get_leaves(first)
+    assert (second._heights == first._heights).all()
+
+    # the loaded world can still be edited
+    second.get_node_from_point(game_core.Point(3.5, 3.5, 3.5)).set_value(1)
+    assert second.get_node_from_point(game_core.Point(3.5, 3.5, 3.5)).get_value() == 1
+    assert second.get_height(3.5, 3.5) == 4.0
+
+    # files from worlds of other sizes and corrupt files are replaced
+    _create_world(monkeypatch, 4, cache_path=path)
+    assert generated == [8, 4]
+    assert game_core.tree_io.read_header(path).size == 4.0
+    with open(path, 'wb') as f:
+        f.write('not a tree')
+    w = _create_world(monkeypatch, 8, cache_path=path)
+    assert generated == [8, 4, 8]
+    assert _get_leaves(w) == _get_leaves(first)
+    assert game_core.tree_io.read_header(path).size == 8.0
+
+
+def test_raycast(monkeypatch):
+    w = _create_pillar_world(monkeypatch)
+    hit = w.raycast(game_core.Point(0.5, 3.5, 0.5), game_core.Vector(0.0, -1.0, 0.0))
+    assert isinstance(hit.block, blocks.Rock)
+    assert hit.block == w.get_block(game_core.Point(0.5, -0.5, 0.5))
+    assert hit.point == (0.5, 0.0, 0.5)
+    assert hit.normal == (0.0, 1.0, 0.0)
+    assert hit.distance == 3.5
+
+    # directions don't need to be normalized
+    hit = w.raycast(game_core.Point(-0.5, 1.5, 2.5), game_core.Vector(2.0, 0.0, 0.0))
+    assert hit.block == w.get_block(game_core.Point(2.5, 1.5, 2.5))
+    assert hit.point == (2.0, 1.5, 2.5)
+    assert hit.normal == (-1.0, 0.0, 0.0)
+    assert hit.distance == 2.5
+
+    # misses
+    assert w.raycast(game_core.Point(-0.5, 1.5, 2.5), game_core.Vector(-1.0, 0.0, 0.0)) is None
+    assert w.raycast(game_core.Point(-0.5, 1.5, 2.5), game_core.Vector(1.0, 0.0, 0.0), max_distance=2.0) is None
+    assert w.raycast(game_core.Point(0.5, 3.5, 0.5), game_core.Vector(0.0, 1.0, 0.0)) is None
+
+    # excluded blocks are passed through
+    assert w.raycast(
+        game_core.Point(0.5, 3.5, 0.5), game_core.Vector(0.0, -1.0, 0.0),
+        exclude_types=[blocks.Air, blocks.Rock]) is None
+    hit = w.raycast(game_core.Point(0.5, 3.5, 0.5), game_core.Vector(0.0, -1.0, 0.0), exclude_types=[])
+    assert isinstance(hit.block, blocks.Air)
+    assert hit.normal == (0.0, 0.0, 0.0)
+    assert hit.distance == 0.0
+
+
+def test_raycast_batch(monkeypatch):
+    w = _create_pillar_world(monkeypatch)
+    origins = numpy.array([(0.5, 3.5, 0.5), (-0.5, 1.5, 2.5), (-0.5, 1.5, 2.5), (-0.5, 1.5, 2.5), (0.5, 3.5, 0.5)])
+    directions = numpy.array([(0.0, -1.0, 0.0), (2.0, 0.0, 0.0), (-1.0, 0.0, 0.0), (1.0, 0.0, 0.0), (0.0, 1.0, 0.0)])
+    max_distances = numpy.array([10.0, 10.0, 10.0, 2.0, 10.0])
+    for exclude_types in (None, [blocks.Air, blocks.Rock], []):
+        ids, distances, normals = w.raycast_batch(origins, directions, max_distances, exclude_types=exclude_types)
+        for i, (origin, direction) in enumerate(zip(origins, directions)):
+            hit = w.raycast(
+                game_core.Point(*origin), game_core.Vector(*direction), max_distances[i], exclude_types=exclude_types)
+            if hit is None:
+                assert ids[i] == 0
+                assert distances[i] == numpy.inf
+            else:
+                assert w.game.get_block_cls(ids[i]) is type(hit.block)
+                assert distances[i] == hit.distance
+                assert hit.normal == tuple(normals[i])
+    _, distances, _ = w.raycast_batch(origins, directions, max_distances)
+    assert list(distances) == [3.5, 2.5, numpy.inf, numpy.inf, numpy.inf]
+
+
+def test_get_solid_extents(monkeypatch):
+    w = _create_pillar_world(monkeypatch)
+    solid = [
+        (numpy.array(info.origin) - info.size / 2.0, numpy.array(info.origin) + info.size / 2.0)
+        for info in w.iter_leaves()
+        if w.game.get_block_cls(info.value).is_solid()
+    ]
+    boxes = [
+        # on the ground against the side of the pillar
+        ([1.2, 0.0, 2.2], [2.0, 1.8, 2.8], 3),
+        # sunk into the ground across several leaves
+        ([-1.0, -0.5, -1.0], [1.0, 0.5, 1.0], 4),
+        # in the air
+        ([-3.0, 1.0, -3.0], [-2.0, 2.0, -2.0], 0),
+    ]
+    for bbox_min, bbox_max, count in boxes:
+        mins, maxs = w.get_solid_extents(game_core.BoundingBox(bbox_min, bbox_max))
+        expected = [
+            tuple(block_min) + tuple(block_max)
+            for block_min, block_max in solid
+            if (block_min <= bbox_max).all() and (block_max >= bbox_min).all()
+        ]
+        assert len(expected) == count
+        assert sorted(tuple(extents) for extents in numpy.hstack([mins, maxs]).tolist()) == sorted(expected)
+
+
+def test_get_height(monkeypatch):
+    heights = numpy.random.RandomState(0).uniform(-5.0, 5.0, (8, 8))
+    heights[0, 0] = -4.0
+    w = _create_world(monkeypatch, 8, heights=heights)
+    expected = _get_column_heights(w)
+    assert expected[0, 0] == -numpy.inf
+    assert (expected == w._heights).all()
+
+    centers = numpy.arange(8) - 3.5
+    for i, x in enumerate(centers):
+        for j, z in enumerate(centers):
+            height = w.get_height(x, z)
+            assert height == (None if expected[i, j] == -numpy.inf else expected[i, j])
+    assert w.get_height(-3.5, -3.5) is None
+    assert w.get_height(100.0, 100.0) == expected[7, 7]
+
+    x, z = numpy.meshgrid(centers, centers, indexing='ij')
+    numpy.testing.assert_array_equal(w.get_heights(x, z), numpy.where(expected == -numpy.inf, numpy.nan, expected))
+
+
+def test_height_updates(monkeypatch):
+    w = _create_pillar_world(monkeypatch)
+    updates = []
+    update_heights = w._update_heights
+    monkeypatch.setattr(w, '_update_heights', lambda *args: updates.append(args) or update_heights(*args))
+
+    # only the columns under the changed node are updated
+    node = w.get_node_from_point(game_core.Point(2.5, 3.5, 2.5))
+    assert node.get_size() == 2.0
+    node.split()
+    assert updates == [(6, 8, 6, 8)]
+    assert (w._heights == _get_column_heights(w)).all()
+
+    # a block floating above the pillar
+    w.get_node_from_point(game_core.Point(2.5, 3.5, 2.5)).set_value(1)
+    assert updates[1:] == [(6, 7, 6, 7)]
+    assert w.get_height(2.5, 2.5) == 4.0
+    assert (w._heights == _get_column_heights(w)).all()
+
+    # removing the top of the pillar leaves the floating block as the top
+    w.get_node_from_point(game_core.Point(2.5, 1.5, 2.5)).set_value(0)
+    assert w.get_height(2.5, 2.5) == 4.0
+    w.get_node_from_point(game_core.Point(2.5, 3.5, 2.5)).set_value(0)
+    assert w.get_height(2.5, 2.5) == 1.0
+    assert len(updates) == 4
+    assert (w._heights == _get_column_heights(w)).all()
+
+
+def test_is_grounded(monkeypatch):
+    w = _create_pillar_world(monkeypatch)
+    assert w.is_grounded(game_core.BoundingBox([-1.0, 0.0, -1.0], [1.0, 1.8, 1.0]))
+    assert not w.is_grounded(game_core.BoundingBox([-1.0, 0.1, -1.0], [1.0, 1.9, 1.0]))
+
+    # blocks that only touch the sides of the box don't count
+    assert not w.is_grounded(game_core.BoundingBox([1.2, 0.5, 2.2], [2.0, 1.5, 2.8]))
+    assert w.is_grounded(game_core.BoundingBox([1.2, 0.0, 2.2], [2.0, 1.5, 2.8]))
+
+    # on top of the pillar under a floating block
+    _set_block(w, game_core.Point(2.5, 3.5, 2.5), 1)
+    assert w.get_height(2.5, 2.5) == 4.0
+    assert w.is_grounded(game_core.BoundingBox([2.2, 2.0, 2.2], [2.8, 2.8, 2.8]))
+    assert not w.is_grounded(game_core.BoundingBox([2.2, 2.1, 2.2], [2.8, 2.9, 2.8]))
+
+
+def test_init_from_height_map(monkeypatch):
+    heights = numpy.random.RandomState(1).uniform(-5.0, 5.0, (8, 8))
+    heights[:4, :4] = 5.0
+    heights[4:, :4] = -5.0
+    heights[:4, 4:] = 0.5
+    heights[7, 7] = -1.0
+    w = _create_world(monkeypatch, 8, heights=heights)
+
+    # blocks are solid where the height is above their bottom
+    bottoms = numpy.arange(8) - 4.0
+    solid = _get_solid_cells(w)
+    assert (solid == (heights[:, numpy.newaxis, :] > bottoms[:, numpy.newaxis])).all()
+    assert solid[7, :3, 7].all() and not solid[7, 3:, 7].any()
+
+    # uniform regions are single leaves and branches are never uniform
+    for point in [(-2.0, -2.0, -2.0), (-2.0, 2.0, -2.0), (2.0, -2.0, -2.0), (2.0, 2.0, -2.0), (-2.0, -2.0, 2.0)]:
+        node = w.get_node_from_point(game_core.Point(*point))
+        assert node.get_size() == 4.0
+    for info in w.iter_nodes():
+        start = (numpy.array(info.origin) - info.size / 2.0 + w.size / 2.0).astype(int)
+        end = start + int(info.size)
+        cells = solid[start[0]:end[0], start[1]:end[1], start[2]:end[2]]
+        assert info.is_leaf == (cells.all() or not cells.any())